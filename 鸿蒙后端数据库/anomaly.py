@@ -0,0 +1,174 @@
+"""实时数据异常检测
+
+每个 (用户, 数据类型) 只保存固定大小的状态：EWMA 均值 / 方差、样本数、连续越界次数、上次告警时间，
+样本到达时 O(1) 更新并判断，检测本身不访问数据库:
+    low / high  超出 RULES 中的阈值（血氧低于 90%、心率低于 40 或高于 150）
+    spike       预热 warmup 个样本后，偏离 EWMA 均值超过 z_threshold 个标准差（心率突变等）
+连续 breach_count 个样本越界才告警，避免单个噪声点；持续越界时同一种告警每 cooldown_seconds 最多一次。
+检测在写入样本的同一写操作中执行，告警用 save_alerts 与样本在同一事务中写入 alerts 表；
+检测前用 snapshot 保存相关序列的状态，写入回滚时用 restore 恢复，
+重试的样本会重新检测，告警不会因为冷却期丢失。
+
+状态只在进程内：重启后统计告警需要重新预热（阈值告警不需要）；
+多进程部署时同一用户的样本可能落到不同进程，各进程的统计量分别预热。
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# 数据类型 -> 阈值规则；min_std 为统计告警使用的最小标准差，避免数据平稳时方差过小导致误报
+RULES = {
+    'heart_rate': {'label': '心率', 'low': 40, 'high': 150, 'min_std': 3.0},
+    'blood_oxygen': {'label': '血氧', 'low': 90, 'high': None, 'min_std': 1.0},
+}
+
+
+class _SeriesState:
+    __slots__ = ('count', 'mean', 'var', 'breaches', 'last_alert')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.breaches = {'low': 0, 'high': 0, 'spike': 0}
+        self.last_alert = {}
+
+    def copy(self):
+        state = _SeriesState()
+        state.count = self.count
+        state.mean = self.mean
+        state.var = self.var
+        state.breaches = dict(self.breaches)
+        state.last_alert = dict(self.last_alert)
+        return state
+
+
+class AnomalyDetector:
+    def __init__(self, rules=None, alpha=0.1, z_threshold=4.0, warmup=30, breach_count=3,
+                 cooldown_seconds=600, max_series=100000):
+        self.rules = RULES if rules is None else rules
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.breach_count = breach_count
+        self.cooldown_seconds = cooldown_seconds
+        self.max_series = max_series
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _state(self, key):
+        state = self._series.get(key)
+        if state is None:
+            state = self._series[key] = _SeriesState()
+            # 超出上限时丢弃最久没有样本的序列
+            while len(self._series) > self.max_series:
+                self._series.popitem(last=False)
+        else:
+            self._series.move_to_end(key)
+        return state
+
+    def _breach(self, state, kind, breached, now):
+        """更新连续越界次数，达到次数且不在冷却期内时返回 True"""
+        if not breached:
+            state.breaches[kind] = 0
+            return False
+        state.breaches[kind] += 1
+        if state.breaches[kind] < self.breach_count:
+            return False
+        last = state.last_alert.get(kind)
+        if last is not None and now - last < self.cooldown_seconds:
+            return False
+        state.last_alert[kind] = now
+        return True
+
+    def observe(self, user_id, record_date, time_stamp, data_type, value):
+        """处理一个样本，返回触发的告警列表（通常为空）"""
+        rule = self.rules.get(data_type)
+        if rule is None:
+            return []
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return []
+        if math.isnan(value):
+            return []
+
+        found = []
+        now = time.monotonic()
+        with self._lock:
+            state = self._state((user_id, data_type))
+            baseline = state.mean if state.count else None
+
+            low, high = rule.get('low'), rule.get('high')
+            if self._breach(state, 'low', low is not None and value < low, now):
+                found.append(('low', f"{rule['label']}低于{low}: {value:g}"))
+            if self._breach(state, 'high', high is not None and value > high, now):
+                found.append(('high', f"{rule['label']}高于{high}: {value:g}"))
+
+            std = max(math.sqrt(state.var), rule.get('min_std', 0.0))
+            deviates = state.count >= self.warmup and abs(value - state.mean) > self.z_threshold * std
+            if self._breach(state, 'spike', deviates, now) and not found:
+                found.append(('spike', f"{rule['label']}异常波动: {value:g}（近期平均 {state.mean:.1f}）"))
+
+            # EWMA 均值 / 方差，第一个样本直接作为均值；
+            # 偏离的样本在确认为持续变化（连续 breach_count 次）之前不计入，避免个别离群点拉大方差
+            held_back = deviates and state.breaches['spike'] < self.breach_count
+            if state.count == 0:
+                state.mean = value
+            elif not held_back:
+                diff = value - state.mean
+                increment = self.alpha * diff
+                state.mean += increment
+                state.var = (1 - self.alpha) * (state.var + diff * increment)
+            state.count += 1
+
+        return [{
+            'user_id': user_id,
+            'data_type': data_type,
+            'alert_type': alert_type,
+            'value': value,
+            'baseline': None if baseline is None else round(baseline, 1),
+            'record_date': record_date,
+            'time_stamp': time_stamp,
+            'message': message
+        } for alert_type, message in found]
+
+    def observe_many(self, rows):
+        """rows 为 (user_id, record_date, time_stamp, data_type, value)，按顺序处理"""
+        alerts = []
+        for row in rows:
+            alerts.extend(self.observe(*row))
+        return alerts
+
+    def snapshot(self, rows):
+        """rows 涉及的序列状态的副本（不存在的序列为 None）"""
+        saved = {}
+        with self._lock:
+            for row in rows:
+                key = (row[0], row[3])
+                if key not in saved:
+                    state = self._series.get(key)
+                    saved[key] = None if state is None else state.copy()
+        return saved
+
+    def restore(self, saved):
+        """恢复 snapshot 保存的状态"""
+        with self._lock:
+            for key, state in saved.items():
+                if state is None:
+                    self._series.pop(key, None)
+                else:
+                    self._series[key] = state
+
+    def series_count(self):
+        return len(self._series)
+
+
+def save_alerts(cursor, alerts):
+    if not alerts:
+        return
+    cursor.executemany('''
+        INSERT INTO alerts (user_id, data_type, alert_type, value, baseline, record_date, time_stamp, message)
+        VALUES (:user_id, :data_type, :alert_type, :value, :baseline, :record_date, :time_stamp, :message)
+    ''', alerts)
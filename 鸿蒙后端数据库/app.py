@@ -1,150 +1,366 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, has_app_context, Response, stream_with_context
 from flask_cors import CORS
-import sqlite3
-import bcrypt
 from datetime import datetime
 import re
 from datetime import datetime, timedelta
 import os
+import time
+import atexit
 import base64
+import functools
+import json
+import logging
+import math
+import threading
+
+from db_pool import ConnectionPool
+from migrations import migrate
+from db_upsert import HEALTH_FIELDS, upsert_health_data, upsert_steps_record, add_user_points, record_points
+import realtime_store
+import health_score
+import trends
+import json_stream
+import queries
+from ranking import PointsLeaderboard
+from background_reload import BackgroundReloader
+from availability import AvailabilityIndex
+from radar import RadarMatcher, DbRadarStore, RadarBusy
+from live_hub import LiveHub, HubFull, UnixDatagramBroker
+from long_requests import LongRequestSlots
+from anomaly import AnomalyDetector, save_alerts
+from log_utils import setup_logging, get_logger
+from password_hasher import PasswordHasher, HasherBusy
+from db_writer import GroupCommitWriter, WriterBusy
+from response_cache import ResponseCache
 
 app = Flask(__name__)
 CORS(app)
 
+setup_logging()
+log = get_logger('app')
+
 DATABASE_PATH = 'health_app.db'
 
+# 连接池：每个工作线程复用一个长连接
+db_pool = ConnectionPool(
+    DATABASE_PATH,
+    max_idle=int(os.environ.get('DB_POOL_MAX_IDLE', 32)),
+    busy_timeout_ms=int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000)),
+    mmap_size=int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024)),
+    cache_size_kb=int(os.environ.get('DB_CACHE_SIZE_KB', 16 * 1024))
+)
+
+# 单写线程 + 组提交：健康数据、实时数据、积分等高频写接口通过 db_writer 排队写入
+# 实时样本按月分区时，写线程每批事务开始前挂载本批涉及的分区，并定期删除过期分区
+db_writer = GroupCommitWriter(
+    db_pool.connect,
+    max_batch=int(os.environ.get('DB_WRITE_MAX_BATCH', 64)),
+    max_latency_ms=float(os.environ.get('DB_WRITE_MAX_LATENCY_MS', 2)),
+    max_pending=int(os.environ.get('DB_WRITE_MAX_PENDING', 1024)),
+    timeout=int(os.environ.get('DB_WRITE_TIMEOUT_SECONDS', 10)),
+    prepare=realtime_store.prepare_months,
+    max_keys=realtime_store.MAX_WRITE_MONTHS
+)
+atexit.register(db_writer.close)
+
+# 进程内积分排行榜（多进程部署时按间隔在后台线程从数据库重新同步）
+points_leaderboard = PointsLeaderboard(
+    resync_seconds=int(os.environ.get('POINTS_RANKING_RESYNC_SECONDS', 60))
+)
+points_leaderboard_reloader = BackgroundReloader(
+    points_leaderboard, db_pool.acquire, db_pool.release, 'points_leaderboard'
+)
+
+# 用户名 / 手机号占用索引：注册页逐字检查时未占用的结果不访问数据库
+availability_index = AvailabilityIndex(
+    resync_seconds=int(os.environ.get('AVAILABILITY_RESYNC_SECONDS', 60))
+)
+availability_reloader = BackgroundReloader(
+    availability_index, db_pool.acquire, db_pool.release, 'availability_index'
+)
+
+# SSE 推送和雷达等待会一直占用工作线程，按每个进程的线程数（serve.py 设置 SERVE_THREADS）
+# 计算共用的长连接名额，至少保留一半线程给普通请求
+long_request_slots = LongRequestSlots(int(os.environ.get('SERVE_THREADS', 8)))
+
+# 多进程部署时设置 LIVE_BROKER_DIR，通过 Unix 数据报套接字在工作进程之间转发实时推送和雷达配对的唤醒
+LIVE_BROKER_DIR = os.environ.get('LIVE_BROKER_DIR')
+process_broker = UnixDatagramBroker(LIVE_BROKER_DIR) if LIVE_BROKER_DIR else None
+if process_broker is not None:
+    atexit.register(process_broker.close)
+
+# 雷达加好友配对：默认进程内配对，多进程部署时使用 RADAR_STORE=db
+RADAR_TTL_SECONDS = int(os.environ.get('RADAR_TTL_SECONDS', 300))
+RADAR_WAIT_MAX_SECONDS = int(os.environ.get('RADAR_WAIT_MAX_SECONDS', 25))
+RADAR_MAX_WAITERS = min(int(os.environ.get('RADAR_MAX_WAITERS', long_request_slots.size)), long_request_slots.size)
+if os.environ.get('RADAR_STORE', 'memory') == 'db':
+    radar_store = DbRadarStore(db_pool, db_writer, ttl_seconds=RADAR_TTL_SECONDS, max_waiters=RADAR_MAX_WAITERS,
+                               broker=process_broker, slots=long_request_slots)
+else:
+    radar_store = RadarMatcher(ttl_seconds=RADAR_TTL_SECONDS, max_waiters=RADAR_MAX_WAITERS,
+                               slots=long_request_slots)
+
+# 家庭成员健康数据实时推送（SSE）
+LIVE_HEARTBEAT_SECONDS = int(os.environ.get('LIVE_HEARTBEAT_SECONDS', 15))
+LIVE_STREAM_MAX_SECONDS = int(os.environ.get('LIVE_STREAM_MAX_SECONDS', 300))
+# 每个 realtime_batch 事件最多包含的样本数（每条约 100 字节，保证事件小于进程间数据报上限）
+LIVE_BATCH_EVENT_SAMPLES = int(os.environ.get('LIVE_BATCH_EVENT_SAMPLES', 200))
+live_hub = LiveHub(
+    max_subscribers=min(int(os.environ.get('LIVE_MAX_SUBSCRIBERS', long_request_slots.size)),
+                        long_request_slots.size),
+    max_queue=int(os.environ.get('LIVE_MAX_QUEUE', 256)),
+    broker=process_broker,
+    slots=long_request_slots
+)
+
+# 实时数据异常检测（血氧过低、心率异常 / 突变），状态在进程内，每个样本 O(1)
+anomaly_detector = AnomalyDetector(
+    z_threshold=float(os.environ.get('ANOMALY_Z_THRESHOLD', 4.0)),
+    warmup=int(os.environ.get('ANOMALY_WARMUP_SAMPLES', 30)),
+    breach_count=int(os.environ.get('ANOMALY_BREACH_COUNT', 3)),
+    cooldown_seconds=int(os.environ.get('ANOMALY_COOLDOWN_SECONDS', 600))
+)
+ALERTS_MAX_LIMIT = 100
+
+# 密码哈希工作池：bcrypt 计算不占用请求线程，排队已满时快速返回503
+password_hasher = PasswordHasher(
+    rounds=int(os.environ.get('BCRYPT_ROUNDS', 12)),
+    max_workers=int(os.environ.get('PASSWORD_HASH_WORKERS', 2)),
+    max_pending=int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 16))
+)
+
+# 首页概览 / 每周数据的响应缓存（多进程部署时其他进程的写入最多延迟 TTL 秒可见）
+response_cache = ResponseCache(
+    ttl_seconds=int(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', 30)),
+    max_entries=int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 10000))
+)
+
+# 历史查询超过该天数（或请求带 stream=1）时使用流式响应
+JSON_STREAM_MIN_DAYS = int(os.environ.get('JSON_STREAM_MIN_DAYS', 31))
+JSON_STREAM_BATCH_SIZE = int(os.environ.get('JSON_STREAM_BATCH_SIZE', 500))
+
+# 实时原始样本存储方式：rows 每个样本一行，packed 每人每天每类型一行定长数组
+# 设置 REALTIME_PARTITION_DIR 时按月写入独立的分区文件，REALTIME_RETENTION_MONTHS 为保留月数（0 为不删除），
+# 写线程每隔 REALTIME_PRUNE_INTERVAL_SECONDS 删除一次过期分区
+realtime_store.configure(
+    os.environ.get('REALTIME_STORAGE', 'rows'),
+    partition_dir=os.environ.get('REALTIME_PARTITION_DIR'),
+    retention_months=int(os.environ.get('REALTIME_RETENTION_MONTHS', 0)),
+    prune_interval_seconds=int(os.environ.get('REALTIME_PRUNE_INTERVAL_SECONDS', 3600))
+)
+
 def init_database():
-    """初始化数据库"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    # 修改users表创建语句，直接包含avatar_url字段, 用于存储用户头像URL
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            phone TEXT UNIQUE NOT NULL,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            avatar_url TEXT DEFAULT '',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-
-
-    # 家庭成员关系表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS family_members (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            member_id INTEGER NOT NULL,
-            relationship_name TEXT DEFAULT '家庭成员',
-            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            status INTEGER DEFAULT 1,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (member_id) REFERENCES users (id),
-            UNIQUE(user_id, member_id)
-        )
-    ''')
-
-    # 面对面加成员临时表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS friend_radar (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            radar_code TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            expires_at TIMESTAMP NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-
-    # 在现有的users表创建语句后添加
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS health_data (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            record_date TEXT NOT NULL,
-            steps INTEGER DEFAULT 0,
-            steps_goal INTEGER DEFAULT 10000,
-            distance REAL DEFAULT 0,
-            calories_burned REAL DEFAULT 0,
-            current_heart_rate INTEGER DEFAULT 0,
-            resting_heart_rate INTEGER DEFAULT 0,
-            min_heart_rate INTEGER DEFAULT 0,
-            avg_heart_rate INTEGER DEFAULT 0,
-            max_heart_rate INTEGER DEFAULT 0,
-            current_blood_oxygen INTEGER DEFAULT 0,
-            min_blood_oxygen INTEGER DEFAULT 0,
-            avg_blood_oxygen INTEGER DEFAULT 0,
-            max_blood_oxygen INTEGER DEFAULT 0,
-            sleep_score INTEGER DEFAULT 0,
-            sleep_duration INTEGER DEFAULT 0,
-            sleep_start_time TEXT DEFAULT '',
-            sleep_end_time TEXT DEFAULT '',
-            deep_sleep_duration INTEGER DEFAULT 0,
-            light_sleep_duration INTEGER DEFAULT 0,
-            rem_sleep_duration INTEGER DEFAULT 0,
-            awake_duration INTEGER DEFAULT 0,
-            active_calories REAL DEFAULT 0,
-            calories_goal REAL DEFAULT 8000,
-            basic_metabolism_calories REAL DEFAULT 0,
-            current_mood INTEGER DEFAULT -1,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            UNIQUE(user_id, record_date)
-        )
-    ''')
-
-    # 实时数据表（用于存储实时健康数据）
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS realtime_data (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            record_date TEXT NOT NULL,
-            time_stamp TEXT NOT NULL,
-            data_type TEXT NOT NULL,
-            value REAL NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            UNIQUE(user_id, record_date, time_stamp, data_type)
-        )
-    ''')
-
-    # 用户积分表（主要表）
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_points (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            total_points INTEGER DEFAULT 0,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            UNIQUE(user_id)
-        )
-    ''')
-
-    # 积分记录表（用于历史追踪）
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS points_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            points INTEGER NOT NULL,
-            source_type TEXT NOT NULL,
-            source_data TEXT,
-            record_date TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-        
-    conn.commit()
+    """初始化数据库：按 PRAGMA user_version 依次执行未应用的迁移"""
+    conn = db_pool.connect()
+    version = migrate(conn)
+    dropped = realtime_store.prune_partitions(conn)
     conn.close()
-    print(f"[{datetime.now()}] 数据库初始化完成")
+    log.info('数据库初始化完成', version=version)
+    if dropped:
+        log.info('已删除过期的实时数据分区', months=','.join(dropped))
 
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """获取当前应用上下文的数据库连接（同一请求内复用，请求结束自动归还连接池）"""
+    if not has_app_context():
+        return db_pool.connect()
+    if 'db_conn' not in g:
+        g.db_conn = db_pool.acquire()
+    return g.db_conn
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        db_pool.release(conn)
+
+def get_points_leaderboard():
+    """返回积分排行榜：首次使用时加载，超过同步间隔时在后台重新加载，加载完成前继续使用当前数据"""
+    points_leaderboard_reloader.ensure_loaded()
+    return points_leaderboard
+
+def get_availability_index():
+    """返回用户名 / 手机号占用索引：首次使用时加载，超过同步间隔时在后台重新加载"""
+    availability_reloader.ensure_loaded()
+    return availability_index
+
+def sync_points_leaderboard(conn, user_id, total_points):
+    """积分变化并提交后，同步更新进程内排行榜"""
+    user_id = int(user_id)
+    username = None
+    if not points_leaderboard.has_username(user_id):
+        user = conn.execute('SELECT username FROM users WHERE id = ?', (user_id,)).fetchone()
+        if not user:
+            return
+        username = user['username']
+    points_leaderboard.update(user_id, total_points, username)
+
+def cached_user_response(view):
+    """按 (接口, 用户, 日期, 查询参数) 缓存成功的 GET 响应，带 ETag，If-None-Match 一致时返回 304
+
+    命中缓存时不访问数据库；写接口提交后调用 response_cache.bump(user_id) 使缓存失效
+    """
+    @functools.wraps(view)
+    def wrapper(user_id):
+        if not response_cache.enabled:
+            return view(user_id)
+        
+        key = (request.endpoint, user_id, datetime.now().strftime('%Y-%m-%d'), request.query_string)
+        cached = response_cache.get(key, user_id)
+        if cached is not None:
+            etag, body = cached
+            response = Response(body, mimetype='application/json')
+        else:
+            version = response_cache.version(user_id)
+            response = view(user_id)
+            if not isinstance(response, Response) or response.status_code != 200:
+                return response
+            etag = response_cache.put(key, user_id, response.get_data(), version)
+        
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+    return wrapper
+
+
+def publish_live(user_id, event_type, **payload):
+    """写接口提交后推送给订阅了该用户的连接，推送失败不影响写入结果"""
+    try:
+        live_hub.publish(user_id, {'type': event_type, 'user_id': int(user_id), **payload})
+    except Exception as e:
+        log.warning('实时推送失败', user_id=user_id, error=e)
+
+def save_samples_and_alerts(cursor, rows):
+    """写操作：写入实时样本并检测、保存告警，返回告警列表
+
+    检测状态（EWMA、冷却时间）随写入更新，写入回滚时恢复，客户端重试时告警不会丢失
+    """
+    realtime_store.save_samples(cursor, rows)
+    saved = anomaly_detector.snapshot(rows)
+    db_writer.on_rollback(lambda: anomaly_detector.restore(saved))
+    alerts = anomaly_detector.observe_many(rows)
+    save_alerts(cursor, alerts)
+    return alerts
+
+def publish_live_samples(user_id, samples):
+    """批量上传的样本按 LIVE_BATCH_EVENT_SAMPLES 条拆成多个 realtime_batch 事件，
+    每个事件都能放进一个进程间数据报（live_hub.MAX_DATAGRAM_SIZE）
+    """
+    for start in range(0, len(samples), LIVE_BATCH_EVENT_SAMPLES):
+        publish_live(user_id, 'realtime_batch', samples=samples[start:start + LIVE_BATCH_EVENT_SAMPLES])
+
+def publish_alerts(alerts):
+    for alert in alerts:
+        publish_live(alert['user_id'], 'alert', **{k: v for k, v in alert.items() if k != 'user_id'})
+
+# 读取时发现过期的汇总（健康指数、趋势）交给写线程刷新，读取接口不等待、不写数据库
+_pending_refreshes = set()
+_pending_refreshes_lock = threading.Lock()
+
+def enqueue_refresh(key, fn, user_ids=()):
+    """提交后台刷新写操作；同一 key 还在排队时不重复提交，写入队列已满时跳过（下次读取再提交）。
+    fn 返回写入的行数，有写入时 user_ids 的响应缓存失效
+    """
+    with _pending_refreshes_lock:
+        if key in _pending_refreshes:
+            return
+        _pending_refreshes.add(key)
+    
+    def done(future):
+        with _pending_refreshes_lock:
+            _pending_refreshes.discard(key)
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            log.warning('后台刷新失败', key=key[0], error=future.exception())
+            return
+        if not future.result():
+            return
+        for user_id in user_ids:
+            response_cache.bump(user_id)
+    
+    try:
+        future = db_writer.submit(fn)
+    except WriterBusy:
+        with _pending_refreshes_lock:
+            _pending_refreshes.discard(key)
+        return
+    future.add_done_callback(done)
+
+def live_stream_response(user_ids):
+    """SSE 推送：每个事件一条 event/data，空闲时定期发送注释行保活；
+    连接保持 LIVE_STREAM_MAX_SECONDS 后结束，由客户端按 retry 自动重连（释放工作线程）
+
+    订阅在响应关闭时释放（call_on_close）：HEAD 请求或客户端提前断开时生成器不会执行，
+    放在生成器的 finally 中会一直占用订阅和长连接名额
+    """
+    subscription = live_hub.subscribe(user_ids)
+    
+    def generate():
+        yield f'retry: {LIVE_HEARTBEAT_SECONDS * 1000}\n\n'
+        deadline = time.monotonic() + LIVE_STREAM_MAX_SECONDS
+        while time.monotonic() < deadline:
+            event = subscription.get(timeout=min(LIVE_HEARTBEAT_SECONDS, max(0, deadline - time.monotonic())))
+            if event is None:
+                yield ': ping\n\n'
+                continue
+            yield f"event: {event['type']}\ndata: {app.json.dumps(event)}\n\n"
+    
+    try:
+        response = Response(generate(), mimetype='text/event-stream')
+        response.call_on_close(lambda: live_hub.unsubscribe(subscription))
+    except Exception:
+        live_hub.unsubscribe(subscription)
+        raise
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def live_hub_full_response(e):
+    response = jsonify({'success': False, 'message': '实时推送连接数已满，请稍后重试'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def wants_stream(days):
+    return request.args.get('stream') == '1' or days > JSON_STREAM_MIN_DAYS
+
+
+def stream_json_response(query, key='data', **envelope):
+    """流式返回 {key: [...], **envelope, success}
+
+    query(conn) 返回逐条字典的迭代器；连接在生成器内单独从连接池取用，
+    响应写完后归还（视图函数返回后请求上下文中的连接已被释放）
+    """
+    def generate():
+        conn = db_pool.acquire()
+        try:
+            yield from json_stream.encode(query(conn), key=key, envelope=envelope,
+                                          dumps=app.json.dumps, chunk_size=JSON_STREAM_BATCH_SIZE)
+        finally:
+            db_pool.release(conn)
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def writer_busy_response(e):
+    """写入队列已满时的响应"""
+    response = jsonify({
+        'success': False,
+        'message': '服务器繁忙，请稍后重试'
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def hasher_busy_response(e):
+    """密码哈希队列已满时的响应"""
+    response = jsonify({
+        'success': False,
+        'message': '服务器繁忙，请稍后重试'
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
 
 def validate_phone(phone: str) -> bool:
     """验证手机号格式"""
@@ -159,7 +375,7 @@ def register():
         username = data.get('username', '').strip()
         password = data.get('password', '').strip()
         
-        print(f"[{datetime.now()}] 注册请求: 手机号={phone}, 用户名={username}")
+        log.info('注册请求', phone=phone, username=username)
         
         # 参数验证
         if not phone or not username or not password:
@@ -186,9 +402,6 @@ def register():
                 'message': '密码长度不能少于6位'
             }), 400
         
-        # 密码加密
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-        
         conn = get_db_connection()
         cursor = conn.cursor()
         
@@ -215,18 +428,23 @@ def register():
                 'success': False,
                 'message': '该用户名已被使用'
             }), 400
+        conn.close()
+        
+        # 密码加密（放在重复性检查之后，避免为无效注册计算哈希）
+        password_hash = password_hasher.hash(password)
         
         # 插入新用户
-        cursor.execute(
-            'INSERT INTO users (phone, username, password_hash) VALUES (?, ?, ?)',
-            (phone, username, password_hash)
-        )
+        def write(cursor):
+            cursor.execute(
+                'INSERT INTO users (phone, username, password_hash) VALUES (?, ?, ?)',
+                (phone, username, password_hash)
+            )
+            return cursor.lastrowid
         
-        user_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        user_id = db_writer.run(write)
+        availability_index.add(username, phone)
         
-        print(f"[{datetime.now()}] 注册成功: ID={user_id}, 用户名={username}")
+        log.info('注册成功', user_id=user_id, username=username)
         
         return jsonify({
             'success': True,
@@ -236,8 +454,12 @@ def register():
             'phone': phone
         })
         
+    except HasherBusy as e:
+        return hasher_busy_response(e)
+    except WriterBusy as e:
+        return writer_busy_response(e)
     except Exception as e:
-        print(f"[{datetime.now()}] 注册异常: {e}")
+        log.error('注册异常', error=e)
         return jsonify({
             'success': False,
             'message': f'注册失败: {str(e)}'
@@ -252,32 +474,18 @@ def add_points():
         source_type = data.get('source_type', 'manual')
         source_data = data.get('source_data', '')
         
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M')
-        print(f"[{current_time}] 添加积分: 用户{user_id}, 积分{points}")
+        log.info('添加积分', user_id=user_id, points=points)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        def write(cursor):
+            # 更新总积分
+            total_points = add_user_points(cursor, user_id, points)
+            
+            # 记录积分历史
+            record_points(cursor, user_id, points, source_type, source_data, datetime.now().strftime('%Y-%m-%d'))
+            return total_points
         
-        # 更新总积分
-        cursor.execute('''
-            INSERT OR REPLACE INTO user_points (user_id, total_points, updated_at)
-            VALUES (?, COALESCE((SELECT total_points FROM user_points WHERE user_id = ?), 0) + ?, CURRENT_TIMESTAMP)
-        ''', (user_id, user_id, points))
-        
-        # 记录积分历史
-        cursor.execute('''
-            INSERT INTO points_history (user_id, points, source_type, source_data, record_date)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, points, source_type, source_data, datetime.now().strftime('%Y-%m-%d')))
-        
-        # 获取最新总积分
-        total_points_row = cursor.execute('''
-            SELECT total_points FROM user_points WHERE user_id = ?
-        ''', (user_id,)).fetchone()
-        total_points = total_points_row['total_points'] if total_points_row else 0
-        
-        conn.commit()
-        conn.close()
+        total_points = db_writer.run(write)
+        sync_points_leaderboard(get_db_connection(), user_id, total_points)
         
         return jsonify({
             'success': True,
@@ -285,38 +493,147 @@ def add_points():
             'total_points': total_points
         })
         
+    except WriterBusy as e:
+        return writer_busy_response(e)
     except Exception as e:
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M')
-        print(f"[{current_time}] 添加积分异常: {e}")
+        log.error('添加积分异常', error=e)
         return jsonify({'success': False, 'message': f'添加失败: {str(e)}'}), 500
 
+POINTS_RANKING_WINDOWS = ('day', 'week', 'month')
+
+def points_window_bounds(window):
+    """积分排行的时间窗口：day 今天，week 本周一至今天，month 本月1日至今天（最多31天）"""
+    today = datetime.now().date()
+    if window == 'day':
+        start = today
+    elif window == 'week':
+        start = today - timedelta(days=today.weekday())
+    else:
+        start = today.replace(day=1)
+    return start.isoformat(), today.isoformat()
+
 @app.route('/api/points-ranking', methods=['GET'])
 def get_points_ranking():
+    """积分排行榜
+
+    参数: limit 返回前N名（默认100），window=day|week|month 按时间窗口内获得的积分排行，不传时为总积分排行
+    """
     try:
         limit = int(request.args.get('limit', 100))
+        window = request.args.get('window')
+        
+        if not window:
+            result = get_points_leaderboard().top(limit)
+            return jsonify({'success': True, 'rankings': result})
+        
+        if window not in POINTS_RANKING_WINDOWS:
+            return jsonify({'success': False, 'message': 'window只能为day、week或month'}), 400
+        
+        start_date, end_date = points_window_bounds(window)
         
         conn = get_db_connection()
+        rows = conn.execute(queries.POINTS_RANKING_WINDOW, (start_date, end_date, limit)).fetchall()
+        conn.close()
+        
+        result = [{
+            'rank': i + 1,
+            'user_id': row['user_id'],
+            'username': row['username'],
+            'points': row['points']
+        } for i, row in enumerate(rows)]
+        
+        return jsonify({
+            'success': True,
+            'window': window,
+            'start_date': start_date,
+            'end_date': end_date,
+            'rankings': result
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'获取失败: {str(e)}'}), 500
+
+@app.route('/api/points-ranking/family/<int:user_id>', methods=['GET'])
+def get_family_points_ranking(user_id):
+    """本人和家庭成员在时间窗口内获得的积分排行（家庭挑战），参数: window=day|week|month，默认 week"""
+    try:
+        window = request.args.get('window', 'week')
+        if window not in POINTS_RANKING_WINDOWS:
+            return jsonify({'success': False, 'message': 'window只能为day、week或month'}), 400
         
-        rankings = conn.execute('''
-            SELECT up.user_id, up.total_points, u.username 
-            FROM user_points up
-            JOIN users u ON up.user_id = u.id
-            ORDER BY up.total_points DESC
-            LIMIT ?
-        ''', (limit,)).fetchall()
+        start_date, end_date = points_window_bounds(window)
         
+        conn = get_db_connection()
+        user = conn.execute('SELECT id, username FROM users WHERE id = ?', (user_id,)).fetchone()
+        if not user:
+            conn.close()
+            return jsonify({'success': False, 'message': '用户不存在'})
+        
+        members = conn.execute('''
+            SELECT u.id, u.username
+            FROM family_members fm
+            JOIN users u ON fm.member_id = u.id
+            WHERE fm.user_id = ? AND fm.status = 1
+        ''', (user_id,)).fetchall()
+        
+        people = [user] + list(members)
+        user_ids = [person['id'] for person in people]
+        points = dict(conn.execute(
+            queries.POINTS_RANKING_FAMILY.format(placeholders=queries.in_list(len(user_ids))),
+            (*user_ids, start_date, end_date)
+        ).fetchall())
         conn.close()
         
-        result = []
-        for i, row in enumerate(rankings):
-            result.append({
-                'rank': i + 1,
-                'user_id': row['user_id'],
-                'username': row['username'],
-                'total_points': row['total_points']
-            })
+        result = sorted(({
+            'user_id': person['id'],
+            'username': person['username'],
+            'points': points.get(person['id'], 0),
+            'is_self': person['id'] == user_id
+        } for person in people), key=lambda e: (-e['points'], e['username']))
+        for i, entry in enumerate(result):
+            entry['rank'] = i + 1
+        
+        return jsonify({
+            'success': True,
+            'window': window,
+            'start_date': start_date,
+            'end_date': end_date,
+            'rankings': result
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'获取失败: {str(e)}'}), 500
+
+@app.route('/api/points-ranking/user/<int:user_id>', methods=['GET'])
+def get_user_points_rank(user_id):
+    """查询某用户的积分名次，不需要下载整个排行榜"""
+    try:
+        rank, total_points, total_users = get_points_leaderboard().rank_of(user_id)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'user_id': user_id,
+                'rank': rank,
+                'total_points': total_points or 0,
+                'total_users': total_users
+            }
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'获取失败: {str(e)}'}), 500
+
+@app.route('/api/points-ranking/around/<int:user_id>', methods=['GET'])
+def get_points_ranking_around(user_id):
+    """查询某用户前后各 window 名的积分排行"""
+    try:
+        window = min(int(request.args.get('window', 5)), 50)
+        
+        rankings = get_points_leaderboard().around(user_id, window)
+        if rankings is None:
+            return jsonify({'success': False, 'message': '该用户暂无积分排名'}), 404
         
-        return jsonify({'success': True, 'rankings': result})
+        return jsonify({'success': True, 'rankings': rankings})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'获取失败: {str(e)}'}), 500
@@ -340,8 +657,6 @@ def reset_password():
                 'message': '密码长度不能少于6位'
             }), 400
         
-        new_password_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt())
-        
         conn = get_db_connection()
         cursor = conn.cursor()
         
@@ -349,26 +664,29 @@ def reset_password():
             'SELECT id FROM users WHERE username = ?', (username,)
         ).fetchone()
         
+        conn.close()
         if not user:
-            conn.close()
             return jsonify({
                 'success': False,
                 'message': '用户名不存在'
             }), 404
         
-        cursor.execute(
+        new_password_hash = password_hasher.hash(new_password)
+        
+        db_writer.run(lambda cursor: cursor.execute(
             'UPDATE users SET password_hash = ? WHERE username = ?',
             (new_password_hash, username)
-        )
-        
-        conn.commit()
-        conn.close()
+        ))
         
         return jsonify({
             'success': True,
             'message': '密码重置成功'
         })
         
+    except HasherBusy as e:
+        return hasher_busy_response(e)
+    except WriterBusy as e:
+        return writer_busy_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -382,7 +700,7 @@ def login():
         login_field = data.get('login_field', '').strip()
         password = data.get('password', '').strip()
         
-        print(f"[{datetime.now()}] 登录请求: {login_field}")
+        log.info('登录请求', login_field=login_field)
         
         if not login_field or not password:
             return jsonify({
@@ -394,18 +712,25 @@ def login():
         
         # 判断是手机号还是用户名
         if validate_phone(login_field):
-            user = conn.execute(
-                'SELECT * FROM users WHERE phone = ?', (login_field,)
-            ).fetchone()
+            user = conn.execute(queries.LOGIN_BY_PHONE, (login_field,)).fetchone()
         else:
-            user = conn.execute(
-                'SELECT * FROM users WHERE username = ?', (login_field,)
-            ).fetchone()
-        
-        conn.close()
+            user = conn.execute(queries.LOGIN_BY_USERNAME, (login_field,)).fetchone()
         
-        if user and bcrypt.checkpw(password.encode('utf-8'), user['password_hash']):
-            print(f"[{datetime.now()}] 登录成功: ID={user['id']}, 用户名={user['username']}")
+        if user and password_hasher.verify(password, user['password_hash']):
+            log.info('登录成功', user_id=user['id'], username=user['username'])
+            
+            # cost 配置变化后，登录时用当前配置重新计算哈希（队列繁忙时跳过，下次登录再处理）
+            if password_hasher.needs_rehash(user['password_hash']):
+                try:
+                    new_hash = password_hasher.hash(password)
+                    db_writer.run(lambda cursor: cursor.execute(
+                        'UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, user['id'])
+                    ))
+                    log.info('密码哈希已按新cost更新', user_id=user['id'], rounds=password_hasher.rounds)
+                except (HasherBusy, WriterBusy):
+                    pass
+            
+            conn.close()
             
             return jsonify({
                 'success': True,
@@ -416,14 +741,17 @@ def login():
                 'avatar_path': ''  # 暂时为空，后续可添加头像功能
             })
         else:
-            print(f"[{datetime.now()}] 登录失败: {login_field}")
+            conn.close()
+            log.info('登录失败', login_field=login_field)
             return jsonify({
                 'success': False,
                 'message': '手机号/用户名或密码错误'
             }), 401
             
+    except HasherBusy as e:
+        return hasher_busy_response(e)
     except Exception as e:
-        print(f"[{datetime.now()}] 登录异常: {e}")
+        log.error('登录异常', error=e)
         return jsonify({
             'success': False,
             'message': f'登录失败: {str(e)}'
@@ -447,20 +775,13 @@ def get_user_id_by_name():
     except Exception as e:
         return jsonify({'success': False, 'message': f'查询失败: {str(e)}'}), 500
 
-# 获取所有用户（用于雷达加好友）
+# 获取所有用户（用于雷达加好友，一次返回全部用户；用户较多时使用 /api/user-directory 分页接口）
 @app.route('/api/all-users/<int:current_user_id>', methods=['GET'])
 def get_all_users(current_user_id):
     try:
         conn = get_db_connection()
         
-        users = conn.execute('''
-            SELECT u.id, u.username, u.phone, u.avatar_url,
-                   CASE WHEN fm.id IS NOT NULL THEN 1 ELSE 0 END as is_friend
-            FROM users u
-            LEFT JOIN family_members fm ON u.id = fm.member_id AND fm.user_id = ? AND fm.status = 1
-            WHERE u.id != ?
-            ORDER BY u.username
-        ''', (current_user_id, current_user_id)).fetchall()
+        users = conn.execute(queries.ALL_USERS, (current_user_id, current_user_id)).fetchall()
         
         conn.close()
         
@@ -479,6 +800,98 @@ def get_all_users(current_user_id):
     except Exception as e:
         return jsonify({'success': False, 'message': f'获取失败: {str(e)}'}), 500
 
+DIRECTORY_DEFAULT_PAGE_SIZE = 20
+DIRECTORY_MAX_PAGE_SIZE = 100
+DIRECTORY_SEARCH_FIELDS = ('username', 'phone')
+
+def encode_directory_cursor(field, value, user_id):
+    raw = json.dumps([field, value, user_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_directory_cursor(cursor):
+    """返回 (排序字段, 上一页最后一行的字段值, 用户ID)，格式不正确时抛出 ValueError"""
+    try:
+        field, value, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('cursor无效')
+    if field not in DIRECTORY_SEARCH_FIELDS or not isinstance(value, str) or not isinstance(user_id, int):
+        raise ValueError('cursor无效')
+    return field, value, user_id
+
+# 分页用户目录（用于雷达加好友），按 (username, id) 键集分页
+@app.route('/api/user-directory/<int:current_user_id>', methods=['GET'])
+def get_user_directory(current_user_id):
+    """分页获取用户列表
+
+    参数: limit 每页数量（默认20，最多100），cursor 上一页返回的 next_cursor，
+    q 前缀搜索，field=username|phone 搜索和排序的字段（默认username）
+    返回的 next_cursor 为空时表示没有更多数据
+    """
+    try:
+        field = request.args.get('field', 'username')
+        if field not in DIRECTORY_SEARCH_FIELDS:
+            return jsonify({'success': False, 'message': 'field只能为username或phone'}), 400
+        
+        limit = int(request.args.get('limit', DIRECTORY_DEFAULT_PAGE_SIZE))
+        limit = max(1, min(limit, DIRECTORY_MAX_PAGE_SIZE))
+        prefix = request.args.get('q', '').strip()
+        
+        params = [current_user_id]
+        
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                cursor_field, last_value, last_id = decode_directory_cursor(cursor)
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            if cursor_field != field:
+                return jsonify({'success': False, 'message': 'cursor与field不匹配'}), 400
+            params += [last_value, last_id]
+        
+        if prefix:
+            params += [prefix, prefix + '\U0010ffff']
+        
+        conn = get_db_connection()
+        
+        users = conn.execute(
+            queries.user_directory_sql(field, after_cursor=bool(cursor), prefix=bool(prefix)),
+            params + [limit + 1]
+        ).fetchall()
+        
+        has_more = len(users) > limit
+        users = users[:limit]
+        
+        # 只对本页用户查询好友关系
+        friend_ids = set()
+        if users:
+            ids = [user['id'] for user in users]
+            friend_ids = {row['member_id'] for row in conn.execute(
+                queries.USER_DIRECTORY_FRIENDS.format(placeholders=queries.in_list(len(ids))),
+                [current_user_id] + ids
+            ).fetchall()}
+        
+        conn.close()
+        
+        result = []
+        for user in users:
+            result.append({
+                'id': user['id'],
+                'username': user['username'],
+                'phone': user['phone'],
+                'avatar_url': user['avatar_url'] or '',
+                'is_friend': user['id'] in friend_ids
+            })
+        
+        next_cursor = None
+        if has_more:
+            last = users[-1]
+            next_cursor = encode_directory_cursor(field, last[field], last['id'])
+        
+        return jsonify({'success': True, 'users': result, 'next_cursor': next_cursor})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'获取失败: {str(e)}'}), 500
+
 @app.route('/api/check-username', methods=['GET'])
 def check_username():
     try:
@@ -488,6 +901,10 @@ def check_username():
         if not username:
             return jsonify({'exists': False})
         
+        # 不在占用索引中的用户名一定未被使用，只有可能已占用时才查询数据库确认
+        if not get_availability_index().may_have_username(username):
+            return jsonify({'exists': False})
+        
         conn = get_db_connection()
         
         if exclude_user_id:
@@ -507,7 +924,7 @@ def check_username():
         })
         
     except Exception as e:
-        print(f"[{datetime.now()}] 检查用户名异常: {e}")
+        log.error('检查用户名异常', error=e)
         return jsonify({'exists': False})
 
 @app.route('/api/check-phone', methods=['GET'])
@@ -518,6 +935,9 @@ def check_phone():
         if not phone:
             return jsonify({'exists': False})
         
+        if not get_availability_index().may_have_phone(phone):
+            return jsonify({'exists': False})
+        
         conn = get_db_connection()
         existing_user = conn.execute(
             'SELECT id FROM users WHERE phone = ?', (phone,)
@@ -529,7 +949,7 @@ def check_phone():
         })
         
     except Exception as e:
-        print(f"[{datetime.now()}] 检查手机号异常: {e}")
+        log.error('检查手机号异常', error=e)
         return jsonify({'exists': False})
 
 @app.route('/api/health-check', methods=['GET'])
@@ -548,66 +968,88 @@ def save_health_data():
         user_id = data.get('user_id')
         record_date = data.get('record_date', datetime.now().strftime('%Y-%m-%d'))
         
-        print(f"[{datetime.now()}] 保存健康数据: 用户{user_id}, 日期{record_date}")
+        log.info('保存健康数据', user_id=user_id, record_date=record_date)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        def write(cursor):
+            # 单条 upsert：新记录插入，已有记录只更新本次提供的字段
+            updated_fields = upsert_health_data(cursor, user_id, record_date, data)
+            if updated_fields:
+                health_score.mark_dirty(cursor, user_id)
+                trends.refresh_for_write(cursor, user_id, record_date)
+            return updated_fields
         
-        # 检查今日是否已有记录
-        existing = cursor.execute('''
-            SELECT id FROM health_data 
-            WHERE user_id = ? AND record_date = ?
-        ''', (user_id, record_date)).fetchone()
-        
-        health_fields = [
-            'steps', 'steps_goal', 'distance', 'calories_burned',
-            'current_heart_rate', 'resting_heart_rate', 'min_heart_rate', 'avg_heart_rate', 'max_heart_rate',
-            'current_blood_oxygen', 'min_blood_oxygen', 'avg_blood_oxygen', 'max_blood_oxygen',
-            'sleep_score', 'sleep_duration', 'sleep_start_time', 'sleep_end_time',
-            'deep_sleep_duration', 'light_sleep_duration', 'rem_sleep_duration', 'awake_duration',
-            'active_calories', 'calories_goal', 'basic_metabolism_calories',
-            'current_mood'
-        ]
-        
-        if existing:
-            # 已有记录，执行增量更新
-            update_fields = []
-            values = []
-            
-            for field in health_fields:
-                if field in data and data[field] is not None:
-                    update_fields.append(f"{field} = ?")
-                    values.append(data[field])
-            
-            if update_fields:
-                update_fields.append("updated_at = CURRENT_TIMESTAMP")
-                sql = f"UPDATE health_data SET {', '.join(update_fields)} WHERE user_id = ? AND record_date = ?"
-                values.extend([user_id, record_date])
-                cursor.execute(sql, values)
-                print(f"[{datetime.now()}] 增量更新: 更新{len(update_fields)-1}个字段")
-        else:
-            # 新记录，执行插入
-            provided_fields = [f for f in health_fields if f in data and data[f] is not None]
-            if provided_fields:
-                placeholders = ', '.join(['?' for _ in provided_fields])
-                sql = f"INSERT INTO health_data (user_id, record_date, {', '.join(provided_fields)}, updated_at) VALUES (?, ?, {placeholders}, CURRENT_TIMESTAMP)"
-                values = [user_id, record_date] + [data[f] for f in provided_fields]
-                cursor.execute(sql, values)
-                print(f"[{datetime.now()}] 新增记录: 包含{len(provided_fields)}个字段")
-        
-        conn.commit()
-        conn.close()
+        updated_fields = db_writer.run(write)
+        if updated_fields:
+            log.debug('写入健康数据', fields=len(updated_fields))
+        response_cache.bump(user_id)
+        if updated_fields:
+            publish_live(user_id, 'health', record_date=record_date,
+                         values={field: data[field] for field in updated_fields})
         
         return jsonify({'success': True, 'message': '健康数据保存成功'})
         
+    except WriterBusy as e:
+        return writer_busy_response(e)
     except Exception as e:
-        print(f"[{datetime.now()}] 保存健康数据异常: {e}")
+        log.error('保存健康数据异常', error=e)
         return jsonify({'success': False, 'message': f'保存失败: {str(e)}'}), 500
 
+REALTIME_DATA_TYPES = ['heart_rate', 'blood_oxygen', 'mood']
+REALTIME_BATCH_MAX_SAMPLES = 5000
+
+def normalize_time_stamp(time_stamp, record_date):
+    """时间格式验证和标准化 - 支持 YYYY-MM-DD HH:MM 和 HH:MM
+
+    只有时间时补充 record_date；完整日期时间的日期必须与 record_date 一致
+    （存储按 record_date 分行，只保留当天第几分钟）。
+    返回 (标准化后的时间戳, 错误信息)，校验通过时错误信息为 None
+    """
+    try:
+        datetime.strptime(record_date, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None, '日期格式错误，应为YYYY-MM-DD'
+
+    if not isinstance(time_stamp, str) or ':' not in time_stamp:
+        return None, '时间格式错误，应为YYYY-MM-DD HH:MM或HH:MM'
+
+    # 处理完整日期时间格式
+    if ' ' in time_stamp and '-' in time_stamp:
+        try:
+            datetime.strptime(time_stamp, '%Y-%m-%d %H:%M')
+        except ValueError:
+            return None, '日期时间格式无效，应为YYYY-MM-DD HH:MM'
+        if time_stamp[:10] != record_date:
+            return None, '时间戳日期与record_date不一致'
+        return time_stamp, None
+
+    # 处理只有时间的格式，补充记录日期
+    time_parts = time_stamp.split(':')
+    if len(time_parts) != 2:
+        return None, '时间格式错误'
+
+    try:
+        hour = int(time_parts[0])
+        minute = int(time_parts[1])
+    except ValueError:
+        return None, '时间格式无效'
+    if hour < 0 or hour > 23 or minute < 0 or minute > 59:
+        return None, '时间值超出范围'
+    return f"{record_date} {hour:02d}:{minute:02d}", None
+
+def parse_sample_value(value):
+    """实时样本数值转换为 float，返回 (数值, 错误信息)"""
+    if isinstance(value, bool):
+        return None, '数值格式错误'
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None, '数值格式错误'
+    if not math.isfinite(value):
+        return None, '数值格式错误'
+    return value, None
+
 @app.route('/api/realtime-data', methods=['POST'])
 def save_realtime_data():
-    current_time = datetime.now().strftime('%Y-%m-%d %H:%M')
-    
     try:
         data = request.get_json()
         user_id = data.get('user_id')
@@ -616,94 +1058,194 @@ def save_realtime_data():
         data_type = data.get('data_type')
         value = data.get('value')
         
-        print(f"[{current_time}] 保存实时数据: 用户{user_id}, 日期{record_date}, 时间{time_stamp}, 类型{data_type}, 数值{value}")        
+        log.debug('保存实时数据', user_id=user_id, record_date=record_date, time_stamp=time_stamp, data_type=data_type, value=value)
         
         # 参数验证
         if not user_id or not time_stamp or not data_type or value is None:
             return jsonify({'success': False, 'message': '必要参数缺失'}), 400
+        
+        value, error_message = parse_sample_value(value)
+        if error_message:
+            return jsonify({'success': False, 'message': error_message}), 400
                 
-        # 时间格式验证和标准化 - 支持 YYYY-MM-DD HH:MM 和 HH:MM
-        if ':' not in time_stamp:
-            return jsonify({'success': False, 'message': '时间格式错误，应为YYYY-MM-DD HH:MM或HH:MM'}), 400
-
-        # 处理完整日期时间格式
-        if ' ' in time_stamp and '-' in time_stamp:
-            try:
-                datetime.strptime(time_stamp, '%Y-%m-%d %H:%M')
-                formatted_time = time_stamp
-                print(f"[{current_time}] 接收完整时间戳: {formatted_time}")
-            except ValueError:
-                return jsonify({'success': False, 'message': '日期时间格式无效，应为YYYY-MM-DD HH:MM'}), 400
-        else:
-            # 处理只有时间的格式，补充当前日期
-            time_parts = time_stamp.split(':')
-            if len(time_parts) != 2:
-                return jsonify({'success': False, 'message': '时间格式错误'}), 400
-            
-            try:
-                hour = int(time_parts[0])
-                minute = int(time_parts[1])
-                if hour < 0 or hour > 23 or minute < 0 or minute > 59:
-                    return jsonify({'success': False, 'message': '时间值超出范围'}), 400
-                current_date = datetime.now().strftime('%Y-%m-%d')
-                formatted_time = f"{current_date} {hour:02d}:{minute:02d}"
-                print(f"[{current_time}] 补充日期后的时间戳: {formatted_time}")
-            except ValueError:
-                return jsonify({'success': False, 'message': '时间格式无效'}), 400
+        formatted_time, error_message = normalize_time_stamp(time_stamp, record_date)
+        if error_message:
+            return jsonify({'success': False, 'message': error_message}), 400
+        
+        error_message = realtime_store.check_record_date(record_date)
+        if error_message:
+            return jsonify({'success': False, 'message': error_message}), 400
         
         # 数据类型验证
-        valid_data_types = ['heart_rate', 'blood_oxygen', 'mood']
-        if data_type not in valid_data_types:
-            print(f"[{current_time}] 警告: 未知数据类型 {data_type}")
+        if data_type not in REALTIME_DATA_TYPES:
+            log.warning('未知数据类型', data_type=data_type)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        rows = [(user_id, record_date, formatted_time, data_type, value)]
+        alerts = db_writer.run(
+            lambda cursor: save_samples_and_alerts(cursor, rows),
+            keys=realtime_store.write_chunks(rows)[0][0]
+        )
+        publish_live(user_id, 'realtime', record_date=record_date, time_stamp=formatted_time,
+                     data_type=data_type, value=value)
+        publish_alerts(alerts)
         
-        # 检查是否已存在相同记录
-        existing = cursor.execute('''
-            SELECT id FROM realtime_data 
-            WHERE user_id = ? AND record_date = ? AND time_stamp = ? AND data_type = ?
-        ''', (user_id, record_date, formatted_time, data_type)).fetchone()
+        log.debug('实时数据保存成功', user_id=user_id, time_stamp=formatted_time)
+        return jsonify({'success': True, 'message': '实时数据保存成功'})
         
-        if existing:
-            # 更新现有记录
-            cursor.execute('''
-                UPDATE realtime_data 
-                SET value = ?, created_at = CURRENT_TIMESTAMP 
-                WHERE user_id = ? AND record_date = ? AND time_stamp = ? AND data_type = ?
-            ''', (value, user_id, record_date, formatted_time, data_type))
-            print(f"[{current_time}] 更新实时数据记录")
-        else:
-            # 插入新记录
-            cursor.execute('''
-                INSERT INTO realtime_data (user_id, record_date, time_stamp, data_type, value)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, record_date, formatted_time, data_type, value))
-            print(f"[{current_time}] 新增实时数据记录")
+    except WriterBusy as e:
+        return writer_busy_response(e)
+    except Exception as e:
+        log.error('保存实时数据异常', error=e)
+        return jsonify({'success': False, 'message': f'保存失败: {str(e)}'}), 500
+
+@app.route('/api/realtime-data/batch', methods=['POST'])
+def save_realtime_data_batch():
+    """批量保存实时数据：一次请求上传多条样本，单事务 executemany 写入
+
+    请求体: {"user_id": 1, "samples": [{"record_date": "...", "time_stamp": "HH:MM", "data_type": "heart_rate", "value": 72}, ...]}
+    每条样本可单独指定 user_id / record_date，未指定时使用外层的值
+    """
+    try:
+        data = request.get_json()
+        default_user_id = data.get('user_id')
+        default_record_date = data.get('record_date', datetime.now().strftime('%Y-%m-%d'))
+        samples = data.get('samples')
         
-        conn.commit()
-        conn.close()
+        if not isinstance(samples, list) or not samples:
+            return jsonify({'success': False, 'message': 'samples必须为非空数组'}), 400
         
-        print(f"[{current_time}] 实时数据保存成功")
-        return jsonify({'success': True, 'message': '实时数据保存成功'})
+        if len(samples) > REALTIME_BATCH_MAX_SAMPLES:
+            return jsonify({
+                'success': False,
+                'message': f'单次最多上传{REALTIME_BATCH_MAX_SAMPLES}条样本'
+            }), 400
+        
+        results = []
+        rows = []
+        for index, sample in enumerate(samples):
+            if not isinstance(sample, dict):
+                results.append({'index': index, 'accepted': False, 'message': '样本格式错误'})
+                continue
+            
+            user_id = sample.get('user_id', default_user_id)
+            record_date = sample.get('record_date', default_record_date)
+            time_stamp = sample.get('time_stamp')
+            data_type = sample.get('data_type')
+            value = sample.get('value')
+            
+            if not user_id or not time_stamp or not data_type or value is None:
+                results.append({'index': index, 'accepted': False, 'message': '必要参数缺失'})
+                continue
+            
+            value, error_message = parse_sample_value(value)
+            if error_message:
+                results.append({'index': index, 'accepted': False, 'message': error_message})
+                continue
+            
+            formatted_time, error_message = normalize_time_stamp(time_stamp, record_date)
+            if error_message:
+                results.append({'index': index, 'accepted': False, 'message': error_message})
+                continue
+            
+            error_message = realtime_store.check_record_date(record_date)
+            if error_message:
+                results.append({'index': index, 'accepted': False, 'message': error_message})
+                continue
+            
+            if data_type not in REALTIME_DATA_TYPES:
+                log.warning('未知数据类型', data_type=data_type)
+            
+            rows.append((user_id, record_date, formatted_time, data_type, value))
+            results.append({'index': index, 'accepted': True, 'time_stamp': formatted_time})
+        
+        if rows:
+            # 按月分区时每次写入最多挂载 MAX_WRITE_MONTHS 个分区，跨月较多的批次分组写入
+            alerts = []
+            for months, chunk_rows in realtime_store.write_chunks(rows):
+                alerts.extend(db_writer.run(
+                    lambda cursor, chunk_rows=chunk_rows: save_samples_and_alerts(cursor, chunk_rows),
+                    keys=months
+                ))
+            
+            # 批量上传按用户合并为一个事件
+            samples_by_user = {}
+            for row_user_id, row_date, row_time, row_type, row_value in rows:
+                samples_by_user.setdefault(row_user_id, []).append(
+                    {'record_date': row_date, 'time_stamp': row_time, 'data_type': row_type, 'value': row_value}
+                )
+            for row_user_id, user_samples in samples_by_user.items():
+                publish_live_samples(row_user_id, user_samples)
+            publish_alerts(alerts)
+        
+        accepted = len(rows)
+        log.info('批量保存实时数据', received=len(samples), accepted=accepted)
         
+        return jsonify({
+            'success': True,
+            'message': '批量实时数据保存完成',
+            'accepted': accepted,
+            'rejected': len(samples) - accepted,
+            'results': results
+        })
+        
+    except WriterBusy as e:
+        return writer_busy_response(e)
     except Exception as e:
-        print(f"[{current_time}] 保存实时数据异常: {e}")
+        log.error('批量保存实时数据异常', error=e)
         return jsonify({'success': False, 'message': f'保存失败: {str(e)}'}), 500
 
+@app.route('/api/alerts/<int:user_id>', methods=['GET'])
+def get_alerts(user_id):
+    """实时数据异常告警，按时间倒序
+
+    参数: limit 每页条数（默认20，最多100），before_id 上一页返回的 next_before_id
+    """
+    try:
+        limit = int(request.args.get('limit', 20))
+        if limit < 1 or limit > ALERTS_MAX_LIMIT:
+            return jsonify({'success': False, 'message': f'limit需在1到{ALERTS_MAX_LIMIT}之间'}), 400
+        before_id = request.args.get('before_id')
+        before_id = int(before_id) if before_id else 2 ** 63 - 1
+        
+        conn = get_db_connection()
+        rows = conn.execute(queries.ALERTS_BY_USER, (user_id, before_id, limit)).fetchall()
+        conn.close()
+        
+        alerts = [{
+            'id': row['id'],
+            'data_type': row['data_type'],
+            'alert_type': row['alert_type'],
+            'value': row['value'],
+            'baseline': row['baseline'],
+            'record_date': row['record_date'],
+            'time_stamp': row['time_stamp'],
+            'message': row['message'],
+            'created_at': row['created_at']
+        } for row in rows]
+        
+        return jsonify({
+            'success': True,
+            'alerts': alerts,
+            'next_before_id': alerts[-1]['id'] if len(alerts) == limit else None
+        })
+        
+    except Exception as e:
+        log.error('获取告警异常', error=e)
+        return jsonify({'success': False, 'message': f'获取失败: {str(e)}'}), 500
+
 @app.route('/api/health-data/<int:user_id>', methods=['GET'])
 def get_health_data(user_id):
     try:
         days = int(request.args.get('days', 7))
         
+        if wants_stream(days):
+            return stream_json_response(lambda conn: json_stream.iter_rows(
+                conn.execute(queries.HEALTH_DATA_HISTORY, (user_id, days)), JSON_STREAM_BATCH_SIZE
+            ))
+        
         conn = get_db_connection()
         
-        health_data = conn.execute('''
-            SELECT * FROM health_data 
-            WHERE user_id = ? 
-            ORDER BY record_date DESC 
-            LIMIT ?
-        ''', (user_id, days)).fetchall()
+        health_data = conn.execute(queries.HEALTH_DATA_HISTORY, (user_id, days)).fetchall()
         
         conn.close()
         
@@ -718,72 +1260,77 @@ def get_health_data(user_id):
 
 @app.route('/api/realtime-data/<int:user_id>', methods=['GET'])
 def get_realtime_data(user_id):
+    """查询实时数据
+
+    参数: date 单日查询的日期，days 最近N天，type 数据类型，
+    resolution=raw|hour|day|auto 数据分辨率（默认auto：多天查询自动使用小时或天汇总）
+    stream=1 流式返回（超过 JSON_STREAM_MIN_DAYS 天时自动使用）
+    """
     try:
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M')
         record_date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
         data_type = request.args.get('type')
         days_param = request.args.get('days')
         days = int(days_param) if days_param is not None else 1
+        resolution = realtime_store.choose_resolution(days, request.args.get('resolution'))
         
-        print(f"[{current_time}] 获取实时数据: 用户{user_id}, 类型{data_type}, 天数{days}")
-        
-        conn = get_db_connection()
+        log.debug('获取实时数据', user_id=user_id, data_type=data_type, days=days, resolution=resolution)
         
         if days > 1:
             end_date = datetime.now().date()
-            start_date = end_date - timedelta(days=days-1)
-            query = 'SELECT * FROM realtime_data WHERE user_id = ? AND record_date BETWEEN ? AND ?'
-            params = [user_id, start_date.isoformat(), end_date.isoformat()]
+            start_date = (end_date - timedelta(days=days-1)).isoformat()
+            end_date = end_date.isoformat()
         else:
-            query = 'SELECT * FROM realtime_data WHERE user_id = ? AND record_date = ?'
-            params = [user_id, record_date]
+            start_date = end_date = record_date
         
-        if data_type:
-            query += ' AND data_type = ?'
-            params.append(data_type)
+        if wants_stream(days):
+            return stream_json_response(
+                lambda conn: realtime_store.iter_samples(conn, user_id, start_date, end_date, data_type,
+                                                         resolution, JSON_STREAM_BATCH_SIZE),
+                resolution=resolution
+            )
         
-        query += ' ORDER BY time_stamp DESC'
-        
-        realtime_data = conn.execute(query, params).fetchall()
+        conn = get_db_connection()
+        result = realtime_store.query_samples(conn, user_id, start_date, end_date, data_type, resolution)
         conn.close()
         
-        result = []
-        for row in realtime_data:
-            result.append(dict(row))
-        
-        return jsonify({'success': True, 'data': result})
+        return jsonify({'success': True, 'resolution': resolution, 'data': result})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'获取失败: {str(e)}'}), 500
 
 @app.route('/api/steps-ranking', methods=['GET'])
 def get_steps_ranking():
+    """今日步数排行榜，读取写入时维护的 daily_steps_leaderboard
+
+    可选参数: limit 返回名次数（默认50），user_id 额外返回该用户的名次
+    """
     try:
         today = datetime.now().strftime('%Y-%m-%d')
-        print(f"[{datetime.now()}] 获取步数排行榜请求，日期: {today}")
+        limit = min(int(request.args.get('limit', 50)), 500)
+        user_id = request.args.get('user_id', type=int)
+        log.debug('获取步数排行榜请求', date=today)
         
         conn = get_db_connection()
         
-        # 添加调试：查看今日所有health_data记录，使用TRIM和字符串比较
-        debug_data = conn.execute('''
-            SELECT user_id, username, record_date, steps 
-            FROM health_data h
-            JOIN users u ON h.user_id = u.id
-            WHERE TRIM(h.record_date, "'") = ?
-        ''', (today,)).fetchall()
-            
-        print(f"[{datetime.now()}] 今日health_data记录:")
-        for row in debug_data:
-            print(f"  用户ID: {row['user_id']}, 用户名: {row['username']}, 日期: {row['record_date']}, 步数: {row['steps']}")
-        
-        # 使用LEFT JOIN确保显示所有用户
-        ranking = conn.execute('''
-            SELECT u.username, COALESCE(h.steps, 0) as steps
-            FROM users u
-            LEFT JOIN health_data h ON u.id = h.user_id AND TRIM(h.record_date, "'") = ?
-            ORDER BY COALESCE(h.steps, 0) DESC, u.username ASC
-            LIMIT 50
-        ''', (today,)).fetchall()
+        # 今日有步数的用户，直接按排行榜索引顺序读取前N名
+        ranking = conn.execute(queries.STEPS_RANKING_TOP, (today, limit)).fetchall()
+        
+        # 不足N名时用今日无步数的用户按用户名补齐（与原来LEFT JOIN所有用户的结果一致）
+        if len(ranking) < limit:
+            ranking += conn.execute(queries.STEPS_RANKING_FILL, (today, limit - len(ranking))).fetchall()
+        
+        my_rank = None
+        if user_id:
+            mine = conn.execute(queries.STEPS_RANKING_MINE, (today, user_id)).fetchone()
+            my_steps = mine['steps'] if mine else 0
+            if my_steps > 0:
+                ahead = conn.execute(
+                    queries.STEPS_RANKING_AHEAD, (today, my_steps, my_steps, mine['username'])
+                ).fetchone()[0]
+            else:
+                # 今日无步数的用户并列排在所有有步数的用户之后
+                ahead = conn.execute(queries.STEPS_RANKING_WITH_STEPS, (today,)).fetchone()[0]
+            my_rank = {'user_id': user_id, 'rank': ahead + 1, 'steps': my_steps}
         
         conn.close()
         
@@ -794,64 +1341,84 @@ def get_steps_ranking():
                 'username': row['username'],
                 'steps': row['steps']
             })
-            print(f"[{datetime.now()}] 排行榜第{i+1}名: {row['username']}, {row['steps']}步")
         
-        print(f"[{datetime.now()}] 排行榜查询完成，共{len(result)}名用户")
+        log.debug('排行榜查询完成', count=len(result))
         
-        return jsonify({'success': True, 'ranking': result})
+        response = {'success': True, 'ranking': result}
+        if my_rank is not None:
+            response['my_rank'] = my_rank
+        return jsonify(response)
         
     except Exception as e:
-        print(f"[{datetime.now()}] 获取排行榜异常: {e}")
+        log.error('获取排行榜异常', error=e)
         return jsonify({'success': False, 'message': f'获取失败: {str(e)}'}), 500
 
+def overview_from_row(row):
+    """健康概览字段，row 为当天的 health_data 记录（无记录时返回默认值）"""
+    if row:
+        return {
+            'steps': row['steps'] or 0,
+            'current_heart_rate': row['current_heart_rate'] or 0,
+            'avg_heart_rate': row['current_heart_rate'] or 0,  # 添加这个字段
+            'sleep_score': row['sleep_score'] or 0,
+            'active_calories': row['active_calories'] or 0,
+            'basic_metabolism_calories': row['basic_metabolism_calories'] or 0,
+            'blood_oxygen': row['current_blood_oxygen'] or 0,
+            'current_mood': row['current_mood'] if row['current_mood'] is not None else -1
+        }
+    return {
+        'steps': 0,
+        'avg_heart_rate': 0,
+        'sleep_score': 0,
+        'active_calories': 0,
+        'basic_metabolism_calories': 0,
+        'blood_oxygen': 0,
+        'current_mood': -1
+    }
+
+def weekly_steps_item(row):
+    return {'date': row['record_date'], 'steps': row['steps'] or 0}
+
+def weekly_sleep_item(row):
+    return {
+        'date': row['record_date'], 
+        'sleep_score': row['sleep_score'] or 0,
+        'sleep_duration': row['sleep_duration'] or 0
+    }
+
+def weekly_calories_item(row):
+    return {
+        'date': row['record_date'], 
+        'calories': row['active_calories'] or 0
+    }
+
 @app.route('/api/overview/<int:user_id>', methods=['GET'])
+@cached_user_response
 def get_overview(user_id):
     try:
         today = datetime.now().strftime('%Y-%m-%d')
-        print(f"[{datetime.now()}] 获取用户{user_id}的健康概览数据，日期: {today}")
+        log.debug('获取健康概览', user_id=user_id, date=today)
         
         conn = get_db_connection()
         
         # 修复：添加current_mood字段和TRIM处理
-        overview = conn.execute('''
-            SELECT steps, current_heart_rate, sleep_score, active_calories, basic_metabolism_calories, current_blood_oxygen, current_mood
-            FROM health_data 
-            WHERE user_id = ? AND record_date = ?
-        ''', (user_id, today)).fetchone()
+        overview = conn.execute(queries.OVERVIEW, (user_id, today)).fetchone()
                     
         conn.close()
         
-        if overview:
-            result = {
-                'steps': overview['steps'] or 0,
-                'current_heart_rate': overview['current_heart_rate'] or 0,
-                'avg_heart_rate': overview['current_heart_rate'] or 0,  # 添加这个字段
-                'sleep_score': overview['sleep_score'] or 0,
-                'active_calories': overview['active_calories'] or 0,
-                'basic_metabolism_calories': overview['basic_metabolism_calories'] or 0,
-                'blood_oxygen': overview['current_blood_oxygen'] or 0,
-                'current_mood': overview['current_mood'] if overview['current_mood'] is not None else -1
-            }
-        else:
-            result = {
-                'steps': 0,
-                'avg_heart_rate': 0,
-                'sleep_score': 0,
-                'active_calories': 0,
-                'basic_metabolism_calories': 0,
-                'blood_oxygen': 0,
-                'current_mood': -1
-            }
-            print(f"[{datetime.now()}] 用户{user_id}今日无健康数据，返回默认值")
+        result = overview_from_row(overview)
+        if not overview:
+            log.debug('今日无健康数据，返回默认值', user_id=user_id)
         
         return jsonify({'success': True, 'data': result})
         
     except Exception as e:
-        print(f"[{datetime.now()}] 获取健康概览异常: {e}")
+        log.error('获取健康概览异常', error=e)
         return jsonify({'success': False, 'message': f'获取失败: {str(e)}'}), 500
 
 # 在现有接口后添加
 @app.route('/api/weekly-steps/<int:user_id>', methods=['GET'])
+@cached_user_response
 def get_weekly_steps(user_id):
     try:
         end_date = datetime.now().date()
@@ -859,17 +1426,13 @@ def get_weekly_steps(user_id):
         
         conn = get_db_connection()
         
-        weekly_data = conn.execute('''
-            SELECT record_date, steps FROM health_data 
-            WHERE user_id = ? AND record_date BETWEEN ? AND ?
-            ORDER BY record_date
-        ''', (user_id, start_date.isoformat(), end_date.isoformat())).fetchall()
+        weekly_data = conn.execute(
+            queries.WEEKLY_STEPS, (user_id, start_date.isoformat(), end_date.isoformat())
+        ).fetchall()
         
         conn.close()
         
-        result = []
-        for row in weekly_data:
-            result.append({'date': row['record_date'], 'steps': row['steps'] or 0})
+        result = [weekly_steps_item(row) for row in weekly_data]
         
         return jsonify({'success': True, 'data': result})
         
@@ -877,6 +1440,7 @@ def get_weekly_steps(user_id):
         return jsonify({'success': False, 'message': f'获取失败: {str(e)}'}), 500
 
 @app.route('/api/weekly-sleep/<int:user_id>', methods=['GET'])
+@cached_user_response
 def get_weekly_sleep(user_id):
     try:
         end_date = datetime.now().date()
@@ -884,21 +1448,13 @@ def get_weekly_sleep(user_id):
         
         conn = get_db_connection()
         
-        weekly_data = conn.execute('''
-            SELECT record_date, sleep_score, sleep_duration FROM health_data 
-            WHERE user_id = ? AND record_date BETWEEN ? AND ?
-            ORDER BY record_date
-        ''', (user_id, start_date.isoformat(), end_date.isoformat())).fetchall()
+        weekly_data = conn.execute(
+            queries.WEEKLY_SLEEP, (user_id, start_date.isoformat(), end_date.isoformat())
+        ).fetchall()
         
         conn.close()
         
-        result = []
-        for row in weekly_data:
-            result.append({
-                'date': row['record_date'], 
-                'sleep_score': row['sleep_score'] or 0,
-                'sleep_duration': row['sleep_duration'] or 0
-            })
+        result = [weekly_sleep_item(row) for row in weekly_data]
         
         return jsonify({'success': True, 'data': result})
         
@@ -946,25 +1502,24 @@ def add_family_member():
         member_id = data.get('member_id')
         relationship_name = data.get('relationship_name', '家庭成员')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # 双向添加家庭成员关系
-        cursor.execute('''
-            INSERT OR IGNORE INTO family_members (user_id, member_id, relationship_name)
-            VALUES (?, ?, ?)
-        ''', (user_id, member_id, relationship_name))
-        
-        cursor.execute('''
-            INSERT OR IGNORE INTO family_members (user_id, member_id, relationship_name)
-            VALUES (?, ?, ?)
-        ''', (member_id, user_id, relationship_name))
+        def write(cursor):
+            cursor.execute('''
+                INSERT OR IGNORE INTO family_members (user_id, member_id, relationship_name)
+                VALUES (?, ?, ?)
+            ''', (user_id, member_id, relationship_name))
+            
+            cursor.execute('''
+                INSERT OR IGNORE INTO family_members (user_id, member_id, relationship_name)
+                VALUES (?, ?, ?)
+            ''', (member_id, user_id, relationship_name))
         
-        conn.commit()
-        conn.close()
+        db_writer.run(write)
         
         return jsonify({'success': True, 'message': '添加家庭成员成功'})
         
+    except WriterBusy as e:
+        return writer_busy_response(e)
     except Exception as e:
         return jsonify({'success': False, 'message': f'添加失败: {str(e)}'}), 500
 
@@ -976,68 +1531,32 @@ def save_steps_record():
         steps = data.get('steps')
         record_date = data.get('record_date', datetime.now().strftime('%Y-%m-%d'))
         
-        print(f"[{datetime.now()}] 保存步数记录: 用户{user_id}, 步数{steps}, 日期{record_date}")
+        log.info('保存步数记录', user_id=user_id, steps=steps, record_date=record_date)
         
         # 计算积分 (每500步=1积分)
         points_earned = int(steps // 500)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 检查今日是否已有记录
-        existing = cursor.execute('''
-            SELECT steps, points_earned FROM steps_records 
-            WHERE user_id = ? AND record_date = ?
-        ''', (user_id, record_date)).fetchone()
-        
-        if existing:
-            # 更新现有记录
-            old_points = existing['points_earned']
-            cursor.execute('''
-                UPDATE steps_records 
-                SET steps = ?, points_earned = ? 
-                WHERE user_id = ? AND record_date = ?
-            ''', (steps, points_earned, user_id, record_date))
-            
-            # 更新积分差额
+        def write(cursor):
+            # 写入步数记录，按积分差额更新用户总积分
+            old_points = upsert_steps_record(cursor, user_id, record_date, steps, points_earned)
             points_diff = points_earned - old_points
-        else:
-            # 创建新记录
-            cursor.execute('''
-                INSERT INTO steps_records (user_id, steps, points_earned, record_date)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, steps, points_earned, record_date))
-            points_diff = points_earned
-        
-        # 更新用户总积分
-        cursor.execute('''
-            INSERT OR REPLACE INTO user_points (user_id, total_points, updated_at)
-            VALUES (?, COALESCE((SELECT total_points FROM user_points WHERE user_id = ?), 0) + ?, CURRENT_TIMESTAMP)
-        ''', (user_id, user_id, points_diff))
-        
-        # 记录积分历史
-        if points_diff != 0:
-            cursor.execute('''
-                INSERT INTO points_history (user_id, points, source_type, source_data, record_date)
-                VALUES (?, ?, 'steps', ?, ?)
-            ''', (user_id, points_diff, f'步数: {steps}', record_date))
-        
-        # 同时更新health_data表的步数
-        cursor.execute('''
-            INSERT OR REPLACE INTO health_data (user_id, record_date, steps, updated_at)
-            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-        ''', (user_id, record_date, steps))
-        
-        # 获取总积分
-        total_points_row = cursor.execute('''
-            SELECT total_points FROM user_points WHERE user_id = ?
-        ''', (user_id,)).fetchone()
-        total_points = total_points_row['total_points'] if total_points_row else 0
+            total_points = add_user_points(cursor, user_id, points_diff)
+            
+            # 记录积分历史
+            if points_diff != 0:
+                record_points(cursor, user_id, points_diff, 'steps', f'步数: {steps}', record_date)
+            
+            # 同时更新health_data表的步数（只改步数，不影响当天其他健康字段）
+            upsert_health_data(cursor, user_id, record_date, {'steps': steps})
+            health_score.mark_dirty(cursor, user_id)
+            trends.refresh_for_write(cursor, user_id, record_date)
+            return total_points
         
-        conn.commit()
-        conn.close()
+        total_points = db_writer.run(write)
+        sync_points_leaderboard(get_db_connection(), user_id, total_points)
+        response_cache.bump(user_id)
         
-        print(f"[{datetime.now()}] 步数保存成功: 获得积分{points_earned}, 总积分{total_points}")
+        log.info('步数保存成功', user_id=user_id, points_earned=points_earned, total_points=total_points)
         
         return jsonify({
             'success': True,
@@ -1046,8 +1565,10 @@ def save_steps_record():
             'total_points': total_points
         })
         
+    except WriterBusy as e:
+        return writer_busy_response(e)
     except Exception as e:
-        print(f"[{datetime.now()}] 保存步数异常: {e}")
+        log.error('保存步数异常', error=e)
         return jsonify({'success': False, 'message': f'保存失败: {str(e)}'}), 500
 
 @app.route('/api/steps-history/<int:user_id>', methods=['GET'])
@@ -1055,14 +1576,14 @@ def get_steps_history(user_id):
     try:
         days = int(request.args.get('days', 30))
         
+        if wants_stream(days):
+            return stream_json_response(lambda conn: json_stream.iter_rows(
+                conn.execute(queries.STEPS_HISTORY, (user_id, days)), JSON_STREAM_BATCH_SIZE
+            ), key='records')
+        
         conn = get_db_connection()
         
-        records = conn.execute('''
-            SELECT * FROM steps_records 
-            WHERE user_id = ? 
-            ORDER BY record_date DESC 
-            LIMIT ?
-        ''', (user_id, days)).fetchall()
+        records = conn.execute(queries.STEPS_HISTORY, (user_id, days)).fetchall()
         
         conn.close()
         
@@ -1089,7 +1610,7 @@ def update_username():
         user_id = data.get('user_id')
         new_username = data.get('new_username', '').strip()
         
-        print(f"[{datetime.now()}] 更新用户名请求: 用户{user_id}, 新用户名={new_username}")
+        log.info('更新用户名请求', user_id=user_id, new_username=new_username)
         
         if not user_id or not new_username:
             return jsonify({
@@ -1119,23 +1640,34 @@ def update_username():
                 'message': '该用户名已被使用'
             }), 400
         
-        # 更新用户名
-        cursor.execute(
-            'UPDATE users SET username = ? WHERE id = ?',
-            (new_username, user_id)
-        )
+        old_user = cursor.execute('SELECT username FROM users WHERE id = ?', (user_id,)).fetchone()
+        conn.close()
         
-        if cursor.rowcount == 0:
-            conn.close()
+        def write(cursor):
+            # 更新用户名
+            cursor.execute(
+                'UPDATE users SET username = ? WHERE id = ?',
+                (new_username, user_id)
+            )
+            if cursor.rowcount == 0:
+                return False
+            
+            # 步数排行榜中冗余存储了用户名，一并更新
+            cursor.execute(
+                'UPDATE daily_steps_leaderboard SET username = ? WHERE user_id = ?',
+                (new_username, user_id)
+            )
+            return True
+        
+        if not db_writer.run(write):
             return jsonify({
                 'success': False,
                 'message': '用户不存在'
             }), 404
+        points_leaderboard.rename(int(user_id), new_username)
+        availability_index.rename(old_user['username'] if old_user else None, new_username)
         
-        conn.commit()
-        conn.close()
-        
-        print(f"[{datetime.now()}] 用户名更新成功: 用户{user_id} -> {new_username}")
+        log.info('用户名更新成功', user_id=user_id, new_username=new_username)
         
         return jsonify({
             'success': True,
@@ -1143,8 +1675,10 @@ def update_username():
             'new_username': new_username
         })
         
+    except WriterBusy as e:
+        return writer_busy_response(e)
     except Exception as e:
-        print(f"[{datetime.now()}] 更新用户名异常: {e}")
+        log.error('更新用户名异常', error=e)
         return jsonify({
             'success': False,
             'message': f'更新失败: {str(e)}'
@@ -1155,9 +1689,7 @@ def get_user_points(user_id):
     try:
         conn = get_db_connection()
         
-        points_info = conn.execute('''
-            SELECT * FROM user_points WHERE user_id = ?
-        ''', (user_id,)).fetchone()
+        points_info = conn.execute(queries.USER_POINTS, (user_id,)).fetchone()
         
         conn.close()
         
@@ -1182,68 +1714,116 @@ def get_user_points(user_id):
 
 @app.route('/api/radar-friends', methods=['POST'])
 def create_radar_session():
+    """加入雷达配对：有其他用户在等待同一雷达码时直接配对，否则登记等待（可调用 /api/radar-friends/wait 等待结果）"""
     try:
         data = request.get_json()
         user_id = data.get('user_id')
         radar_code = data.get('radar_code')
         
-        expires_at = (datetime.now() + timedelta(minutes=5)).isoformat()
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 清理过期记录
-        cursor.execute('DELETE FROM friend_radar WHERE expires_at < ?', (datetime.now().isoformat(),))
-        
-        # 检查是否有匹配的雷达码
-        existing = cursor.execute('''
-            SELECT user_id FROM friend_radar 
-            WHERE radar_code = ? AND user_id != ?
-        ''', (radar_code, user_id)).fetchone()
-        
-        if existing:
-            # 找到匹配，添加为家庭成员
-            other_user_id = existing['user_id']
-            
-            cursor.execute('''
-                INSERT OR IGNORE INTO family_members (user_id, member_id)
-                VALUES (?, ?), (?, ?)
-            ''', (user_id, other_user_id, other_user_id, user_id))
-            
-            # 清理雷达记录
-            cursor.execute('DELETE FROM friend_radar WHERE radar_code = ?', (radar_code,))
+        if not user_id or not radar_code:
+            return jsonify({'success': False, 'message': '用户ID和雷达码不能为空'}), 400
+        
+        user_id = int(user_id)
+        radar_code = str(radar_code)
+        
+        def write(cursor):
+            # 进程内配对状态不随事务回滚，写入失败时恢复
+            saved = radar_store.snapshot(user_id, radar_code)
+            db_writer.on_rollback(lambda: radar_store.restore(saved))
+            other_user_id = radar_store.join(cursor, user_id, radar_code)
+            if other_user_id is not None:
+                # 找到匹配，添加为家庭成员
+                cursor.execute('''
+                    INSERT OR IGNORE INTO family_members (user_id, member_id)
+                    VALUES (?, ?), (?, ?)
+                ''', (user_id, other_user_id, other_user_id, user_id))
+            return other_user_id
+        
+        other_user_id = db_writer.run(write)
+        
+        if other_user_id is not None:
+            radar_store.notify(other_user_id, radar_code)
             
-            conn.commit()
-            conn.close()
-            
-            return jsonify({'success': True, 'message': '匹配成功，已添加为家庭成员', 'matched': True})
+            log.info('雷达配对成功', user_id=user_id, partner_id=other_user_id)
+            return jsonify({'success': True, 'message': '匹配成功，已添加为家庭成员', 'matched': True,
+                            'partner_id': other_user_id})
         else:
-            # 没有匹配，创建新记录
-            cursor.execute('''
-                INSERT OR REPLACE INTO friend_radar (user_id, radar_code, expires_at)
-                VALUES (?, ?, ?)
-            ''', (user_id, radar_code, expires_at))
-            
-            conn.commit()
-            conn.close()
-            
             return jsonify({'success': True, 'message': '等待其他用户匹配', 'matched': False})
             
+    except WriterBusy as e:
+        return writer_busy_response(e)
     except Exception as e:
         return jsonify({'success': False, 'message': f'操作失败: {str(e)}'}), 500
 
+@app.route('/api/radar-friends/wait', methods=['GET'])
+def wait_radar_session():
+    """长轮询等待配对结果：对方加入、会话过期或超过 timeout 秒（最多 RADAR_WAIT_MAX_SECONDS）时返回
+
+    参数: user_id, radar_code, timeout
+    返回 matched=true 时附带 partner_id；expired=true 表示会话已过期，需要重新加入
+    """
+    try:
+        user_id = request.args.get('user_id', type=int)
+        radar_code = request.args.get('radar_code')
+        if not user_id or not radar_code:
+            return jsonify({'success': False, 'message': '用户ID和雷达码不能为空'}), 400
+        
+        timeout = request.args.get('timeout', RADAR_WAIT_MAX_SECONDS, type=float)
+        timeout = max(0, min(timeout, RADAR_WAIT_MAX_SECONDS))
+        
+        status, partner_id = radar_store.wait(user_id, radar_code, timeout)
+        
+        result = {'success': True, 'matched': status == 'matched', 'expired': status == 'expired'}
+        if status == 'matched':
+            result['partner_id'] = partner_id
+            result['message'] = '匹配成功，已添加为家庭成员'
+        return jsonify(result)
+        
+    except RadarBusy as e:
+        response = jsonify({'success': False, 'message': '服务繁忙，请稍后重试', 'matched': False})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+    except WriterBusy as e:
+        return writer_busy_response(e)
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'操作失败: {str(e)}'}), 500
+
+@app.route('/api/live/<int:user_id>', methods=['GET'])
+def live_user_stream(user_id):
+    """订阅单个用户的实时数据（SSE）
+
+    事件: realtime（单条实时样本）、realtime_batch（批量上传的样本）、health（健康数据更新的字段）
+    """
+    try:
+        return live_stream_response([user_id])
+    except HubFull as e:
+        return live_hub_full_response(e)
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'订阅失败: {str(e)}'}), 500
+
+@app.route('/api/live/family/<int:user_id>', methods=['GET'])
+def live_family_stream(user_id):
+    """订阅本人及所有家庭成员的实时数据（SSE），成员列表在建立连接时确定"""
+    try:
+        conn = get_db_connection()
+        members = conn.execute('''
+            SELECT member_id FROM family_members
+            WHERE user_id = ? AND status = 1
+        ''', (user_id,)).fetchall()
+        conn.close()
+        
+        return live_stream_response([user_id] + [row['member_id'] for row in members])
+    except HubFull as e:
+        return live_hub_full_response(e)
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'订阅失败: {str(e)}'}), 500
+
 @app.route('/api/family-members/<int:user_id>', methods=['GET'])
 def get_family_members(user_id):
     try:
         conn = get_db_connection()
         
-        members = conn.execute('''
-            SELECT u.id, u.username, u.phone, fm.relationship_name, fm.added_at
-            FROM family_members fm
-            JOIN users u ON fm.member_id = u.id
-            WHERE fm.user_id = ? AND fm.status = 1
-            ORDER BY fm.added_at DESC
-        ''', (user_id,)).fetchall()
+        members = conn.execute(queries.FAMILY_MEMBERS, (user_id,)).fetchall()
         
         conn.close()
         
@@ -1267,17 +1847,11 @@ def get_family_members(user_id):
 def get_friends_list(user_id):
     """获取指定用户的好友列表"""
     try:
-        print(f"[{datetime.now()}] 获取用户{user_id}的好友列表")
+        log.debug('获取好友列表', user_id=user_id)
         
         conn = get_db_connection()
         
-        friends = conn.execute('''
-            SELECT u.id, u.username, u.phone, u.avatar_url
-            FROM family_members fm
-            JOIN users u ON fm.member_id = u.id
-            WHERE fm.user_id = ? AND fm.status = 1
-            ORDER BY u.username
-        ''', (user_id,)).fetchall()
+        friends = conn.execute(queries.FRIENDS_LIST, (user_id,)).fetchall()
         
         conn.close()
         
@@ -1290,7 +1864,7 @@ def get_friends_list(user_id):
                 'avatar_url': friend['avatar_url'] 
             })
         
-        print(f"[{datetime.now()}] 查询成功，共{len(result)}个好友")
+        log.debug('好友列表查询成功', user_id=user_id, count=len(result))
         
         return jsonify({
             'success': True,
@@ -1299,7 +1873,7 @@ def get_friends_list(user_id):
         })
         
     except Exception as e:
-        print(f"[{datetime.now()}] 获取好友列表异常: {e}")
+        log.error('获取好友列表异常', error=e)
         return jsonify({
             'success': False,
             'message': f'获取失败: {str(e)}',
@@ -1307,6 +1881,219 @@ def get_friends_list(user_id):
         }), 500
 
 
+FAMILY_OVERVIEW_MAX_DAYS = 31
+HEALTH_SCORE_MAX_DAYS = 90
+
+def family_snapshot_from_row(row, metrics):
+    """家庭成员当天的健康快照，默认值与健康概览一致"""
+    snapshot = {
+        'has_data': row['record_date'] is not None,
+        'steps': row['steps'] or 0,
+        'current_heart_rate': row['current_heart_rate'] or 0,
+        'blood_oxygen': row['current_blood_oxygen'] or 0,
+        'sleep_score': row['sleep_score'] or 0,
+        'current_mood': row['current_mood'] if row['current_mood'] is not None else -1
+    }
+    for metric in metrics:
+        snapshot[metric] = row[metric]
+    return snapshot
+
+@app.route('/api/family-overview/<int:user_id>', methods=['GET'])
+def get_family_overview(user_id):
+    """所有家庭成员今日的健康快照（步数、心率、血氧、睡眠分数、心情），一次查询返回
+
+    参数: metrics 逗号分隔的额外 health_data 字段，
+    days 大于1时每个成员附带最近N天的 history（包含快照字段和 metrics，最多31天）
+    """
+    try:
+        metrics_param = request.args.get('metrics')
+        metrics = [m.strip() for m in metrics_param.split(',') if m.strip()] if metrics_param else []
+        unknown = [m for m in metrics if m not in HEALTH_FIELDS]
+        if unknown:
+            return jsonify({'success': False, 'message': f'未知的健康指标: {",".join(unknown)}'}), 400
+        
+        days = int(request.args.get('days', 1))
+        if days < 1 or days > FAMILY_OVERVIEW_MAX_DAYS:
+            return jsonify({'success': False, 'message': f'days需在1到{FAMILY_OVERVIEW_MAX_DAYS}之间'}), 400
+        
+        today = datetime.now().date()
+        fields = ['steps', 'current_heart_rate', 'current_blood_oxygen', 'sleep_score', 'current_mood']
+        fields += [m for m in metrics if m not in fields]
+        columns = ', '.join(f'h.{f}' for f in fields)
+        
+        conn = get_db_connection()
+        
+        members = conn.execute(
+            queries.FAMILY_OVERVIEW.format(columns=columns), (today.isoformat(), user_id)
+        ).fetchall()
+        
+        history = {}
+        if days > 1 and members:
+            start_date = (today - timedelta(days=days - 1)).isoformat()
+            history_rows = conn.execute(
+                queries.FAMILY_HISTORY.format(columns=columns), (start_date, today.isoformat(), user_id)
+            ).fetchall()
+            for row in history_rows:
+                item = {'date': row['record_date']}
+                item.update({f: row[f] for f in fields})
+                history.setdefault(row['user_id'], []).append(item)
+        
+        conn.close()
+        
+        result = []
+        for member in members:
+            entry = {
+                'id': member['id'],
+                'username': member['username'],
+                'avatar_url': member['avatar_url'],
+                'relationship_name': member['relationship_name']
+            }
+            entry.update(family_snapshot_from_row(member, metrics))
+            if days > 1:
+                entry['history'] = history.get(member['id'], [])
+            result.append(entry)
+        
+        log.debug('获取家庭健康概览', user_id=user_id, members=len(result), days=days)
+        
+        return jsonify({'success': True, 'date': today.isoformat(), 'members': result})
+        
+    except Exception as e:
+        log.error('获取家庭健康概览异常', error=e)
+        return jsonify({'success': False, 'message': f'获取失败: {str(e)}'}), 500
+
+
+HEALTH_SCORE_FIELDS = ('score', 'score_steps', 'score_sleep', 'score_heart', 'score_oxygen', 'score_habit',
+                       'days_with_data')
+
+def health_score_from_row(row):
+    item = {'date': row['score_date']}
+    item.update({field: row[field] for field in HEALTH_SCORE_FIELDS})
+    return item
+
+def refresh_health_scores(conn, user_ids):
+    """数据有变化（或今天还没有分数）的用户交给写线程重新计算，本次请求返回已有的分数；
+    没有安装 numpy 时只返回已有的分数
+    """
+    if not health_score.available():
+        return
+    targets = health_score.needs_refresh(conn, user_ids)
+    if targets:
+        enqueue_refresh(('health_score', frozenset(targets)),
+                        lambda cursor: health_score.refresh_dirty(cursor, targets), targets)
+
+@app.route('/api/health-score/<int:user_id>', methods=['GET'])
+@cached_user_response
+def get_health_score(user_id):
+    """健康指数（0-100）及各分项得分
+
+    参数: days 返回最近N天的分数记录（默认7，最多90）；只有计算过的日期才有记录
+    """
+    try:
+        days = int(request.args.get('days', 7))
+        if days < 1 or days > HEALTH_SCORE_MAX_DAYS:
+            return jsonify({'success': False, 'message': f'days需在1到{HEALTH_SCORE_MAX_DAYS}之间'}), 400
+        
+        today = datetime.now().date().isoformat()
+        
+        conn = get_db_connection()
+        refresh_health_scores(conn, [user_id])
+        rows = conn.execute(queries.HEALTH_SCORE_HISTORY, (user_id, today, days)).fetchall()
+        conn.close()
+        
+        history = [health_score_from_row(row) for row in reversed(rows)]
+        
+        return jsonify({
+            'success': True,
+            'date': today,
+            'score': history[-1] if history else None,
+            'history': history
+        })
+        
+    except Exception as e:
+        log.error('获取健康指数异常', error=e)
+        return jsonify({'success': False, 'message': f'获取失败: {str(e)}'}), 500
+
+@app.route('/api/health-score/family/<int:user_id>', methods=['GET'])
+def get_family_health_ranking(user_id):
+    """本人和所有家庭成员今天的健康指数排名，没有分数的成员排在最后（rank 为 null）"""
+    try:
+        today = datetime.now().date().isoformat()
+        
+        conn = get_db_connection()
+        user = conn.execute('SELECT id, username, avatar_url FROM users WHERE id = ?', (user_id,)).fetchone()
+        if not user:
+            conn.close()
+            return jsonify({'success': False, 'message': '用户不存在'})
+        
+        members = conn.execute('''
+            SELECT u.id, u.username, u.avatar_url, fm.relationship_name
+            FROM family_members fm
+            JOIN users u ON fm.member_id = u.id
+            WHERE fm.user_id = ? AND fm.status = 1
+        ''', (user_id,)).fetchall()
+        
+        user_ids = [user_id] + [member['id'] for member in members]
+        refresh_health_scores(conn, user_ids)
+        scores = {row['user_id']: row for row in conn.execute(
+            queries.HEALTH_SCORE_FAMILY.format(placeholders=queries.in_list(len(user_ids))), (today, *user_ids)
+        )}
+        conn.close()
+        
+        ranking = []
+        for person, relationship_name in [(user, None)] + [(member, member['relationship_name']) for member in members]:
+            entry = {
+                'id': person['id'],
+                'username': person['username'],
+                'avatar_url': person['avatar_url'],
+                'relationship_name': relationship_name,
+                'is_self': person['id'] == user_id
+            }
+            row = scores.get(person['id'])
+            entry.update({field: row[field] if row else None for field in HEALTH_SCORE_FIELDS})
+            ranking.append(entry)
+        
+        ranking.sort(key=lambda e: (e['score'] is None, -(e['score'] or 0), e['username']))
+        for i, entry in enumerate(ranking):
+            entry['rank'] = i + 1 if entry['score'] is not None else None
+        
+        return jsonify({'success': True, 'date': today, 'ranking': ranking})
+        
+    except Exception as e:
+        log.error('获取家庭健康指数排名异常', error=e)
+        return jsonify({'success': False, 'message': f'获取失败: {str(e)}'}), 500
+
+
+@app.route('/api/trends/<int:user_id>', methods=['GET'])
+@cached_user_response
+def get_trends(user_id):
+    """最近7天与之前7天的对比：每个指标的日均值、差值和变化百分比，以及变化明显的指标的文字提示"""
+    try:
+        today = datetime.now().date()
+        previous_start, current_start, end = trends.window_bounds(today)
+        
+        conn = get_db_connection()
+        rows, stale = trends.load(conn, user_id, today)
+        conn.close()
+        if stale:
+            enqueue_refresh(('trends', user_id), lambda cursor: trends.refresh(cursor, user_id, today))
+        
+        metrics = {metric: trends.describe(metric, rows[metric]) for metric in trends.TREND_METRICS if metric in rows}
+        insights = [text for text in (trends.insight(trend) for trend in metrics.values()) if text]
+        
+        return jsonify({
+            'success': True,
+            'date': end,
+            'current': {'start': current_start, 'end': end},
+            'previous': {'start': previous_start, 'end': (today - timedelta(days=trends.WINDOW_DAYS)).isoformat()},
+            'metrics': metrics,
+            'insights': insights
+        })
+        
+    except Exception as e:
+        log.error('获取健康趋势异常', error=e)
+        return jsonify({'success': False, 'message': f'获取失败: {str(e)}'}), 500
+
+
 @app.route('/api/ai-health-data', methods=['POST'])
 def save_ai_health_data():
     try:
@@ -1322,62 +2109,44 @@ def save_ai_health_data():
         blood_oxygen = data.get('blood_oxygen')
         sleep_duration = data.get('sleep_duration')
         
-        print(f"[{datetime.now()}] AI健康数据录入: 用户{user_id}, 日期{record_date}")
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 构建更新字段
-        update_fields = []
-        values = [user_id, record_date]
-        
-        if steps is not None:
-            update_fields.append('steps = ?')
-            values.append(steps)
-        if distance is not None:
-            update_fields.append('distance = ?') 
-            values.append(distance)
-        if calories is not None:
-            update_fields.append('active_calories = ?')
-            values.append(calories)
-        if heart_rate is not None:
-            update_fields.append('avg_heart_rate = ?')
-            values.append(heart_rate)
-        if blood_oxygen is not None:
-            update_fields.append('avg_blood_oxygen = ?')
-            values.append(blood_oxygen)
-        if sleep_duration is not None:
-            update_fields.append('sleep_duration = ?')
-            values.append(sleep_duration)
-        
-        if update_fields:
-            # 使用INSERT OR REPLACE更新健康数据
-            set_clause = ', '.join(update_fields)
-            sql = f'''
-                INSERT OR REPLACE INTO health_data 
-                (user_id, record_date, {', '.join([field.split(' = ')[0] for field in update_fields])}, updated_at) 
-                VALUES (?, ?, {', '.join(['?' for _ in update_fields])}, CURRENT_TIMESTAMP)
-            '''
-            cursor.execute(sql, values)
+        log.info('AI健康数据录入', user_id=user_id, record_date=record_date)
+        
+        # AI解析字段到health_data字段的映射
+        values = {
+            'steps': steps,
+            'distance': distance,
+            'active_calories': calories,
+            'avg_heart_rate': heart_rate,
+            'avg_blood_oxygen': blood_oxygen,
+            'sleep_duration': sleep_duration
+        }
+        
+        def write(cursor):
+            updated_fields = upsert_health_data(cursor, user_id, record_date, values)
+            if updated_fields:
+                health_score.mark_dirty(cursor, user_id)
+                trends.refresh_for_write(cursor, user_id, record_date)
+            return updated_fields
+        
+        if db_writer.run(write):
+            response_cache.bump(user_id)
             
-            conn.commit()
-            conn.close()
-            
-            print(f"[{datetime.now()}] AI健康数据保存成功")
+            log.info('AI健康数据保存成功', user_id=user_id)
             
             return jsonify({
                 'success': True,
                 'message': 'AI健康数据保存成功'
             })
         else:
-            conn.close()
             return jsonify({
                 'success': False,
                 'message': '没有有效的健康数据'
             }), 400
             
+    except WriterBusy as e:
+        return writer_busy_response(e)
     except Exception as e:
-        print(f"[{datetime.now()}] AI健康数据保存异常: {e}")
+        log.error('AI健康数据保存异常', error=e)
         return jsonify({
             'success': False, 
             'message': f'保存失败: {str(e)}'
@@ -1393,7 +2162,7 @@ def upload_avatar():
         if not user_id or not avatar_base64:
             return jsonify({'success': False, 'message': '参数缺失'}), 400
         
-        print(f"[{datetime.now()}] 头像上传请求: 用户{user_id}")
+        log.info('头像上传请求', user_id=user_id)
         
         # 解码base64图片
         try:
@@ -1416,13 +2185,11 @@ def upload_avatar():
         avatar_url = f"/static/avatars/{filename}"
         
         # 更新数据库
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET avatar_url = ? WHERE id = ?', (avatar_url, user_id))
-        conn.commit()
-        conn.close()
+        db_writer.run(lambda cursor: cursor.execute(
+            'UPDATE users SET avatar_url = ? WHERE id = ?', (avatar_url, user_id)
+        ))
         
-        print(f"[{datetime.now()}] 头像上传成功: 用户{user_id}, 文件{filename}")
+        log.info('头像上传成功', user_id=user_id, filename=filename)
         
         return jsonify({
             'success': True,
@@ -1430,8 +2197,10 @@ def upload_avatar():
             'avatar_url': avatar_url
         })
         
+    except WriterBusy as e:
+        return writer_busy_response(e)
     except Exception as e:
-        print(f"[{datetime.now()}] 头像上传异常: {e}")
+        log.error('头像上传异常', error=e)
         return jsonify({'success': False, 'message': f'上传失败: {str(e)}'}), 500
 
 @app.route('/api/user-profile/<int:user_id>', methods=['GET'])
@@ -1467,46 +2236,48 @@ def remove_family_member():
         user_id = data.get('user_id')
         member_id = data.get('member_id')
         
-        print(f"[{datetime.now()}] 删除好友关系: 用户{user_id} -> 成员{member_id}")
+        log.info('删除好友关系', user_id=user_id, member_id=member_id)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 查询删除前的状态
-        before_count = cursor.execute('''
-            SELECT COUNT(*) as count FROM family_members 
-            WHERE (user_id = ? AND member_id = ?) OR (user_id = ? AND member_id = ?)
-        ''', (user_id, member_id, member_id, user_id)).fetchone()
-        print(f"[{datetime.now()}] 删除前关系数量: {before_count['count']}")
-        
-        # 执行硬删除
-        cursor.execute('''
-            DELETE FROM family_members 
-            WHERE (user_id = ? AND member_id = ?) OR (user_id = ? AND member_id = ?)
-        ''', (user_id, member_id, member_id, user_id))
-        
-        affected_rows = cursor.rowcount
-        print(f"[{datetime.now()}] 删除影响的行数: {affected_rows}")
-        
-        # 查询删除后的状态
-        after_count = cursor.execute('''
-            SELECT COUNT(*) as count FROM family_members 
-            WHERE (user_id = ? AND member_id = ?) OR (user_id = ? AND member_id = ?)
-        ''', (user_id, member_id, member_id, user_id)).fetchone()
-        print(f"[{datetime.now()}] 删除后关系数量: {after_count['count']}")
-        
-        conn.commit()
-        conn.close()
+        def write(cursor):
+            # 查询删除前的状态（仅在开启DEBUG日志时执行）
+            if log.isEnabledFor(logging.DEBUG):
+                before_count = cursor.execute('''
+                    SELECT COUNT(*) as count FROM family_members 
+                    WHERE (user_id = ? AND member_id = ?) OR (user_id = ? AND member_id = ?)
+                ''', (user_id, member_id, member_id, user_id)).fetchone()
+                log.debug('删除前关系数量', count=before_count['count'])
+            
+            # 执行硬删除
+            cursor.execute('''
+                DELETE FROM family_members 
+                WHERE (user_id = ? AND member_id = ?) OR (user_id = ? AND member_id = ?)
+            ''', (user_id, member_id, member_id, user_id))
+            affected_rows = cursor.rowcount
+            
+            # 查询删除后的状态（仅在开启DEBUG日志时执行）
+            if log.isEnabledFor(logging.DEBUG):
+                after_count = cursor.execute('''
+                    SELECT COUNT(*) as count FROM family_members 
+                    WHERE (user_id = ? AND member_id = ?) OR (user_id = ? AND member_id = ?)
+                ''', (user_id, member_id, member_id, user_id)).fetchone()
+                log.debug('删除后关系数量', count=after_count['count'])
+            return affected_rows
+        
+        affected_rows = db_writer.run(write)
+        log.info('删除好友影响的行数', affected_rows=affected_rows)
         
         return jsonify({'success': True, 'message': f'删除好友成功，删除{affected_rows}条记录'})
         
+    except WriterBusy as e:
+        return writer_busy_response(e)
     except Exception as e:
-        print(f"[{datetime.now()}] 删除好友异常: {e}")
+        log.error('删除好友异常', error=e)
         return jsonify({'success': False, 'message': f'删除失败: {str(e)}'}), 500
 
 
 
 @app.route('/api/weekly-calories/<int:user_id>', methods=['GET'])
+@cached_user_response
 def get_weekly_calories(user_id):
     try:
         end_date = datetime.now().date()
@@ -1514,20 +2285,13 @@ def get_weekly_calories(user_id):
         
         conn = get_db_connection()
         
-        weekly_data = conn.execute('''
-            SELECT record_date, active_calories FROM health_data 
-            WHERE user_id = ? AND record_date BETWEEN ? AND ?
-            ORDER BY record_date
-        ''', (user_id, start_date.isoformat(), end_date.isoformat())).fetchall()
+        weekly_data = conn.execute(
+            queries.WEEKLY_CALORIES, (user_id, start_date.isoformat(), end_date.isoformat())
+        ).fetchall()
         
         conn.close()
         
-        result = []
-        for row in weekly_data:
-            result.append({
-                'date': row['record_date'], 
-                'calories': row['active_calories'] or 0
-            })
+        result = [weekly_calories_item(row) for row in weekly_data]
         
         return jsonify({'success': True, 'data': result})
         
@@ -1535,14 +2299,73 @@ def get_weekly_calories(user_id):
         return jsonify({'success': False, 'message': f'获取失败: {str(e)}'}), 500
 
 
+DASHBOARD_SECTIONS = {
+    'weekly_steps': weekly_steps_item,
+    'weekly_sleep': weekly_sleep_item,
+    'weekly_calories': weekly_calories_item
+}
+
+@app.route('/api/dashboard/<int:user_id>', methods=['GET'])
+@cached_user_response
+def get_dashboard(user_id):
+    """健康页数据：今日概览 + 最近7天步数 / 睡眠 / 卡路里，一次范围查询返回
+
+    参数: sections 逗号分隔的部分（overview,weekly_steps,weekly_sleep,weekly_calories），默认全部
+    """
+    try:
+        sections_param = request.args.get('sections')
+        if sections_param:
+            sections = [s.strip() for s in sections_param.split(',') if s.strip()]
+            unknown = [s for s in sections if s != 'overview' and s not in DASHBOARD_SECTIONS]
+            if unknown:
+                return jsonify({'success': False, 'message': f'未知的数据部分: {",".join(unknown)}'}), 400
+        else:
+            sections = ['overview', *DASHBOARD_SECTIONS]
+        
+        end_date = datetime.now().date()
+        start_date = end_date - timedelta(days=6)
+        today = end_date.isoformat()
+        
+        conn = get_db_connection()
+        
+        rows = conn.execute(queries.DASHBOARD_WEEK, (user_id, start_date.isoformat(), today)).fetchall()
+        
+        conn.close()
+        
+        result = {name: [] for name in sections if name in DASHBOARD_SECTIONS}
+        today_row = None
+        for row in rows:
+            if row['record_date'] == today:
+                today_row = row
+            for name, series in result.items():
+                series.append(DASHBOARD_SECTIONS[name](row))
+        if 'overview' in sections:
+            result['overview'] = overview_from_row(today_row)
+        
+        return jsonify({'success': True, 'data': result})
+        
+    except Exception as e:
+        log.error('获取健康页数据异常', error=e)
+        return jsonify({'success': False, 'message': f'获取失败: {str(e)}'}), 500
+
+
+@app.route('/api/metrics/db-writer', methods=['GET'])
+def get_db_writer_metrics():
+    """本进程写入队列的指标：队列深度、批次大小、排队等待和提交耗时"""
+    return jsonify({'success': True, 'pid': os.getpid(), 'data': db_writer.stats()})
+
 
 if __name__ == '__main__':
     init_database()
+    with app.app_context():
+        get_points_leaderboard()
+        get_availability_index()
     print("=" * 50)
     print("🚀 用户注册登录后端服务")
     print(f"📊 数据库: SQLite ({DATABASE_PATH})")
     print(f"🌐 服务地址: http://localhost:5000")
     print(f"👤 开发用户: gadz2021")
     print(f"📅 启动时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("🔧 开发服务器，生产环境请使用: python serve.py --workers 4 --threads 8")
     print("=" * 50)
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
\ No newline at end of file
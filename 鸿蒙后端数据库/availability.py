@@ -0,0 +1,68 @@
+"""用户名 / 手机号占用索引
+
+注册页面每输入一个字符都会检查用户名和手机号是否已被占用。
+这里在进程内保存全部用户名和手机号，不在集合中的（绝大多数输入过程中的检查）直接返回未占用，
+在集合中的再查询数据库确认（处理 exclude_user_id、其他进程改名等情况）。
+
+多进程部署时，其他进程新注册的用户名要等下次重新同步（resync_seconds）后才会出现在本进程的集合中，
+这段时间内的检查可能误报为未占用；注册和改名接口本身仍以数据库唯一约束为准。
+重新同步由 background_reload 在后台线程中执行，期间继续使用旧集合。
+"""
+import threading
+import time
+
+# 全量加载（启动和定期重新同步时执行，读取整个 users 表）
+LOAD_SQL = 'SELECT username, phone FROM users'
+
+
+class AvailabilityIndex:
+    def __init__(self, resync_seconds=60):
+        self.resync_seconds = resync_seconds
+        self._usernames = set()
+        self._phones = set()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def load(self, conn):
+        """从数据库全量加载（启动时以及定期重新同步时调用）"""
+        usernames = set()
+        phones = set()
+        for username, phone in conn.execute(LOAD_SQL):
+            usernames.add(username)
+            phones.add(phone)
+
+        with self._lock:
+            self._usernames = usernames
+            self._phones = phones
+            self._loaded_at = time.monotonic()
+
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def needs_load(self):
+        if self._loaded_at is None:
+            return True
+        return bool(self.resync_seconds) and time.monotonic() - self._loaded_at > self.resync_seconds
+
+    def may_have_username(self, username):
+        """返回 False 时用户名一定未被占用，返回 True 时需要查询数据库确认"""
+        return username in self._usernames
+
+    def may_have_phone(self, phone):
+        return phone in self._phones
+
+    def add(self, username, phone):
+        with self._lock:
+            self._usernames.add(username)
+            self._phones.add(phone)
+
+    def rename(self, old_username, new_username):
+        with self._lock:
+            if old_username is not None:
+                self._usernames.discard(old_username)
+            self._usernames.add(new_username)
+
+    def remove(self, username, phone):
+        with self._lock:
+            self._usernames.discard(username)
+            self._phones.discard(phone)
@@ -0,0 +1,60 @@
+"""进程内快照的定期重新加载
+
+积分排行榜等进程内数据按 resync_seconds 从数据库全量重新加载（多进程部署时同步其他进程的写入）。
+第一次使用时在请求线程中同步加载，并发的请求等待同一次加载；
+之后到期时只由一个后台线程重新加载，加载期间请求继续使用旧数据，
+不会在请求路径上扫描全表，也不会有多个请求同时重新加载。
+
+target 需要提供 loaded()、needs_load() 和 load(conn)。
+"""
+import threading
+
+from log_utils import get_logger
+
+log = get_logger('background_reload')
+
+
+class BackgroundReloader:
+    def __init__(self, target, acquire, release, name):
+        self.target = target
+        self.acquire = acquire
+        self.release = release
+        self.name = name
+        self._lock = threading.Lock()
+
+    def _load(self):
+        conn = self.acquire()
+        try:
+            self.target.load(conn)
+        finally:
+            self.release(conn)
+
+    def _reload(self):
+        try:
+            self._load()
+        except Exception as e:
+            log.warning('后台重新加载失败', name=self.name, error=e)
+        finally:
+            self._lock.release()
+
+    def ensure_loaded(self):
+        if not self.target.needs_load():
+            return
+
+        if not self.target.loaded():
+            with self._lock:
+                if not self.target.loaded():
+                    self._load()
+            return
+
+        # 已经有一次重新加载在进行中时直接使用旧数据
+        if not self._lock.acquire(blocking=False):
+            return
+        if not self.target.needs_load():
+            self._lock.release()
+            return
+        try:
+            threading.Thread(target=self._reload, name=f'reload-{self.name}', daemon=True).start()
+        except Exception:
+            self._lock.release()
+            raise
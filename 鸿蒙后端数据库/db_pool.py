@@ -0,0 +1,90 @@
+"""SQLite 连接池
+
+每个工作线程同一时刻只持有一个长连接，请求结束后归还复用，
+避免每个请求重复打开数据库、解析 schema。
+连接在创建时统一设置 WAL、synchronous、busy_timeout、mmap 和缓存大小。
+"""
+import sqlite3
+import threading
+
+
+class PooledConnection(sqlite3.Connection):
+    """池化连接：close() 只回滚未提交事务，真正的归还由连接池负责"""
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def close_for_real(self):
+        sqlite3.Connection.close(self)
+
+
+class ConnectionPool:
+    def __init__(self, database, max_idle=32, busy_timeout_ms=5000,
+                 mmap_size=256 * 1024 * 1024, cache_size_kb=16 * 1024):
+        self.database = database
+        self.max_idle = max_idle
+        self.busy_timeout_ms = busy_timeout_ms
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self._idle = []
+        self._inherited = []
+        self._lock = threading.Lock()
+
+    def _configure(self, conn):
+        """每个连接只在创建时配置一次"""
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_size_kb)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    def connect(self):
+        """打开一个不归池管理的独立连接（启动脚本、命令行工具使用）"""
+        conn = sqlite3.connect(self.database, timeout=self.busy_timeout_ms / 1000)
+        return self._configure(conn)
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        conn = sqlite3.connect(self.database, timeout=self.busy_timeout_ms / 1000,
+                               check_same_thread=False, factory=PooledConnection)
+        return self._configure(conn)
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close_for_real()
+            return
+
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close_for_real()
+
+    def discard_after_fork(self):
+        """fork 出的子进程中丢弃从父进程继承的连接
+
+        SQLite 连接不能跨 fork 使用，在子进程中关闭也可能释放父进程持有的文件锁，
+        所以只保留引用、不再使用，也不关闭。
+        """
+        self._lock = threading.Lock()
+        self._inherited = self._idle
+        self._idle = []
+
+    def close_all(self):
+        """关闭所有空闲连接（进程退出时调用）"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            try:
+                conn.close_for_real()
+            except sqlite3.Error:
+                pass
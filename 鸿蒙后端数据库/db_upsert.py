@@ -0,0 +1,130 @@
+"""统一的 upsert 写入层
+
+所有写入都使用 INSERT ... ON CONFLICT DO UPDATE，每张表只有一个固定的 SQL 语句，
+客户端只传部分字段时也复用同一条预编译语句（未传的字段以 NULL 占位，COALESCE 保留旧值）。
+"""
+
+# health_data 中允许客户端写入的字段
+HEALTH_FIELDS = [
+    'steps', 'steps_goal', 'distance', 'calories_burned',
+    'current_heart_rate', 'resting_heart_rate', 'min_heart_rate', 'avg_heart_rate', 'max_heart_rate',
+    'current_blood_oxygen', 'min_blood_oxygen', 'avg_blood_oxygen', 'max_blood_oxygen',
+    'sleep_score', 'sleep_duration', 'sleep_start_time', 'sleep_end_time',
+    'deep_sleep_duration', 'light_sleep_duration', 'rem_sleep_duration', 'awake_duration',
+    'active_calories', 'calories_goal', 'basic_metabolism_calories',
+    'current_mood'
+]
+
+_health_upsert_sql = None
+
+
+def _build_health_upsert_sql(cursor):
+    """根据表结构生成 health_data 的 upsert 语句
+
+    插入新行时未传字段取表定义中的默认值，更新已有行时未传字段保留原值。
+    参数编号: ?1=user_id, ?2=record_date, ?3.. 依次对应 HEALTH_FIELDS
+    """
+    defaults = {
+        row[1]: row[4]
+        for row in cursor.execute('PRAGMA table_info(health_data)').fetchall()
+    }
+    insert_values = []
+    update_sets = []
+    for i, field in enumerate(HEALTH_FIELDS, start=3):
+        default = defaults.get(field)
+        insert_values.append(f'COALESCE(?{i}, {default})' if default is not None else f'?{i}')
+        update_sets.append(f'{field} = COALESCE(?{i}, {field})')
+
+    return f'''
+        INSERT INTO health_data (user_id, record_date, {', '.join(HEALTH_FIELDS)}, updated_at)
+        VALUES (?1, ?2, {', '.join(insert_values)}, CURRENT_TIMESTAMP)
+        ON CONFLICT(user_id, record_date) DO UPDATE SET
+            {', '.join(update_sets)}, updated_at = CURRENT_TIMESTAMP
+    '''
+
+
+def upsert_health_data(cursor, user_id, record_date, values):
+    """写入一天的健康数据，values 中为 None 或缺失的字段不会被修改
+
+    返回实际写入的字段列表
+    """
+    global _health_upsert_sql
+
+    provided_fields = [f for f in HEALTH_FIELDS if values.get(f) is not None]
+    if not provided_fields:
+        return []
+
+    if _health_upsert_sql is None:
+        _health_upsert_sql = _build_health_upsert_sql(cursor)
+
+    params = [user_id, record_date] + [values.get(f) for f in HEALTH_FIELDS]
+    cursor.execute(_health_upsert_sql, params)
+
+    # 步数变化时同步维护当天的步数排行榜
+    if values.get('steps') is not None:
+        upsert_daily_steps(cursor, user_id, record_date, values['steps'])
+    return provided_fields
+
+
+def upsert_daily_steps(cursor, user_id, record_date, steps):
+    """更新步数排行榜中某用户某天的步数（与 health_data 写入在同一事务中）"""
+    cursor.execute('''
+        INSERT INTO daily_steps_leaderboard (record_date, user_id, username, steps)
+        SELECT ?, id, username, ? FROM users WHERE id = ?
+        ON CONFLICT(record_date, user_id) DO UPDATE SET steps = excluded.steps
+    ''', (str(record_date).strip("'"), steps, user_id))
+
+
+def upsert_realtime_samples(cursor, rows, schema='main'):
+    """批量写入实时数据，rows 为 (user_id, record_date, time_stamp, data_type, value)
+
+    schema 为写入的数据库（按月分区时为 rt_YYYY_MM）
+    """
+    cursor.executemany(f'''
+        INSERT INTO {schema}.realtime_data (user_id, record_date, time_stamp, data_type, value)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, record_date, time_stamp, data_type)
+        DO UPDATE SET value = excluded.value, created_at = CURRENT_TIMESTAMP
+    ''', rows)
+
+
+def upsert_steps_record(cursor, user_id, record_date, steps, points_earned):
+    """写入每日步数记录，返回该记录原来的积分（无记录时为 0）"""
+    existing = cursor.execute('''
+        SELECT points_earned FROM steps_records
+        WHERE user_id = ? AND record_date = ?
+    ''', (user_id, record_date)).fetchone()
+
+    cursor.execute('''
+        INSERT INTO steps_records (user_id, steps, points_earned, record_date)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id, record_date)
+        DO UPDATE SET steps = excluded.steps, points_earned = excluded.points_earned
+    ''', (user_id, steps, points_earned, record_date))
+
+    return existing[0] if existing else 0
+
+
+def record_points(cursor, user_id, points, source_type, source_data, record_date):
+    """写入积分历史，并在同一事务中累加 points_daily 当天的积分（按时间窗口排行使用）"""
+    cursor.execute('''
+        INSERT INTO points_history (user_id, points, source_type, source_data, record_date)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (user_id, points, source_type, source_data, record_date))
+    cursor.execute('''
+        INSERT INTO points_daily (record_date, user_id, points)
+        VALUES (?, ?, ?)
+        ON CONFLICT(record_date, user_id) DO UPDATE SET points = points + excluded.points
+    ''', (record_date, user_id, points))
+
+
+def add_user_points(cursor, user_id, points):
+    """累加用户总积分，返回累加后的总积分"""
+    row = cursor.execute('''
+        INSERT INTO user_points (user_id, total_points, updated_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(user_id)
+        DO UPDATE SET total_points = total_points + excluded.total_points, updated_at = CURRENT_TIMESTAMP
+        RETURNING total_points
+    ''', (user_id, points)).fetchone()
+    return row[0]
@@ -0,0 +1,296 @@
+"""单写线程 + 组提交
+
+SQLite 同一时刻只允许一个写事务。每个请求各自打开事务、各自提交时，并发上传会互相等待写锁
+（超过 busy_timeout 就是 "database is locked"），并且每个请求都要单独提交一次。
+这里由一个专用线程持有唯一的写连接，接口把写操作（接收 cursor 的函数）放入队列并等待结果：
+写线程取出队列中已有的操作（最多 max_batch 个，最多再等 max_latency_ms 凑批），
+在同一个事务中依次执行、一次提交。并发上传越多，每次提交分摊的操作越多。
+
+每个操作在自己的 SAVEPOINT 中执行，出错时只回滚该操作，异常原样抛给提交它的请求，
+同一批的其他操作不受影响。操作内不要提交或回滚，也不要执行 ATTACH 等不能在事务中执行的语句。
+需要事务外准备的操作提交时带上 keys（例如要挂载的分区月份），写线程在每批 BEGIN 之前
+以本批所有 keys 的并集调用一次 prepare(conn, keys)；并集超过 max_keys 时，放不下的操作留到下一批，
+同一批内后面的操作不会卸载前面操作需要的分区。提交成功后才返回结果，
+缓存失效、实时推送等副作用由接口在 run() 返回后执行。
+操作中修改了进程内状态时用 on_rollback 登记恢复函数，该操作回滚或整批提交失败时按登记的逆序调用。
+
+队列已满时 run() 立即抛出 WriterBusy，由接口返回 503 + Retry-After。
+run() 等待超时时取消仍在排队的操作并同样抛出 WriterBusy，写线程跳过已取消的操作，
+客户端重试不会重复写入；操作已经开始执行时继续等待它提交完成。
+写线程在第一次提交操作时启动，多进程部署时每个工作进程各有一个写线程。
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from log_utils import get_logger
+
+log = get_logger('db_writer')
+
+
+class WriterBusy(Exception):
+    """写队列已满"""
+
+    def __init__(self, retry_after):
+        super().__init__('数据库写入队列已满')
+        self.retry_after = retry_after
+
+
+class _WriteOp:
+    __slots__ = ('fn', 'keys', 'future', 'error', 'result', 'queued_at', 'undo')
+
+    def __init__(self, fn, keys):
+        self.fn = fn
+        self.keys = frozenset(keys)
+        self.future = Future()
+        self.error = None
+        self.result = None
+        self.queued_at = time.monotonic()
+        self.undo = []
+
+
+_STOP = object()
+
+
+class GroupCommitWriter:
+    def __init__(self, connect, max_batch=64, max_latency_ms=2, max_pending=1024, retry_after=1, timeout=10,
+                 prepare=None, max_keys=None):
+        self.connect = connect
+        self.prepare = prepare
+        self.max_keys = max_keys
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000
+        self.retry_after = retry_after
+        self.timeout = timeout
+        self._queue = queue.Queue(max_pending)
+        self._pid = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._current = None
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._ops = 0
+        self._failed_ops = 0
+        self._batches = 0
+        self._failed_batches = 0
+        self._rejected = 0
+        self._cancelled = 0
+        self._max_depth = 0
+        self._max_batch_seen = 0
+        self._wait_total = 0.0
+        self._commit_total = 0.0
+
+    def _ensure_started(self):
+        # 延迟到第一次使用时启动，保证写线程和写连接在 fork 之后的工作进程中创建
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self._queue.maxsize)
+            self._reset_stats()
+            self._thread = threading.Thread(target=self._loop, name='db-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, fn, keys=()):
+        """提交写操作，返回 Future；fn(cursor) 的返回值为结果"""
+        self._ensure_started()
+        op = _WriteOp(fn, keys)
+        try:
+            self._queue.put_nowait(op)
+        except queue.Full:
+            with self._stats_lock:
+                self._rejected += 1
+            raise WriterBusy(self.retry_after)
+        depth = self._queue.qsize()
+        if depth > self._max_depth:
+            self._max_depth = depth
+        return op.future
+
+    def run(self, fn, keys=()):
+        """提交写操作并等待提交完成，返回 fn(cursor) 的结果；fn 抛出的异常原样抛出"""
+        future = self.submit(fn, keys)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            if future.cancel():
+                raise WriterBusy(self.retry_after)
+            # 写线程已经取出该操作，等待本批结束，返回值与数据库中的结果一致
+            return future.result()
+
+    def on_rollback(self, callback):
+        """在写操作 fn 中调用：该操作的修改被回滚时调用 callback()"""
+        if self._current is None or threading.current_thread() is not self._thread:
+            raise RuntimeError('on_rollback 只能在写操作中调用')
+        self._current.undo.append(callback)
+
+    def _undo(self, op):
+        while op.undo:
+            callback = op.undo.pop()
+            try:
+                callback()
+            except Exception as e:
+                log.error('写操作回滚恢复失败', error=e)
+
+    def _open(self):
+        conn = self.connect()
+        # 自动提交模式，事务和保存点都由写线程显式控制
+        conn.isolation_level = None
+        return conn
+
+    def _start(self, op):
+        """标记操作开始执行；请求已超时取消的操作返回 False"""
+        if op.future.set_running_or_notify_cancel():
+            return True
+        with self._stats_lock:
+            self._cancelled += 1
+        return False
+
+    def _loop(self):
+        conn = self._open()
+        stopping = False
+        carry = None
+        while not stopping or carry is not None:
+            if carry is not None:
+                op, carry = carry, None
+            else:
+                op = self._queue.get()
+                if op is _STOP:
+                    break
+                if not self._start(op):
+                    continue
+            batch = [op]
+            keys = set(op.keys)
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch and not stopping:
+                remaining = deadline - time.monotonic()
+                try:
+                    op = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if op is _STOP:
+                    stopping = True
+                    break
+                if not self._start(op):
+                    continue
+                merged = keys | op.keys
+                if self.max_keys is not None and len(merged) > self.max_keys:
+                    carry = op
+                    break
+                keys = merged
+                batch.append(op)
+            try:
+                self._run_batch(conn, batch, keys)
+            except Exception as e:
+                # 连接本身出错（例如磁盘问题）时重新打开，避免后续所有写入都失败
+                log.error('写入批次异常', error=e, size=len(batch))
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+                conn = self._open()
+        conn.close()
+
+    def _run_batch(self, conn, batch, keys):
+        started = time.monotonic()
+        if self.prepare is not None:
+            try:
+                self.prepare(conn, keys)
+            except Exception as e:
+                for op in batch:
+                    op.error = e
+                self._finish(batch, started, failed=True)
+                return
+
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            cursor = conn.cursor()
+            for op in batch:
+                if op.error is not None:
+                    continue
+                cursor.execute('SAVEPOINT write_op')
+                self._current = op
+                try:
+                    op.result = op.fn(cursor)
+                except Exception as e:
+                    op.error = e
+                    self._undo(op)
+                    cursor.execute('ROLLBACK TO write_op')
+                finally:
+                    self._current = None
+                cursor.execute('RELEASE write_op')
+            conn.execute('COMMIT')
+        except Exception as e:
+            try:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+            except sqlite3.Error:
+                pass
+            for op in reversed(batch):
+                self._undo(op)
+            for op in batch:
+                if op.error is None:
+                    op.error = e
+            self._finish(batch, started, failed=True)
+            raise
+
+        self._finish(batch, started, failed=False)
+
+    def _finish(self, batch, started, failed):
+        now = time.monotonic()
+        failed_ops = 0
+        wait_total = 0.0
+        for op in batch:
+            wait_total += started - op.queued_at
+            if op.error is not None:
+                failed_ops += 1
+                op.future.set_exception(op.error)
+            else:
+                op.future.set_result(op.result)
+
+        with self._stats_lock:
+            self._ops += len(batch)
+            self._failed_ops += failed_ops
+            self._batches += 1
+            self._failed_batches += int(failed)
+            self._max_batch_seen = max(self._max_batch_seen, len(batch))
+            self._wait_total += wait_total
+            self._commit_total += now - started
+
+    def stats(self):
+        """队列深度、批次大小、排队和提交耗时等指标"""
+        with self._stats_lock:
+            batches = self._batches
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_depth,
+                'queue_capacity': self._queue.maxsize,
+                'ops': self._ops,
+                'failed_ops': self._failed_ops,
+                'rejected_ops': self._rejected,
+                'cancelled_ops': self._cancelled,
+                'batches': batches,
+                'failed_batches': self._failed_batches,
+                'avg_batch_size': round(self._ops / batches, 2) if batches else 0,
+                'max_batch_size': self._max_batch_seen,
+                'avg_queue_wait_ms': round(self._wait_total / self._ops * 1000, 3) if self._ops else 0,
+                'avg_batch_ms': round(self._commit_total / batches * 1000, 3) if batches else 0,
+                'max_batch': self.max_batch,
+                'max_latency_ms': self.max_latency * 1000
+            }
+
+    def close(self, timeout=5):
+        """处理完已排队的写操作后停止写线程（进程退出时调用）"""
+        if self._pid != os.getpid() or self._thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
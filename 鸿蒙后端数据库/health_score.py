@@ -0,0 +1,305 @@
+"""家庭成员健康指数（0-100 分）
+
+按最近 WINDOW_DAYS 天的 health_data 计算，分项及权重:
+    steps   30  步数完成度 min(steps / steps_goal, 1)
+    sleep   25  睡眠分数；没有睡眠分数时按睡眠时长（7-9 小时满分）
+    heart   15  静息心率（没有时用平均心率）在 45-80 之间满分
+    oxygen  15  平均血氧（没有时用当前血氧）95 以上满分
+    habit   15  入睡时间规律性（至少 3 晚），标准差 30 分钟以内满分
+每个分项取窗口内有效天数的平均值；超出合理范围的数值（0、默认值、录入错误）视为缺失，
+某个分项没有数据时其权重按比例分给其余分项。服药、久坐提醒响应等习惯目前没有记录，暂不计入。
+
+每批用户一次查询读入窗口内的行，按列转为 NumPy 数组，用 bincount 按用户分组求和，
+整批计算，不逐用户循环。结果写入 health_scores 表（每个用户每天一行）；
+窗口内没有有效数据的用户写入 score 为 NULL 的一行，表示今天已经计算过，读取接口不再重复提交计算。
+
+增量计算：写入 health_data 的接口在同一事务中调用 mark_dirty，
+读取分数时用 needs_refresh（只读）检查，再把 refresh_dirty 交给写线程，只重新计算被标记的用户；
+每天定时执行一次全量计算。
+
+命令行:
+    python health_score.py --all [数据库路径]     重新计算所有用户今天的分数（每天定时执行）
+    python health_score.py --dirty [数据库路径]   只重新计算被标记的用户
+"""
+import re
+import sys
+import time
+from datetime import date, timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+WINDOW_DAYS = 7
+# 每批计算的用户数（同时也是 IN 列表的长度，不超过 SQLite 的参数个数上限）
+BATCH_USERS = 500
+DEFAULT_STEPS_GOAL = 10000
+HABIT_MIN_NIGHTS = 3
+
+WEIGHTS = {'steps': 30, 'sleep': 25, 'heart': 15, 'oxygen': 15, 'habit': 15}
+COMPONENTS = tuple(WEIGHTS)
+
+_WINDOW_COLUMNS = '''
+    user_id, CAST(steps AS REAL), CAST(steps_goal AS REAL),
+    CAST(resting_heart_rate AS REAL), CAST(avg_heart_rate AS REAL),
+    CAST(avg_blood_oxygen AS REAL), CAST(current_blood_oxygen AS REAL),
+    CAST(sleep_score AS REAL), CAST(sleep_duration AS REAL), sleep_start_time
+'''
+_TIME_PATTERN = re.compile(r'(\d{1,2}):(\d{2})')
+
+# 查询语句（migrations --check 检查执行计划），{placeholders} 为一批用户的 IN 列表
+WINDOW_SQL = f'''
+    SELECT {_WINDOW_COLUMNS} FROM health_data
+    WHERE user_id IN ({{placeholders}}) AND record_date BETWEEN ? AND ?
+'''
+DIRTY_MARKS_SQL = 'SELECT user_id, version FROM health_score_dirty WHERE user_id IN ({placeholders})'
+SCORED_TODAY_SQL = 'SELECT user_id FROM health_scores WHERE score_date = ? AND user_id IN ({placeholders})'
+
+
+def available():
+    return np is not None
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError('缺少 numpy，请先执行: pip install numpy')
+
+
+def mark_dirty(cursor, user_id):
+    """标记用户的分数需要重新计算，与 health_data 的写入在同一事务中执行"""
+    cursor.execute('''
+        INSERT INTO health_score_dirty (user_id, version) VALUES (?, 1)
+        ON CONFLICT(user_id) DO UPDATE SET version = version + 1
+    ''', (user_id,))
+
+
+def _bedtime_minutes(value):
+    """入睡时间换算为距中午的分钟数（22:30 和 00:30 相差 120 分钟），无法解析时返回 nan"""
+    match = _TIME_PATTERN.search(value) if isinstance(value, str) else None
+    if match is None:
+        return np.nan
+    hour, minute = int(match.group(1)), int(match.group(2))
+    if hour > 23 or minute > 59:
+        return np.nan
+    return (hour * 60 + minute - 720) % 1440
+
+
+def _in_range(values, low, high):
+    return (values >= low) & (values <= high)
+
+
+def _plateau(values, zero_low, full_low, full_high, zero_high):
+    """[full_low, full_high] 之间为 1，向两侧线性降到 0，nan 保持 nan"""
+    rising = (values - zero_low) / (full_low - zero_low)
+    falling = (zero_high - values) / (zero_high - full_high)
+    return np.clip(np.minimum(rising, falling), 0.0, 1.0)
+
+
+def _group_mean(inverse, values, count):
+    """按用户求 values 中非 nan 元素的平均值，没有有效值的用户为 nan"""
+    valid = ~np.isnan(values)
+    total = np.bincount(inverse, weights=np.where(valid, values, 0.0), minlength=count)
+    n = np.bincount(inverse, weights=valid, minlength=count)
+    return np.divide(total, n, out=np.full(count, np.nan), where=n > 0), n
+
+
+def compute_scores(rows):
+    """由 health_data 窗口内的行批量计算分数
+
+    返回 (user_ids, scores, parts, days)：scores 为总分，parts 为 (分项数, 用户数) 的 0-100 分项得分，
+    days 为窗口内有记录的天数；没有任何有效数据的用户总分为 nan
+    """
+    _require_numpy()
+    if not rows:
+        empty = np.zeros(0)
+        return np.zeros(0, dtype=np.int64), empty, np.zeros((len(COMPONENTS), 0)), np.zeros(0, dtype=np.int64)
+
+    columns = list(zip(*rows))
+    user_ids, inverse = np.unique(np.array(columns[0], dtype=np.int64), return_inverse=True)
+    count = len(user_ids)
+    (steps, steps_goal, resting_heart, avg_heart,
+     avg_oxygen, current_oxygen, sleep_score, sleep_minutes) = np.array(columns[1:9], dtype=float)
+    bedtime = np.array([_bedtime_minutes(value) for value in columns[9]], dtype=float)
+
+    steps_goal = np.where(steps_goal > 0, steps_goal, DEFAULT_STEPS_GOAL)
+    heart = np.where(_in_range(resting_heart, 30, 220), resting_heart, avg_heart)
+    heart = np.where(_in_range(heart, 30, 220), heart, np.nan)
+    oxygen = np.where(_in_range(avg_oxygen, 70, 100), avg_oxygen, current_oxygen)
+    oxygen = np.where(_in_range(oxygen, 70, 100), oxygen, np.nan)
+    sleep_by_duration = np.where(sleep_minutes > 0, _plateau(sleep_minutes, 180, 420, 540, 780), np.nan)
+
+    daily = {
+        'steps': np.where(steps > 0, np.minimum(steps / steps_goal, 1.0), np.nan),
+        'sleep': np.where(_in_range(sleep_score, 1, 100), sleep_score / 100, sleep_by_duration),
+        'heart': _plateau(heart, 30, 45, 80, 110),
+        'oxygen': np.clip((oxygen - 88) / 7, 0.0, 1.0),
+    }
+    parts = {name: _group_mean(inverse, values, count)[0] for name, values in daily.items()}
+
+    # 入睡时间的标准差：E[x²] - E[x]²
+    mean, nights = _group_mean(inverse, bedtime, count)
+    mean_square, _ = _group_mean(inverse, bedtime * bedtime, count)
+    spread = np.sqrt(np.maximum(mean_square - mean * mean, 0.0))
+    parts['habit'] = np.where(nights >= HABIT_MIN_NIGHTS, np.clip((120 - spread) / 90, 0.0, 1.0), np.nan)
+
+    matrix = np.vstack([parts[name] for name in COMPONENTS])
+    weights = np.array([WEIGHTS[name] for name in COMPONENTS], dtype=float)[:, None]
+    present = ~np.isnan(matrix)
+    weight_sum = (weights * present).sum(axis=0)
+    weighted = (weights * np.where(present, matrix, 0.0)).sum(axis=0)
+    scores = np.divide(weighted * 100, weight_sum, out=np.full(count, np.nan), where=weight_sum > 0)
+    days = np.bincount(inverse, minlength=count)
+    return user_ids, scores, matrix * 100, days
+
+
+def _window(score_date, window_days):
+    end = score_date if isinstance(score_date, date) else date.fromisoformat(score_date)
+    return (end - timedelta(days=window_days - 1)).isoformat(), end.isoformat()
+
+
+def _chunks(items, size=BATCH_USERS):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def load_window(conn, user_ids, start, end):
+    """读取一批用户在 [start, end] 内的 health_data（按 (user_id, record_date) 索引逐个用户范围查找）"""
+    placeholders = ','.join('?' * len(user_ids))
+    return conn.execute(WINDOW_SQL.format(placeholders=placeholders), (*user_ids, start, end)).fetchall()
+
+
+def _round(value):
+    return None if value != value else round(float(value), 1)
+
+
+def save_scores(cursor, score_date, result, checked=()):
+    """写入计算结果；checked 中没有分数的用户写入 score 为 NULL 的一行
+
+    返回分数有变化的条数（新写入的空分数不计入，原有分数被清空的计入）
+    """
+    user_ids, scores, parts, days = result
+    rows = [
+        (int(user_id), score_date, _round(score), *(_round(part) for part in parts[:, i]), int(days[i]))
+        for i, (user_id, score) in enumerate(zip(user_ids, scores))
+        if score == score
+    ]
+    scored = {row[0] for row in rows}
+    empty = [(int(user_id), score_date) for user_id in checked if int(user_id) not in scored]
+    cursor.executemany('''
+        INSERT INTO health_scores
+            (user_id, score_date, score, score_steps, score_sleep, score_heart, score_oxygen, score_habit,
+             days_with_data, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(user_id, score_date) DO UPDATE SET
+            score = excluded.score,
+            score_steps = excluded.score_steps,
+            score_sleep = excluded.score_sleep,
+            score_heart = excluded.score_heart,
+            score_oxygen = excluded.score_oxygen,
+            score_habit = excluded.score_habit,
+            days_with_data = excluded.days_with_data,
+            updated_at = CURRENT_TIMESTAMP
+    ''', rows)
+    if not empty:
+        return len(rows)
+    cursor.executemany('''
+        UPDATE health_scores
+        SET score = NULL, score_steps = NULL, score_sleep = NULL, score_heart = NULL, score_oxygen = NULL,
+            score_habit = NULL, days_with_data = 0, updated_at = CURRENT_TIMESTAMP
+        WHERE user_id = ? AND score_date = ? AND score IS NOT NULL
+    ''', empty)
+    cleared = max(cursor.rowcount, 0)
+    cursor.executemany(
+        'INSERT OR IGNORE INTO health_scores (user_id, score_date, days_with_data) VALUES (?, ?, 0)', empty
+    )
+    return len(rows) + cleared
+
+
+def _score_users(conn, user_ids, score_date, window_days):
+    """分批计算并写入，返回分数有变化的条数"""
+    start, end = _window(score_date, window_days)
+    saved = 0
+    for batch in _chunks(user_ids):
+        result = compute_scores(load_window(conn, batch, start, end))
+        saved += save_scores(conn.cursor(), end, result, batch)
+    return saved
+
+
+def _clear_marks(conn, marks):
+    """只清除计算前读到的版本，计算期间又有写入的用户保留标记"""
+    conn.executemany('DELETE FROM health_score_dirty WHERE user_id = ? AND version = ?', marks.items())
+
+
+def recompute_all(conn, score_date=None, window_days=WINDOW_DAYS):
+    """全量计算所有用户 score_date（默认今天）的分数，返回写入的分数条数"""
+    _require_numpy()
+    score_date = score_date or date.today()
+    marks = dict(conn.execute('SELECT user_id, version FROM health_score_dirty').fetchall())
+    user_ids = [row[0] for row in conn.execute('SELECT id FROM users ORDER BY id')]
+    saved = _score_users(conn, user_ids, score_date, window_days)
+    _clear_marks(conn, marks)
+    conn.commit()
+    return saved
+
+
+def _targets(conn, user_ids, score_date):
+    """返回 (标记版本, 需要计算的用户)：被标记的用户，以及今天还没有分数的用户"""
+    marks = {}
+    targets = set()
+    for batch in _chunks(set(user_ids)):
+        placeholders = ','.join('?' * len(batch))
+        marks.update(conn.execute(DIRTY_MARKS_SQL.format(placeholders=placeholders), batch).fetchall())
+        scored = {row[0] for row in conn.execute(
+            SCORED_TODAY_SQL.format(placeholders=placeholders), (score_date, *batch)
+        )}
+        targets.update(user_id for user_id in batch if user_id not in scored)
+    targets.update(marks)
+    return marks, targets
+
+
+def needs_refresh(conn, user_ids, score_date=None):
+    """user_ids 中需要重新计算的用户（只读，读取接口用来决定是否提交 refresh_dirty）"""
+    return _targets(conn, user_ids, (score_date or date.today()).isoformat())[1]
+
+
+def refresh_dirty(cursor, user_ids=None, score_date=None, window_days=WINDOW_DAYS):
+    """重新计算被标记的用户；指定 user_ids 时只处理这些用户，其中今天还没有分数的也一并计算
+
+    在调用方的事务中写入，不提交；返回写入的分数条数
+    """
+    _require_numpy()
+    conn = cursor.connection
+    score_date = (score_date or date.today()).isoformat()
+    if user_ids is None:
+        marks = dict(conn.execute('SELECT user_id, version FROM health_score_dirty').fetchall())
+        targets = set(marks)
+    else:
+        marks, targets = _targets(conn, user_ids, score_date)
+
+    if not targets:
+        return 0
+    saved = _score_users(conn, sorted(targets), score_date, window_days)
+    _clear_marks(conn, marks)
+    return saved
+
+
+if __name__ == '__main__':
+    import sqlite3
+
+    commands = {'--all', '--dirty'}
+    command = next((a for a in sys.argv[1:] if a in commands), None)
+    if command is None:
+        raise SystemExit('用法: python health_score.py --all|--dirty [数据库路径]')
+    args = [a for a in sys.argv[1:] if a not in commands]
+
+    db = sqlite3.connect(args[0] if args else 'health_app.db')
+    started = time.monotonic()
+    if command == '--all':
+        count = recompute_all(db)
+    else:
+        count = refresh_dirty(db.cursor())
+        db.commit()
+    print(f'已计算 {count} 个用户的健康指数，用时 {time.monotonic() - started:.2f} 秒')
+    db.close()
@@ -0,0 +1,51 @@
+"""流式 JSON 响应
+
+大范围的历史查询不再一次性 fetchall + jsonify，而是用 fetchmany 分批读取游标，
+逐段写出 JSON 数组（chunked 传输），内存占用与请求的时间范围无关，首字节也更早返回。
+
+响应结构与普通接口一致: {"data": [...], ..., "success": true}
+数组在前、success 在最后，数据读取中途出错时仍能返回合法的 JSON（success=false + message）。
+"""
+import json
+
+from log_utils import get_logger
+
+log = get_logger('json_stream')
+
+
+def iter_rows(cursor, batch_size=500):
+    """用 fetchmany 分批遍历游标，逐行返回字典"""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        for row in rows:
+            yield dict(row)
+
+
+def encode(items, key='data', envelope=None, dumps=json.dumps, chunk_size=500):
+    """把 items 编码为 {key: [...], **envelope, success} 的 JSON 片段序列，每 chunk_size 条输出一次"""
+    yield '{' + dumps(key) + ': ['
+
+    buffer = []
+    count = 0
+    error = None
+    try:
+        for item in items:
+            buffer.append(dumps(item))
+            count += 1
+            if len(buffer) >= chunk_size:
+                yield (', ' if count > len(buffer) else '') + ', '.join(buffer)
+                buffer = []
+    except Exception as e:
+        error = e
+        log.error('流式输出数据失败', key=key, written=count, error=e)
+
+    if buffer:
+        yield (', ' if count > len(buffer) else '') + ', '.join(buffer)
+
+    trailer = dict(envelope or {})
+    trailer['success'] = error is None
+    if error is not None:
+        trailer['message'] = f'获取失败: {str(error)}'
+    yield '], ' + dumps(trailer)[1:]
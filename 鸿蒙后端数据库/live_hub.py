@@ -0,0 +1,219 @@
+"""家庭成员健康数据实时推送（发布 / 订阅）
+
+写接口提交后调用 publish(user_id, event)，事件按用户分发给订阅了该用户的所有 SSE 连接，
+查看家人数据的页面不再需要定时轮询 /api/realtime-data 和 /api/overview。
+
+每个订阅有独立的有界队列，消费慢的连接只会丢弃自己的事件，不会阻塞发布方。
+每个订阅在 SSE 连接结束前占用一个工作线程，设置 slots（long_requests.LongRequestSlots）时
+订阅还要占用一个长连接名额，连接数不会超过线程数允许的范围。
+
+多进程部署时传入 broker（UnixDatagramBroker，目录为 LIVE_BROKER_DIR）：每个进程在该目录下绑定一个
+Unix 数据报套接字，发布时把事件同时发送给目录中其他进程的套接字，由各进程的接收线程转发给本地订阅者。
+broker 按频道分发消息，实时推送使用 live 频道，雷达配对的唤醒（radar.DbRadarStore）使用 radar 频道。
+发送使用非阻塞套接字：其他进程的接收队列已满时丢弃该消息并计数，不阻塞发布请求；
+超过 MAX_DATAGRAM_SIZE 的消息不转发并记录警告，较大的事件由发布方拆分（见 app.publish_live_samples）。
+"""
+import json
+import os
+import queue
+import socket
+import threading
+import time
+
+from log_utils import get_logger
+
+# 单个数据报的大小上限，超过时只在本进程内分发
+MAX_DATAGRAM_SIZE = 64 * 1024
+
+log = get_logger('live_hub')
+
+
+class HubFull(Exception):
+    """订阅连接数已达上限"""
+
+    def __init__(self, retry_after):
+        super().__init__('实时推送连接数已满')
+        self.retry_after = retry_after
+
+
+class Subscription:
+    def __init__(self, user_ids, max_queue):
+        self.user_ids = frozenset(user_ids)
+        self.dropped = 0
+        self.closed = False
+        self._queue = queue.Queue(max_queue)
+
+    def offer(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def get(self, timeout):
+        """等待下一个事件，超时返回 None"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class UnixDatagramBroker:
+    """同一台机器上多个工作进程之间转发消息，消息为 [频道, 内容]，由 subscribe 登记的函数处理"""
+
+    def __init__(self, directory, peers_ttl=1.0):
+        self.directory = directory
+        self.peers_ttl = peers_ttl
+        self._handlers = {}
+        self.dropped = 0
+        self._pid = None
+        self._sock = None
+        self._send_sock = None
+        self._path = None
+        self._peers = []
+        self._peers_at = 0
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        # 延迟到第一次使用时启动，保证在 fork 之后的工作进程中绑定套接字和启动线程
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{os.getpid()}.sock')
+            if os.path.exists(path):
+                os.unlink(path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(path)
+            # 接收线程阻塞读取绑定的套接字，发送使用单独的非阻塞套接字
+            send_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            send_sock.setblocking(False)
+            self._sock, self._send_sock, self._path, self._pid = sock, send_sock, path, os.getpid()
+            self._peers_at = 0
+            threading.Thread(target=self._receive_loop, args=(sock,), name='live-broker', daemon=True).start()
+
+    def _receive_loop(self, sock):
+        while True:
+            try:
+                data = sock.recv(MAX_DATAGRAM_SIZE)
+                channel, payload = json.loads(data)
+                handler = self._handlers.get(channel)
+                if handler is not None:
+                    handler(payload)
+            except OSError:
+                return
+            except Exception:
+                continue
+
+    def _peer_paths(self):
+        now = time.monotonic()
+        if now - self._peers_at > self.peers_ttl:
+            self._peers = [
+                os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                if name.endswith('.sock') and os.path.join(self.directory, name) != self._path
+            ]
+            self._peers_at = now
+        return self._peers
+
+    def subscribe(self, channel, handler):
+        """其他进程发到 channel 的消息交给 handler(内容) 处理（在接收线程中调用）"""
+        self._handlers[channel] = handler
+
+    def start(self):
+        self._ensure_started()
+
+    def send(self, channel, payload):
+        """发送给其他进程（不包括本进程）"""
+        self._ensure_started()
+        data = json.dumps([channel, payload], ensure_ascii=False).encode('utf-8')
+        if len(data) > MAX_DATAGRAM_SIZE:
+            log.warning('消息过大，未转发到其他进程', channel=channel, size=len(data))
+            return
+        for path in self._peer_paths():
+            try:
+                self._send_sock.sendto(data, path)
+            except BlockingIOError:
+                # 对方接收队列已满，丢弃本条消息，不阻塞发布方
+                self.dropped += 1
+                if self.dropped % 100 == 1:
+                    log.warning('进程间消息队列已满，丢弃消息', channel=channel, dropped=self.dropped)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # 对应的进程已退出，清理残留的套接字文件
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+                self._peers_at = 0
+            except OSError:
+                pass
+
+    def close(self):
+        if self._pid == os.getpid() and self._sock is not None:
+            self._sock.close()
+            self._send_sock.close()
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+            self._pid = None
+
+
+class LiveHub:
+    def __init__(self, max_subscribers=64, max_queue=256, broker=None, retry_after=5, slots=None):
+        self.max_subscribers = max_subscribers
+        self.slots = slots
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._topics = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._broker = broker
+        if broker is not None:
+            broker.subscribe('live', lambda payload: self._deliver(*payload))
+
+    def subscribe(self, user_ids):
+        if self._broker is not None:
+            self._broker.start()
+        subscription = Subscription([int(u) for u in user_ids], self.max_queue)
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise HubFull(self.retry_after)
+            if self.slots is not None and not self.slots.try_acquire():
+                raise HubFull(self.retry_after)
+            self._count += 1
+            for user_id in subscription.user_ids:
+                self._topics.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """释放订阅（重复调用无影响）"""
+        with self._lock:
+            if subscription.closed:
+                return
+            subscription.closed = True
+            self._count -= 1
+            if self.slots is not None:
+                self.slots.release()
+            for user_id in subscription.user_ids:
+                subscribers = self._topics.get(user_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._topics[user_id]
+
+    def subscriber_count(self):
+        return self._count
+
+    def _deliver(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._topics.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.offer(event)
+
+    def publish(self, user_id, event):
+        """分发给本进程的订阅者，并通过 broker 转发给其他进程"""
+        user_id = int(user_id)
+        self._deliver(user_id, event)
+        if self._broker is not None:
+            self._broker.send('live', [user_id, event])
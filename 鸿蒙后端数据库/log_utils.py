@@ -0,0 +1,138 @@
+"""结构化日志
+
+请求线程只把日志记录放进队列，由后台线程统一格式化并写出，避免同步 stdout 写入拖慢请求。
+日志以 key=value 形式输出，便于检索。
+
+环境变量:
+    LOG_LEVEL         全局日志级别，默认 INFO（逐条/逐行的诊断日志为 DEBUG，默认不输出）
+    LOG_SAMPLE_RATES  按路由采样 INFO 及以下级别的日志，如 "save_realtime_data=0.01,get_realtime_data=0.1"
+                      WARNING 及以上级别不采样
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime
+
+from flask import has_request_context, request
+
+ROOT_LOGGER_NAME = 'double_u'
+
+_listener = None
+
+
+class KeyValueFormatter(logging.Formatter):
+    """[时间] 级别 route=路由 消息 key=value ..."""
+
+    def format(self, record):
+        parts = [
+            f"[{datetime.fromtimestamp(record.created)}]",
+            record.levelname
+        ]
+        route = getattr(record, 'route', None)
+        if route:
+            parts.append(f"route={route}")
+        parts.append(record.getMessage())
+        for key, value in getattr(record, 'fields', {}).items():
+            value = str(value)
+            if not value or ' ' in value or '=' in value:
+                value = '"' + value.replace('"', '\\"') + '"'
+            parts.append(f"{key}={value}")
+        line = ' '.join(parts)
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class RouteSamplingFilter(logging.Filter):
+    """在请求线程上附加路由名，并按路由对低级别日志采样"""
+
+    def __init__(self, sample_rates=None):
+        super().__init__()
+        self.sample_rates = sample_rates or {}
+
+    def filter(self, record):
+        route = None
+        if has_request_context():
+            route = request.endpoint
+        record.route = route
+
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.sample_rates.get(route)
+        if rate is None:
+            return True
+        return random.random() < rate
+
+
+class StructLogger(logging.LoggerAdapter):
+    """log.info('消息', user_id=1, value=80) 形式的结构化日志"""
+
+    _RESERVED = ('exc_info', 'stack_info', 'stacklevel', 'extra')
+
+    def process(self, msg, kwargs):
+        fields = {k: kwargs.pop(k) for k in list(kwargs) if k not in self._RESERVED}
+        extra = dict(kwargs.get('extra') or {})
+        extra['fields'] = fields
+        kwargs['extra'] = extra
+        return msg, kwargs
+
+
+def parse_sample_rates(text):
+    rates = {}
+    for item in (text or '').split(','):
+        if '=' not in item:
+            continue
+        route, rate = item.split('=', 1)
+        rates[route.strip()] = float(rate)
+    return rates
+
+
+def setup_logging(level=None, sample_rates=None, stream=None):
+    """配置队列日志，重复调用时只重启后台写线程（fork 出的子进程需要重新调用）"""
+    global _listener
+
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except Exception:
+            pass
+
+    level = level or os.environ.get('LOG_LEVEL', 'INFO')
+    if sample_rates is None:
+        sample_rates = parse_sample_rates(os.environ.get('LOG_SAMPLE_RATES'))
+
+    output_handler = logging.StreamHandler(stream or sys.stdout)
+    output_handler.setFormatter(KeyValueFormatter())
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, output_handler)
+    _listener.start()
+
+    # 过滤器挂在 QueueHandler 上，在请求线程中执行（logger 上的过滤器不作用于子 logger）
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RouteSamplingFilter(sample_rates))
+
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    root.propagate = False
+    root.handlers = [queue_handler]
+
+
+def stop_logging():
+    """写出队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+def get_logger(name=None):
+    full_name = f"{ROOT_LOGGER_NAME}.{name}" if name else ROOT_LOGGER_NAME
+    return StructLogger(logging.getLogger(full_name), {})
@@ -0,0 +1,31 @@
+"""长连接请求（SSE 推送、雷达长轮询等待）占用的工作线程名额
+
+gunicorn gthread 下，每个长连接在结束前一直占用一个工作线程（SSE 最长 LIVE_STREAM_MAX_SECONDS，
+雷达等待最长 RADAR_WAIT_MAX_SECONDS）。长连接数量只按各自的配置限制时，很容易超过线程数，
+线程被占满后普通请求（包括健康检查）只能排队直到超时。
+
+这里按每个进程的线程数（SERVE_THREADS）计算长连接可用的名额，至少保留一半线程给普通请求:
+    threads  1  2  4  8  16
+    名额     0  1  2  4  8
+SSE 订阅和雷达等待共用这些名额，名额用完时返回 503 + Retry-After，由客户端稍后重连。
+"""
+import threading
+
+
+def slots_for_threads(threads):
+    """threads 个工作线程中可以给长连接使用的数量"""
+    return max(0, threads - max(1, (threads + 1) // 2))
+
+
+class LongRequestSlots:
+    def __init__(self, threads):
+        self.threads = threads
+        self.size = slots_for_threads(threads)
+        self._semaphore = threading.BoundedSemaphore(self.size) if self.size else None
+
+    def try_acquire(self):
+        """不等待地占用一个名额，没有空闲名额时返回 False"""
+        return self._semaphore is not None and self._semaphore.acquire(blocking=False)
+
+    def release(self):
+        self._semaphore.release()
@@ -0,0 +1,587 @@
+"""数据库版本迁移
+
+用 PRAGMA user_version 记录当前 schema 版本，启动时按顺序执行尚未应用的迁移，
+每个迁移在独立事务中执行，已有数据的线上库可以安全升级。
+
+命令行:
+    python migrations.py [数据库路径]            执行迁移
+    python migrations.py --check [数据库路径]    检查热点查询的执行计划，出现全表扫描时返回非 0
+"""
+import sqlite3
+import sys
+
+import availability
+import health_score
+import queries
+import radar
+import ranking
+import realtime_store
+import trends
+from log_utils import setup_logging, get_logger
+
+log = get_logger('migrations')
+
+
+def _create_base_tables(cursor):
+    """基础表结构（与早期 init_database 中的建表语句一致）"""
+    # 修改users表创建语句，直接包含avatar_url字段, 用于存储用户头像URL
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            phone TEXT UNIQUE NOT NULL,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            avatar_url TEXT DEFAULT '',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 家庭成员关系表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS family_members (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            member_id INTEGER NOT NULL,
+            relationship_name TEXT DEFAULT '家庭成员',
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status INTEGER DEFAULT 1,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (member_id) REFERENCES users (id),
+            UNIQUE(user_id, member_id)
+        )
+    ''')
+
+    # 面对面加成员临时表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS friend_radar (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            radar_code TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    # 在现有的users表创建语句后添加
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS health_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            record_date TEXT NOT NULL,
+            steps INTEGER DEFAULT 0,
+            steps_goal INTEGER DEFAULT 10000,
+            distance REAL DEFAULT 0,
+            calories_burned REAL DEFAULT 0,
+            current_heart_rate INTEGER DEFAULT 0,
+            resting_heart_rate INTEGER DEFAULT 0,
+            min_heart_rate INTEGER DEFAULT 0,
+            avg_heart_rate INTEGER DEFAULT 0,
+            max_heart_rate INTEGER DEFAULT 0,
+            current_blood_oxygen INTEGER DEFAULT 0,
+            min_blood_oxygen INTEGER DEFAULT 0,
+            avg_blood_oxygen INTEGER DEFAULT 0,
+            max_blood_oxygen INTEGER DEFAULT 0,
+            sleep_score INTEGER DEFAULT 0,
+            sleep_duration INTEGER DEFAULT 0,
+            sleep_start_time TEXT DEFAULT '',
+            sleep_end_time TEXT DEFAULT '',
+            deep_sleep_duration INTEGER DEFAULT 0,
+            light_sleep_duration INTEGER DEFAULT 0,
+            rem_sleep_duration INTEGER DEFAULT 0,
+            awake_duration INTEGER DEFAULT 0,
+            active_calories REAL DEFAULT 0,
+            calories_goal REAL DEFAULT 8000,
+            basic_metabolism_calories REAL DEFAULT 0,
+            current_mood INTEGER DEFAULT -1,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            UNIQUE(user_id, record_date)
+        )
+    ''')
+
+    # 实时数据表（用于存储实时健康数据）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS realtime_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            record_date TEXT NOT NULL,
+            time_stamp TEXT NOT NULL,
+            data_type TEXT NOT NULL,
+            value REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            UNIQUE(user_id, record_date, time_stamp, data_type)
+        )
+    ''')
+
+    # 用户积分表（主要表）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_points (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            total_points INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            UNIQUE(user_id)
+        )
+    ''')
+
+    # 积分记录表（用于历史追踪）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS points_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            points INTEGER NOT NULL,
+            source_type TEXT NOT NULL,
+            source_data TEXT,
+            record_date TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+
+def _create_steps_records(cursor):
+    """每日步数记录表（/api/steps-record 与 /api/steps-history 使用）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS steps_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            steps INTEGER NOT NULL,
+            points_earned INTEGER NOT NULL,
+            record_date TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            UNIQUE(user_id, record_date)
+        )
+    ''')
+
+
+def _create_hot_query_indexes(cursor):
+    """热点查询的二级索引"""
+    # 按类型查询实时数据：user_id + data_type 等值，record_date 范围，time_stamp 排序
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_realtime_user_type_date_ts
+        ON realtime_data (user_id, data_type, record_date, time_stamp)
+    ''')
+    # 步数排行榜：按日期取当天所有记录
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_health_date_steps
+        ON health_data (record_date, steps)
+    ''')
+    # 积分排行榜
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_points_total
+        ON user_points (total_points)
+    ''')
+    # 积分历史按用户查询
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_points_history_user_date
+        ON points_history (user_id, record_date)
+    ''')
+    # 面对面加好友按雷达码匹配、按过期时间清理
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_friend_radar_code
+        ON friend_radar (radar_code)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_friend_radar_expires
+        ON friend_radar (expires_at)
+    ''')
+
+
+def _create_daily_steps_leaderboard(cursor):
+    """每日步数排行榜，写入步数时增量维护，读取排行时不再扫描 users / health_data"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_steps_leaderboard (
+            record_date TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            steps INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (record_date, user_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_daily_steps_rank
+        ON daily_steps_leaderboard (record_date, steps DESC, username)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_daily_steps_user
+        ON daily_steps_leaderboard (user_id)
+    ''')
+    # 用已有的 health_data 回填（历史数据中的日期可能带引号，统一去掉）
+    cursor.execute('''
+        INSERT OR REPLACE INTO daily_steps_leaderboard (record_date, user_id, username, steps)
+        SELECT TRIM(h.record_date, "'"), h.user_id, u.username, COALESCE(h.steps, 0)
+        FROM health_data h
+        JOIN users u ON h.user_id = u.id
+    ''')
+
+
+def _create_realtime_rollups(cursor):
+    """实时数据的小时 / 天汇总表，写入样本时增量维护"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS realtime_rollup_hourly (
+            user_id INTEGER NOT NULL,
+            data_type TEXT NOT NULL,
+            record_date TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            min_value REAL,
+            avg_value REAL,
+            max_value REAL,
+            sum_value REAL,
+            sample_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, data_type, record_date, bucket)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS realtime_rollup_daily (
+            user_id INTEGER NOT NULL,
+            data_type TEXT NOT NULL,
+            record_date TEXT NOT NULL,
+            min_value REAL,
+            avg_value REAL,
+            max_value REAL,
+            sum_value REAL,
+            sample_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, data_type, record_date)
+        ) WITHOUT ROWID
+    ''')
+    # 用已有的原始样本回填
+    cursor.execute('''
+        INSERT OR REPLACE INTO realtime_rollup_hourly
+            (user_id, data_type, record_date, bucket, min_value, avg_value, max_value, sum_value, sample_count)
+        SELECT user_id, data_type, record_date, SUBSTR(time_stamp, 1, 13) || ':00',
+               MIN(value), AVG(value), MAX(value), SUM(value), COUNT(*)
+        FROM realtime_data
+        GROUP BY user_id, data_type, record_date, SUBSTR(time_stamp, 1, 13)
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO realtime_rollup_daily
+            (user_id, data_type, record_date, min_value, avg_value, max_value, sum_value, sample_count)
+        SELECT user_id, data_type, record_date, MIN(min_value), SUM(sum_value) / SUM(sample_count),
+               MAX(max_value), SUM(sum_value), SUM(sample_count)
+        FROM realtime_rollup_hourly
+        GROUP BY user_id, data_type, record_date
+    ''')
+
+
+def _create_realtime_packed(cursor):
+    """实时样本的定长数组存储（REALTIME_STORAGE=packed 时使用）
+
+    slots 为 1440 个小端 float32（每分钟一个槽位），present 为 180 字节的存在位图。
+    需要 rowid 才能使用增量 BLOB I/O，所以不用 WITHOUT ROWID
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS realtime_packed (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            record_date TEXT NOT NULL,
+            data_type TEXT NOT NULL,
+            slots BLOB NOT NULL,
+            present BLOB NOT NULL,
+            UNIQUE(user_id, record_date, data_type)
+        )
+    ''')
+
+
+def _add_radar_matched_user(cursor):
+    """雷达配对结果（RADAR_STORE=db 时先加入的一方通过该字段得知配对对象）"""
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(friend_radar)').fetchall()]
+    if 'matched_user_id' not in columns:
+        cursor.execute('ALTER TABLE friend_radar ADD COLUMN matched_user_id INTEGER')
+
+
+def _create_health_scores(cursor):
+    """健康指数（见 health_score），每个用户每天一行；health_score_dirty 记录需要重新计算的用户
+
+    version 在每次标记时递增，计算完成后只删除计算前读到的版本，避免漏掉计算期间的写入
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS health_scores (
+            user_id INTEGER NOT NULL,
+            score_date TEXT NOT NULL,
+            score REAL NOT NULL,
+            score_steps REAL,
+            score_sleep REAL,
+            score_heart REAL,
+            score_oxygen REAL,
+            score_habit REAL,
+            days_with_data INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, score_date)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS health_score_dirty (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+
+
+def _create_alerts(cursor):
+    """实时数据异常告警（见 anomaly），只在检测到异常时写入"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            data_type TEXT NOT NULL,
+            alert_type TEXT NOT NULL,
+            value REAL NOT NULL,
+            baseline REAL,
+            record_date TEXT NOT NULL,
+            time_stamp TEXT NOT NULL,
+            message TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_alerts_user
+        ON alerts (user_id, id)
+    ''')
+
+
+def _create_health_trends(cursor):
+    """健康数据周趋势汇总（见 trends），每个 (用户, 指标) 一行，读取时按需生成，不需要回填"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS health_trends (
+            user_id INTEGER NOT NULL,
+            metric TEXT NOT NULL,
+            window_end TEXT NOT NULL,
+            current_sum REAL,
+            current_days INTEGER NOT NULL DEFAULT 0,
+            previous_sum REAL,
+            previous_days INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, metric)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _create_points_daily(cursor):
+    """每个用户每天获得的积分，与 points_history 在同一事务中维护，按天 / 周 / 月排行时只汇总该表"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS points_daily (
+            record_date TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            points INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (record_date, user_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_points_daily_user
+        ON points_daily (user_id, record_date)
+    ''')
+    # 用已有的积分历史回填（历史数据中的日期可能带引号，统一去掉）
+    cursor.execute('''
+        INSERT OR REPLACE INTO points_daily (record_date, user_id, points)
+        SELECT TRIM(record_date, "'"), user_id, SUM(points)
+        FROM points_history
+        GROUP BY TRIM(record_date, "'"), user_id
+    ''')
+
+
+def _allow_null_health_score(cursor):
+    """窗口内没有数据的用户也写入一行（score 为 NULL），表示今天已经计算过，读取时不再重复提交计算"""
+    cursor.execute('ALTER TABLE health_scores RENAME TO health_scores_old')
+    cursor.execute('''
+        CREATE TABLE health_scores (
+            user_id INTEGER NOT NULL,
+            score_date TEXT NOT NULL,
+            score REAL,
+            score_steps REAL,
+            score_sleep REAL,
+            score_heart REAL,
+            score_oxygen REAL,
+            score_habit REAL,
+            days_with_data INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, score_date)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('INSERT INTO health_scores SELECT * FROM health_scores_old')
+    cursor.execute('DROP TABLE health_scores_old')
+
+
+def _create_rollup_date_indexes(cursor):
+    """不指定类型查询汇总数据时按日期倒序读取，不需要对整个范围排序"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_rollup_hourly_user_date
+        ON realtime_rollup_hourly (user_id, record_date, bucket)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_rollup_daily_user_date
+        ON realtime_rollup_daily (user_id, record_date)
+    ''')
+
+
+# (版本号, 说明, 迁移函数)，只能在末尾追加，不要修改已发布的迁移
+MIGRATIONS = [
+    (1, '基础表结构', _create_base_tables),
+    (2, '每日步数记录表', _create_steps_records),
+    (3, '热点查询索引', _create_hot_query_indexes),
+    (4, '每日步数排行榜', _create_daily_steps_leaderboard),
+    (5, '实时数据小时/天汇总', _create_realtime_rollups),
+    (6, '实时数据定长数组存储', _create_realtime_packed),
+    (7, '雷达配对结果字段', _add_radar_matched_user),
+    (8, '健康指数', _create_health_scores),
+    (9, '实时数据异常告警', _create_alerts),
+    (10, '健康数据周趋势', _create_health_trends),
+    (11, '每日积分汇总', _create_points_daily),
+    (12, '健康指数允许空分数', _allow_null_health_score),
+    (13, '实时数据汇总按日期索引', _create_rollup_date_indexes),
+]
+
+
+def migrate(conn):
+    """执行所有未应用的迁移，返回迁移后的版本号"""
+    current_version = conn.execute('PRAGMA user_version').fetchone()[0]
+
+    for version, description, step in MIGRATIONS:
+        if version <= current_version:
+            continue
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            step(cursor)
+            cursor.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        current_version = version
+        log.info('数据库迁移完成', version=version, description=description)
+
+    conn.execute('PRAGMA optimize')
+    return current_version
+
+
+# 各路由的热点查询，参数只用于生成执行计划；SQL 与接口共用同一份常量（queries 及各模块中定义）
+# allow_scan=True 表示已知需要全表扫描的查询
+_FAMILY_COLUMNS = 'h.steps, h.current_heart_rate, h.current_blood_oxygen, h.sleep_score, h.current_mood'
+_REALTIME_MAIN = {'schema': 'main', 'type_clause': ''}
+_REALTIME_MAIN_BY_TYPE = {'schema': 'main', 'type_clause': realtime_store.TYPE_FILTER}
+
+HOT_QUERIES = [
+    ('login_by_phone', queries.LOGIN_BY_PHONE, ('',), False),
+    ('login_by_username', queries.LOGIN_BY_USERNAME, ('',), False),
+    ('overview', queries.OVERVIEW, (0, ''), False),
+    ('health_data_history', queries.HEALTH_DATA_HISTORY, (0, 7), False),
+    ('weekly_steps', queries.WEEKLY_STEPS, (0, '', ''), False),
+    ('weekly_sleep', queries.WEEKLY_SLEEP, (0, '', ''), False),
+    ('weekly_calories', queries.WEEKLY_CALORIES, (0, '', ''), False),
+    ('dashboard_week', queries.DASHBOARD_WEEK, (0, '', ''), False),
+    ('realtime_range', realtime_store.RAW_RANGE_SQL.format(**_REALTIME_MAIN), (0, '', ''), False),
+    ('realtime_range_by_type', realtime_store.RAW_RANGE_SQL.format(**_REALTIME_MAIN_BY_TYPE), (0, '', '', ''), False),
+    ('realtime_rollup_refresh', realtime_store.HOUR_STATS_SQL.format(schema='main'), (0, '', '', '', ''), False),
+    ('realtime_packed_slot', realtime_store.PACKED_ROW_ID_SQL.format(schema='main'), (0, '', ''), False),
+    ('realtime_packed_range', realtime_store.PACKED_RANGE_SQL.format(**_REALTIME_MAIN), (0, '', ''), False),
+    ('realtime_hourly_range', realtime_store.HOURLY_RANGE_SQL.format(type_clause=''), (0, '', ''), False),
+    ('realtime_hourly_range_by_type', realtime_store.HOURLY_RANGE_SQL.format(type_clause=realtime_store.TYPE_FILTER),
+     (0, '', '', ''), False),
+    ('realtime_daily_range', realtime_store.DAILY_RANGE_SQL.format(type_clause=''), (0, '', ''), False),
+    ('realtime_daily_range_by_type', realtime_store.DAILY_RANGE_SQL.format(type_clause=realtime_store.TYPE_FILTER),
+     (0, '', '', ''), False),
+    ('steps_ranking_top', queries.STEPS_RANKING_TOP, ('', 50), False),
+    ('steps_ranking_fill', queries.STEPS_RANKING_FILL, ('', 50), False),
+    ('steps_ranking_mine', queries.STEPS_RANKING_MINE, ('', 0), False),
+    ('steps_ranking_my_rank', queries.STEPS_RANKING_AHEAD, ('', 0, 0, ''), False),
+    ('steps_ranking_with_steps', queries.STEPS_RANKING_WITH_STEPS, ('',), False),
+    # 进程内排行榜 / 占用索引的全量加载，只在启动和定期重新同步时执行
+    ('points_leaderboard_load', ranking.LOAD_SQL, (), True),
+    ('availability_load', availability.LOAD_SQL, (), True),
+    ('points_ranking_window', queries.POINTS_RANKING_WINDOW, ('', '', 100), False),
+    ('points_ranking_family', queries.POINTS_RANKING_FAMILY.format(placeholders=queries.in_list(3)),
+     (0, 0, 0, '', ''), False),
+    ('user_points', queries.USER_POINTS, (0,), False),
+    ('steps_history', queries.STEPS_HISTORY, (0, 30), False),
+    # 旧版全量用户列表（保留给旧客户端），新客户端使用下面的 user_directory_* 分页查询
+    ('all_users', queries.ALL_USERS, (0, 0), True),
+    ('user_directory_page', queries.user_directory_sql('username', after_cursor=True), (0, '', 0, 21), False),
+    ('user_directory_username_prefix', queries.user_directory_sql('username', prefix=True), (0, '', '', 21), False),
+    ('user_directory_phone_prefix', queries.user_directory_sql('phone', after_cursor=True, prefix=True),
+     (0, '', 0, '', '', 21), False),
+    ('user_directory_friends', queries.USER_DIRECTORY_FRIENDS.format(placeholders=queries.in_list(3)),
+     (0, 0, 0, 0), False),
+    ('family_members', queries.FAMILY_MEMBERS, (0,), False),
+    ('friends_list', queries.FRIENDS_LIST, (0,), False),
+    ('family_overview', queries.FAMILY_OVERVIEW.format(columns=_FAMILY_COLUMNS), ('', 0), False),
+    ('family_history', queries.FAMILY_HISTORY.format(columns=_FAMILY_COLUMNS), ('', '', 0), False),
+    ('health_score_window', health_score.WINDOW_SQL.format(placeholders=queries.in_list(3)),
+     (0, 0, 0, '', ''), False),
+    ('health_score_dirty', health_score.DIRTY_MARKS_SQL.format(placeholders=queries.in_list(3)), (0, 0, 0), False),
+    ('health_score_today', health_score.SCORED_TODAY_SQL.format(placeholders=queries.in_list(3)),
+     ('', 0, 0, 0), False),
+    ('health_score_history', queries.HEALTH_SCORE_HISTORY, (0, '', 7), False),
+    ('health_score_family', queries.HEALTH_SCORE_FAMILY.format(placeholders=queries.in_list(3)),
+     ('', 0, 0, 0), False),
+    ('trends_by_user', trends.LOAD_SQL, (0,), False),
+    ('trends_refresh', trends.AGGREGATE_SQL, ('', 0, '', ''), False),
+    ('alerts_by_user', queries.ALERTS_BY_USER, (0, 0, 20), False),
+    ('radar_match', radar.MATCH_SQL, ('', 0), False),
+    ('radar_session', radar.SESSION_SQL, ('', 0), False),
+    ('radar_code_cleanup', radar.CODE_CLEANUP_SQL, ('', ''), False),
+    ('radar_cleanup', radar.CLEANUP_SQL, ('',), False),
+]
+
+# 按日期范围分批读取（fetchmany）的查询，结果必须直接按索引顺序返回，不能先把整个范围排序
+RANGE_QUERIES = {
+    'realtime_range', 'realtime_range_by_type', 'realtime_packed_range',
+    'realtime_hourly_range', 'realtime_hourly_range_by_type', 'realtime_daily_range', 'realtime_daily_range_by_type',
+}
+
+
+def find_table_scans(conn, sql, params, range_read=False):
+    """返回执行计划中的全表扫描步骤；range_read=True 时临时 B 树排序也算在内
+
+    没有使用索引的 SCAN 一定是全表扫描；使用索引的 SCAN 只有在索引顺序直接满足
+    ORDER BY 且带 LIMIT（读到前 N 行就停止）时才不算全表扫描。
+    """
+    plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+    bounded = 'LIMIT' in sql.upper() and not any('TEMP B-TREE' in detail for detail in plan)
+    scans = []
+    for detail in plan:
+        if range_read and 'TEMP B-TREE' in detail:
+            scans.append(detail)
+            continue
+        if not detail.startswith('SCAN ') or 'CONSTANT ROW' in detail:
+            continue
+        if 'USING' in detail and bounded:
+            continue
+        scans.append(detail)
+    return scans
+
+
+def check_query_plans(conn):
+    """检查所有热点查询，返回 (名称, 全表扫描步骤列表) 形式的问题列表"""
+    problems = []
+    for name, sql, params, allow_scan in HOT_QUERIES:
+        scans = find_table_scans(conn, sql, params, name in RANGE_QUERIES)
+        status = 'OK'
+        if scans:
+            status = '已知全表扫描' if allow_scan else '全表扫描'
+            if not allow_scan:
+                problems.append((name, scans))
+        print(f"[{status}] {name}" + (f": {'; '.join(scans)}" if scans else ''))
+    return problems
+
+
+if __name__ == '__main__':
+    setup_logging()
+    args = sys.argv[1:]
+    check_only = '--check' in args
+    args = [a for a in args if a != '--check']
+    database_path = args[0] if args else 'health_app.db'
+
+    conn = sqlite3.connect(database_path)
+    if check_only:
+        problems = check_query_plans(conn)
+        conn.close()
+        sys.exit(1 if problems else 0)
+
+    version = migrate(conn)
+    conn.close()
+    print(f"当前数据库版本: {version}")
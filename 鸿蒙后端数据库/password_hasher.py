@@ -0,0 +1,85 @@
+"""密码哈希工作池
+
+bcrypt 每次计算需要 100~300ms CPU，放在请求线程上会让登录高峰期间其他轻量接口一起排队。
+这里把 hashpw / checkpw 交给固定大小的线程池执行（bcrypt 计算时释放 GIL），
+并限制排队数量：排队已满时立即抛出 HasherBusy，由接口返回 503 + Retry-After；
+等待超过 timeout 秒时取消排队中的计算，同样抛出 HasherBusy。
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt
+
+
+class HasherBusy(Exception):
+    """哈希工作池已满"""
+
+    def __init__(self, retry_after):
+        super().__init__('密码计算队列已满')
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    def __init__(self, rounds=12, max_workers=2, max_pending=16, retry_after=1, timeout=30):
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.retry_after = retry_after
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        # 延迟创建，保证线程在 fork 之后的工作进程中启动
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix='bcrypt'
+                    )
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy(self.retry_after)
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # 还在排队的计算直接取消；已经开始的计算结束后结果被丢弃
+            future.cancel()
+            raise HasherBusy(self.retry_after)
+
+    def hash(self, password):
+        return self._run(_hash, password, self.rounds)
+
+    def verify(self, password, password_hash):
+        return self._run(_verify, password, password_hash)
+
+    def needs_rehash(self, password_hash):
+        """哈希的 cost 与当前配置不同时需要重新计算（格式: $2b$12$...）"""
+        return cost_of(password_hash) != self.rounds
+
+
+def _to_bytes(value):
+    return value.encode('utf-8') if isinstance(value, str) else value
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(_to_bytes(password), bcrypt.gensalt(rounds))
+
+
+def _verify(password, password_hash):
+    return bcrypt.checkpw(_to_bytes(password), _to_bytes(password_hash))
+
+
+def cost_of(password_hash):
+    try:
+        return int(_to_bytes(password_hash).split(b'$')[2])
+    except (IndexError, ValueError):
+        return None
@@ -0,0 +1,202 @@
+"""接口的热点查询语句
+
+路由和 migrations.check_query_plans 使用同一份 SQL，--check 检查的就是实际执行的语句。
+带 {columns} 等占位的语句由调用方 format 后执行；IN 列表用 in_list(n) 生成占位符。
+各模块内部的查询（实时数据、健康指数、趋势、雷达配对等）在各自模块中定义为常量，同样由 --check 导入。
+"""
+
+
+def in_list(count):
+    """IN (...) 的占位符"""
+    return ','.join('?' * count)
+
+
+LOGIN_BY_PHONE = 'SELECT * FROM users WHERE phone = ?'
+LOGIN_BY_USERNAME = 'SELECT * FROM users WHERE username = ?'
+
+OVERVIEW = '''
+    SELECT steps, current_heart_rate, sleep_score, active_calories, basic_metabolism_calories, current_blood_oxygen, current_mood
+    FROM health_data
+    WHERE user_id = ? AND record_date = ?
+'''
+
+HEALTH_DATA_HISTORY = '''
+    SELECT * FROM health_data
+    WHERE user_id = ?
+    ORDER BY record_date DESC
+    LIMIT ?
+'''
+
+WEEKLY_STEPS = '''
+    SELECT record_date, steps FROM health_data
+    WHERE user_id = ? AND record_date BETWEEN ? AND ?
+    ORDER BY record_date
+'''
+
+WEEKLY_SLEEP = '''
+    SELECT record_date, sleep_score, sleep_duration FROM health_data
+    WHERE user_id = ? AND record_date BETWEEN ? AND ?
+    ORDER BY record_date
+'''
+
+WEEKLY_CALORIES = '''
+    SELECT record_date, active_calories FROM health_data
+    WHERE user_id = ? AND record_date BETWEEN ? AND ?
+    ORDER BY record_date
+'''
+
+DASHBOARD_WEEK = '''
+    SELECT record_date, steps, current_heart_rate, sleep_score, sleep_duration, active_calories,
+           basic_metabolism_calories, current_blood_oxygen, current_mood
+    FROM health_data
+    WHERE user_id = ? AND record_date BETWEEN ? AND ?
+    ORDER BY record_date
+'''
+
+STEPS_RANKING_TOP = '''
+    SELECT username, steps FROM daily_steps_leaderboard
+    WHERE record_date = ? AND steps > 0
+    ORDER BY steps DESC, username ASC
+    LIMIT ?
+'''
+
+# 不足N名时用今日无步数的用户按用户名补齐
+STEPS_RANKING_FILL = '''
+    SELECT u.username, 0 as steps FROM users u
+    WHERE NOT EXISTS (
+        SELECT 1 FROM daily_steps_leaderboard l
+        WHERE l.record_date = ? AND l.user_id = u.id AND l.steps > 0
+    )
+    ORDER BY u.username ASC
+    LIMIT ?
+'''
+
+STEPS_RANKING_MINE = '''
+    SELECT username, steps FROM daily_steps_leaderboard
+    WHERE record_date = ? AND user_id = ?
+'''
+
+STEPS_RANKING_AHEAD = '''
+    SELECT COUNT(*) FROM daily_steps_leaderboard
+    WHERE record_date = ? AND (steps > ? OR (steps = ? AND username < ?))
+'''
+
+STEPS_RANKING_WITH_STEPS = '''
+    SELECT COUNT(*) FROM daily_steps_leaderboard
+    WHERE record_date = ? AND steps > 0
+'''
+
+STEPS_HISTORY = '''
+    SELECT id, steps, points_earned, record_date, created_at FROM steps_records
+    WHERE user_id = ?
+    ORDER BY record_date DESC
+    LIMIT ?
+'''
+
+USER_POINTS = 'SELECT * FROM user_points WHERE user_id = ?'
+
+# points_daily 按 (record_date, user_id) 范围读取，每个用户最多31行
+POINTS_RANKING_WINDOW = '''
+    SELECT pd.user_id, u.username, SUM(pd.points) AS points
+    FROM points_daily pd
+    JOIN users u ON u.id = pd.user_id
+    WHERE pd.record_date BETWEEN ? AND ?
+    GROUP BY pd.user_id
+    ORDER BY points DESC, u.username
+    LIMIT ?
+'''
+
+# {placeholders}: in_list(成员数)
+POINTS_RANKING_FAMILY = '''
+    SELECT user_id, SUM(points) FROM points_daily
+    WHERE user_id IN ({placeholders}) AND record_date BETWEEN ? AND ?
+    GROUP BY user_id
+'''
+
+# 旧版全量用户列表（保留给旧客户端），新客户端使用 user_directory_sql 分页查询
+ALL_USERS = '''
+    SELECT u.id, u.username, u.phone, u.avatar_url,
+           CASE WHEN fm.id IS NOT NULL THEN 1 ELSE 0 END as is_friend
+    FROM users u
+    LEFT JOIN family_members fm ON u.id = fm.member_id AND fm.user_id = ? AND fm.status = 1
+    WHERE u.id != ?
+    ORDER BY u.username
+'''
+
+
+def user_directory_sql(field, after_cursor=False, prefix=False):
+    """分页用户目录，按 (field, id) 键集分页；参数依次为 当前用户ID、[上一页最后的 field 值, id]、
+    [前缀下界, 前缀上界]、limit。field 只能是 username 或 phone（由调用方校验）
+    """
+    conditions = ['id != ?']
+    if after_cursor:
+        conditions.append(f'({field}, id) > (?, ?)')
+    # 前缀搜索转换为索引范围查询
+    if prefix:
+        conditions.append(f'{field} >= ? AND {field} < ?')
+    return f'''
+        SELECT id, username, phone, avatar_url FROM users
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {field}, id
+        LIMIT ?
+    '''
+
+
+# {placeholders}: in_list(本页用户数)
+USER_DIRECTORY_FRIENDS = '''
+    SELECT member_id FROM family_members
+    WHERE user_id = ? AND status = 1 AND member_id IN ({placeholders})
+'''
+
+FAMILY_MEMBERS = '''
+    SELECT u.id, u.username, u.phone, fm.relationship_name, fm.added_at
+    FROM family_members fm
+    JOIN users u ON fm.member_id = u.id
+    WHERE fm.user_id = ? AND fm.status = 1
+    ORDER BY fm.added_at DESC
+'''
+
+FRIENDS_LIST = '''
+    SELECT u.id, u.username, u.phone, u.avatar_url
+    FROM family_members fm
+    JOIN users u ON fm.member_id = u.id
+    WHERE fm.user_id = ? AND fm.status = 1
+    ORDER BY u.username
+'''
+
+# {columns}: 以 h. 为前缀的 health_data 字段
+FAMILY_OVERVIEW = '''
+    SELECT u.id, u.username, u.avatar_url, fm.relationship_name, h.record_date, {columns}
+    FROM family_members fm
+    JOIN users u ON fm.member_id = u.id
+    LEFT JOIN health_data h ON h.user_id = fm.member_id AND h.record_date = ?
+    WHERE fm.user_id = ? AND fm.status = 1
+    ORDER BY u.username
+'''
+
+# CROSS JOIN 固定以家庭成员为外层，按 (user_id, record_date) 索引逐个成员范围查找
+FAMILY_HISTORY = '''
+    SELECT h.user_id, h.record_date, {columns}
+    FROM family_members fm
+    CROSS JOIN health_data h ON h.user_id = fm.member_id AND h.record_date BETWEEN ? AND ?
+    WHERE fm.user_id = ? AND fm.status = 1
+    ORDER BY fm.member_id, h.record_date
+'''
+
+HEALTH_SCORE_HISTORY = '''
+    SELECT * FROM health_scores
+    WHERE user_id = ? AND score_date <= ? AND score IS NOT NULL
+    ORDER BY score_date DESC LIMIT ?
+'''
+
+# {placeholders}: in_list(成员数)
+HEALTH_SCORE_FAMILY = '''
+    SELECT * FROM health_scores
+    WHERE score_date = ? AND user_id IN ({placeholders})
+'''
+
+ALERTS_BY_USER = '''
+    SELECT * FROM alerts
+    WHERE user_id = ? AND id < ?
+    ORDER BY id DESC LIMIT ?
+'''
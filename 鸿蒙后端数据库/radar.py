@@ -0,0 +1,304 @@
+"""面对面加好友（雷达）配对
+
+两个用户输入相同的雷达码即配对成功。默认在进程内配对（RADAR_STORE=memory）：
+按雷达码保存等待中的会话，过期时间放在最小堆中，每次操作时顺带弹出已过期的会话，
+不再每次请求都扫描 / 写入 friend_radar 表。
+先进入的一方可以调用 wait() 长轮询，对方加入（或会话过期）时立即返回，不需要客户端定时重复提交。
+
+进程内配对只对同一进程内的请求有效，多进程部署时使用 RADAR_STORE=db（DbRadarStore），
+配对状态保存在 friend_radar 表中。wait() 不轮询数据库：等待方在本进程登记一个 Event，
+配对成功的一方提交后调用 notify，唤醒本进程的等待方，并通过 broker（live_hub.UnixDatagramBroker）
+通知其他进程；等待方被唤醒或超时后只查询一次数据库。
+join 在写线程的写操作中执行（接收写操作的 cursor），DbRadarStore 取回结果后的删除也交给写线程。
+RadarMatcher 的进程内状态不随事务回滚：调用方在 join 之前用 snapshot 保存该雷达码的状态，
+写操作回滚时用 restore 恢复，对方的等待会话不会因为写入失败而被消耗。
+同时等待的请求数受 max_waiters 和共用的长连接名额（long_requests）限制。
+"""
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+
+# DbRadarStore 的查询语句（migrations --check 检查执行计划）
+CODE_CLEANUP_SQL = 'DELETE FROM friend_radar WHERE radar_code = ? AND expires_at < ?'
+CLEANUP_SQL = 'DELETE FROM friend_radar WHERE expires_at < ?'
+MATCH_SQL = '''
+    SELECT id, user_id FROM friend_radar
+    WHERE radar_code = ? AND user_id != ? AND matched_user_id IS NULL
+'''
+SESSION_SQL = '''
+    SELECT matched_user_id, expires_at FROM friend_radar
+    WHERE radar_code = ? AND user_id = ?
+'''
+
+
+class RadarBusy(Exception):
+    """同时等待的请求过多"""
+
+    def __init__(self, retry_after):
+        super().__init__('等待配对的请求过多')
+        self.retry_after = retry_after
+
+
+class _WaitLimiter:
+    """长轮询会占用工作线程，限制同时等待的请求数量；设置 shared（long_requests.LongRequestSlots）时
+    还要占用一个与 SSE 共用的长连接名额
+    """
+
+    def __init__(self, max_waiters, shared=None, retry_after=1):
+        self._slots = threading.BoundedSemaphore(max_waiters) if max_waiters > 0 else None
+        self.shared = shared
+        self.retry_after = retry_after
+
+    def __enter__(self):
+        if self._slots is None or not self._slots.acquire(blocking=False):
+            raise RadarBusy(self.retry_after)
+        if self.shared is not None and not self.shared.try_acquire():
+            self._slots.release()
+            raise RadarBusy(self.retry_after)
+        return self
+
+    def __exit__(self, *exc):
+        if self.shared is not None:
+            self.shared.release()
+        self._slots.release()
+
+
+class RadarSession:
+    __slots__ = ('user_id', 'radar_code', 'expires_at', 'partner_id', 'event')
+
+    def __init__(self, user_id, radar_code, expires_at):
+        self.user_id = user_id
+        self.radar_code = radar_code
+        self.expires_at = expires_at
+        self.partner_id = None
+        self.event = threading.Event()
+
+
+class RadarMatcher:
+    def __init__(self, ttl_seconds=300, max_waiters=32, slots=None):
+        self.ttl_seconds = ttl_seconds
+        self._waiting = {}
+        self._matched = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._limiter = _WaitLimiter(max_waiters, slots)
+
+    def _push(self, session):
+        heapq.heappush(self._heap, (session.expires_at, next(self._counter), session))
+
+    def _expire(self, now):
+        """弹出所有已到期的堆元素；会话续期过的话堆中会有多条，以会话当前的过期时间为准"""
+        while self._heap and self._heap[0][0] <= now:
+            _, _, session = heapq.heappop(self._heap)
+            if session.expires_at > now:
+                continue
+            key = (session.radar_code, session.user_id)
+            waiting = self._waiting.get(session.radar_code)
+            if waiting is not None and waiting.get(session.user_id) is session:
+                del waiting[session.user_id]
+                if not waiting:
+                    del self._waiting[session.radar_code]
+            if self._matched.get(key) is session:
+                del self._matched[key]
+            session.event.set()
+
+    def snapshot(self, user_id, radar_code):
+        """保存 join(user_id, radar_code) 会修改的状态"""
+        with self._lock:
+            waiting = self._waiting.get(radar_code, {})
+            return (
+                user_id,
+                radar_code,
+                {uid: (session, session.expires_at, session.partner_id) for uid, session in waiting.items()},
+                self._matched.get((radar_code, user_id))
+            )
+
+    def restore(self, saved):
+        """写操作回滚时恢复 snapshot 保存的状态"""
+        user_id, radar_code, waiting, matched = saved
+        with self._lock:
+            for other_id, (session, _, _) in waiting.items():
+                if self._matched.get((radar_code, other_id)) is session:
+                    del self._matched[(radar_code, other_id)]
+            for session, expires_at, partner_id in waiting.values():
+                session.expires_at = expires_at
+                session.partner_id = partner_id
+            if waiting:
+                self._waiting[radar_code] = {uid: entry[0] for uid, entry in waiting.items()}
+            else:
+                self._waiting.pop(radar_code, None)
+            if matched is not None:
+                self._matched[(radar_code, user_id)] = matched
+
+    def join(self, cursor, user_id, radar_code):
+        """加入配对，有其他用户在等待同一雷达码时返回对方的用户ID，否则登记等待并返回 None
+
+        配对结果写入数据库并提交后，需调用 notify(对方用户ID, 雷达码) 唤醒对方的 wait()
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+
+            # 已被其他用户配对，取回结果
+            session = self._matched.pop((radar_code, user_id), None)
+            if session is not None:
+                return session.partner_id
+
+            waiting = self._waiting.setdefault(radar_code, {})
+            for other_id, other in waiting.items():
+                if other_id == user_id:
+                    continue
+                del waiting[other_id]
+                waiting.pop(user_id, None)
+                if not waiting:
+                    del self._waiting[radar_code]
+                other.partner_id = user_id
+                self._matched[(radar_code, other_id)] = other
+                return other_id
+
+            session = waiting.get(user_id)
+            if session is None:
+                session = RadarSession(user_id, radar_code, now + self.ttl_seconds)
+                waiting[user_id] = session
+            else:
+                session.expires_at = now + self.ttl_seconds
+            self._push(session)
+            return None
+
+    def notify(self, user_id, radar_code):
+        with self._lock:
+            session = self._matched.get((radar_code, user_id))
+        if session is not None:
+            session.event.set()
+
+    def wait(self, user_id, radar_code, timeout):
+        """等待配对，返回 ('matched', 对方用户ID) / ('waiting', None) / ('expired', None)"""
+        with self._lock:
+            self._expire(time.monotonic())
+            session = self._matched.get((radar_code, user_id)) or \
+                self._waiting.get(radar_code, {}).get(user_id)
+        if session is None:
+            return 'expired', None
+
+        if not session.event.is_set():
+            with self._limiter:
+                session.event.wait(min(timeout, max(0, session.expires_at - time.monotonic())))
+
+        with self._lock:
+            self._expire(time.monotonic())
+            if self._matched.get((radar_code, user_id)) is session:
+                del self._matched[(radar_code, user_id)]
+                return 'matched', session.partner_id
+            if self._waiting.get(radar_code, {}).get(user_id) is session:
+                return 'waiting', None
+        return 'expired', None
+
+
+class DbRadarStore:
+    """多进程部署时使用：配对状态保存在 friend_radar 表中"""
+
+    def __init__(self, pool, writer, ttl_seconds=300, max_waiters=32, broker=None, slots=None):
+        self.pool = pool
+        self.writer = writer
+        self.ttl_seconds = ttl_seconds
+        self.broker = broker
+        self._limiter = _WaitLimiter(max_waiters, slots)
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self._last_cleanup = None
+        if broker is not None:
+            broker.subscribe('radar', lambda payload: self._wake(*payload))
+
+    def snapshot(self, user_id, radar_code):
+        """配对状态在数据库中，随事务回滚"""
+        return None
+
+    def restore(self, saved):
+        pass
+
+    def join(self, cursor, user_id, radar_code):
+        """在写线程中执行；配对成功并提交后需调用 notify(对方用户ID, 雷达码)"""
+        now = datetime.now()
+
+        # 清理同一雷达码的过期记录；其余过期记录每个 TTL 最多清理一次（join 只在写线程中执行）
+        cursor.execute(CODE_CLEANUP_SQL, (radar_code, now.isoformat()))
+        if self._last_cleanup is None or time.monotonic() - self._last_cleanup >= self.ttl_seconds:
+            self._last_cleanup = time.monotonic()
+            cursor.execute(CLEANUP_SQL, (now.isoformat(),))
+
+        # 已被其他用户配对，取回结果
+        own = cursor.execute('''
+            SELECT matched_user_id FROM friend_radar
+            WHERE radar_code = ? AND user_id = ? AND matched_user_id IS NOT NULL
+        ''', (radar_code, user_id)).fetchone()
+        if own is not None:
+            cursor.execute('DELETE FROM friend_radar WHERE radar_code = ? AND user_id = ?', (radar_code, user_id))
+            return own[0]
+
+        other = cursor.execute(MATCH_SQL, (radar_code, user_id)).fetchone()
+        if other is not None:
+            cursor.execute('UPDATE friend_radar SET matched_user_id = ? WHERE id = ?', (user_id, other[0]))
+            cursor.execute('DELETE FROM friend_radar WHERE radar_code = ? AND user_id = ?', (radar_code, user_id))
+            return other[1]
+
+        cursor.execute('DELETE FROM friend_radar WHERE radar_code = ? AND user_id = ?', (radar_code, user_id))
+        cursor.execute('''
+            INSERT INTO friend_radar (user_id, radar_code, expires_at)
+            VALUES (?, ?, ?)
+        ''', (user_id, radar_code, (now + timedelta(seconds=self.ttl_seconds)).isoformat()))
+        return None
+
+    def _wake(self, radar_code, user_id):
+        with self._lock:
+            events = list(self._waiters.get((radar_code, user_id), ()))
+        for event in events:
+            event.set()
+
+    def notify(self, user_id, radar_code):
+        """唤醒等待该会话的请求：本进程直接唤醒，其他进程通过 broker"""
+        self._wake(radar_code, user_id)
+        if self.broker is not None:
+            self.broker.send('radar', [radar_code, user_id])
+
+    def _check(self, user_id, radar_code):
+        """返回 (状态, 对方用户ID, 剩余有效秒数)；配对成功时删除自己的记录"""
+        conn = self.pool.acquire()
+        try:
+            row = conn.execute(SESSION_SQL, (radar_code, user_id)).fetchone()
+        finally:
+            self.pool.release(conn)
+        now = datetime.now()
+        if row is None or row[1] < now.isoformat():
+            return 'expired', None, 0
+        if row[0] is None:
+            return 'waiting', None, (datetime.fromisoformat(row[1]) - now).total_seconds()
+        self.writer.run(lambda cursor: cursor.execute(
+            'DELETE FROM friend_radar WHERE radar_code = ? AND user_id = ?', (radar_code, user_id)
+        ))
+        return 'matched', row[0], 0
+
+    def wait(self, user_id, radar_code, timeout):
+        """等待配对，返回 ('matched', 对方用户ID) / ('waiting', None) / ('expired', None)"""
+        if self.broker is not None:
+            self.broker.start()
+        key = (radar_code, user_id)
+        event = threading.Event()
+        with self._lock:
+            self._waiters.setdefault(key, set()).add(event)
+        try:
+            # 先登记再查询，查询之后到达的通知不会丢失
+            status, partner_id, remaining = self._check(user_id, radar_code)
+            if status != 'waiting':
+                return status, partner_id
+            with self._limiter:
+                event.wait(min(timeout, remaining))
+        finally:
+            with self._lock:
+                events = self._waiters.get(key)
+                events.discard(event)
+                if not events:
+                    del self._waiters[key]
+        return self._check(user_id, radar_code)[:2]
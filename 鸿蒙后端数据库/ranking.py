@@ -0,0 +1,262 @@
+"""进程内积分排行榜
+
+RankedIndex 用带跨度的跳表（order-statistics skip list）维护按分数降序的键：
+更新分数、查名次、按名次定位都是期望 O(log n)，取前 N 名 O(N)，取某用户附近的名次 O(log n + 窗口大小)。
+启动时从 user_points 加载，修改 user_points 的接口在提交后同步更新。
+多进程部署时各进程各有一份，按 resync_seconds 定期从数据库重新加载，限制不同进程间的数据延迟；
+重新加载由 background_reload 在后台线程中执行，期间继续使用旧数据。
+"""
+import random
+import threading
+import time
+
+# 全量加载（启动和定期重新同步时执行，读取整个 user_points 表）
+LOAD_SQL = '''
+    SELECT up.user_id, up.total_points, u.username
+    FROM user_points up
+    JOIN users u ON up.user_id = u.id
+'''
+
+MAX_LEVEL = 32
+LEVEL_PROBABILITY = 0.25
+
+
+class _Node:
+    """span[i] 为沿第 i 层指针前进一步跨过的名次数（指针为空时为到表尾的名次数）"""
+    __slots__ = ('key', 'next', 'span')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        self.span = [0] * level
+
+
+def _random_level():
+    level = 1
+    while level < MAX_LEVEL and random.random() < LEVEL_PROBABILITY:
+        level += 1
+    return level
+
+
+class RankedIndex:
+    """按分数降序、同分按 user_id 升序排列的有序索引（非线程安全，由调用方加锁）
+
+    键为 (-score, user_id)，跳表按键升序排列，名次即键在表中的位置。
+    """
+
+    def __init__(self):
+        self._head = _Node(None, MAX_LEVEL)
+        self._level = 1
+        self._length = 0
+        self._scores = {}
+
+    @classmethod
+    def from_scores(cls, scores):
+        """由 {user_id: score} 一次排序后顺序链接构建（O(n log n) 排序 + O(n) 建表），避免逐个插入"""
+        index = cls()
+        index._scores = dict(scores)
+        keys = sorted((-score, user_id) for user_id, score in index._scores.items())
+
+        head = index._head
+        last = [head] * MAX_LEVEL
+        last_rank = [0] * MAX_LEVEL
+        for rank, key in enumerate(keys, 1):
+            level = _random_level()
+            node = _Node(key, level)
+            for i in range(level):
+                last[i].next[i] = node
+                last[i].span[i] = rank - last_rank[i]
+                last[i] = node
+                last_rank[i] = rank
+            index._level = max(index._level, level)
+        for i in range(MAX_LEVEL):
+            last[i].span[i] = len(keys) - last_rank[i]
+        index._length = len(keys)
+        return index
+
+    def __len__(self):
+        return self._length
+
+    def __contains__(self, user_id):
+        return user_id in self._scores
+
+    def score(self, user_id):
+        return self._scores.get(user_id)
+
+    def _insert(self, key):
+        update = [None] * MAX_LEVEL
+        rank = [0] * MAX_LEVEL
+        node = self._head
+        for i in reversed(range(self._level)):
+            rank[i] = 0 if i == self._level - 1 else rank[i + 1]
+            while node.next[i] is not None and node.next[i].key < key:
+                rank[i] += node.span[i]
+                node = node.next[i]
+            update[i] = node
+
+        level = _random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                rank[i] = 0
+                update[i] = self._head
+                self._head.span[i] = self._length
+            self._level = level
+
+        new = _Node(key, level)
+        for i in range(level):
+            new.next[i] = update[i].next[i]
+            update[i].next[i] = new
+            new.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self._level):
+            update[i].span[i] += 1
+        self._length += 1
+
+    def _delete(self, key):
+        update = [None] * MAX_LEVEL
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.next[i] is not None and node.next[i].key < key:
+                node = node.next[i]
+            update[i] = node
+
+        target = node.next[0]
+        if target is None or target.key != key:
+            return
+        for i in range(self._level):
+            if update[i].next[i] is target:
+                update[i].span[i] += target.span[i] - 1
+                update[i].next[i] = target.next[i]
+            else:
+                update[i].span[i] -= 1
+        while self._level > 1 and self._head.next[self._level - 1] is None:
+            self._level -= 1
+        self._length -= 1
+
+    def _node_at(self, rank):
+        """第 rank 名（从 1 开始）的节点"""
+        traversed = 0
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.next[i] is not None and traversed + node.span[i] <= rank:
+                traversed += node.span[i]
+                node = node.next[i]
+            if traversed == rank:
+                return node
+        return None
+
+    def update(self, user_id, score):
+        old_score = self._scores.get(user_id)
+        if old_score == score:
+            return
+        if old_score is not None:
+            self._delete((-old_score, user_id))
+        self._insert((-score, user_id))
+        self._scores[user_id] = score
+
+    def remove(self, user_id):
+        old_score = self._scores.pop(user_id, None)
+        if old_score is not None:
+            self._delete((-old_score, user_id))
+
+    def rank(self, user_id):
+        """返回从 1 开始的名次，不在榜上时返回 None"""
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        key = (-score, user_id)
+        rank = 0
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.next[i] is not None and node.next[i].key <= key:
+                rank += node.span[i]
+                node = node.next[i]
+            if node.key == key:
+                return rank
+        return None
+
+    def slice(self, start, stop):
+        """返回名次区间 [start, stop) 内的 (user_id, score)，start 从 0 开始"""
+        start = max(start, 0)
+        stop = min(stop, self._length)
+        if start >= stop:
+            return []
+        node = self._node_at(start + 1)
+        result = []
+        for _ in range(stop - start):
+            neg_score, user_id = node.key
+            result.append((user_id, -neg_score))
+            node = node.next[0]
+        return result
+
+
+class PointsLeaderboard:
+    def __init__(self, resync_seconds=60):
+        self.resync_seconds = resync_seconds
+        self._index = RankedIndex()
+        self._usernames = {}
+        self._loaded_at = None
+        self._lock = threading.RLock()
+
+    def load(self, conn):
+        """从数据库全量加载（启动时以及定期重新同步时调用）"""
+        rows = conn.execute(LOAD_SQL).fetchall()
+
+        index = RankedIndex.from_scores({row[0]: row[1] or 0 for row in rows})
+        usernames = {row[0]: row[2] for row in rows}
+
+        with self._lock:
+            self._index = index
+            self._usernames = usernames
+            self._loaded_at = time.monotonic()
+
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def needs_load(self):
+        if self._loaded_at is None:
+            return True
+        return bool(self.resync_seconds) and time.monotonic() - self._loaded_at > self.resync_seconds
+
+    def update(self, user_id, total_points, username=None):
+        with self._lock:
+            self._index.update(user_id, total_points)
+            if username is not None:
+                self._usernames[user_id] = username
+
+    def has_username(self, user_id):
+        return user_id in self._usernames
+
+    def rename(self, user_id, username):
+        with self._lock:
+            if user_id in self._index:
+                self._usernames[user_id] = username
+
+    def _entries(self, start, stop):
+        return [
+            {
+                'rank': start + i + 1,
+                'user_id': user_id,
+                'username': self._usernames.get(user_id, ''),
+                'total_points': score
+            }
+            for i, (user_id, score) in enumerate(self._index.slice(start, stop))
+        ]
+
+    def top(self, limit):
+        with self._lock:
+            return self._entries(0, limit)
+
+    def rank_of(self, user_id):
+        """返回 (名次, 总积分, 上榜人数)，未上榜时名次为 None"""
+        with self._lock:
+            return self._index.rank(user_id), self._index.score(user_id), len(self._index)
+
+    def around(self, user_id, window):
+        """返回该用户前后各 window 名的排行，未上榜时返回 None"""
+        with self._lock:
+            rank = self._index.rank(user_id)
+            if rank is None:
+                return None
+            start = max(rank - 1 - window, 0)
+            return self._entries(start, rank + window)
@@ -0,0 +1,180 @@
+"""实时数据按月分区
+
+原始样本按 record_date 所在月份写入独立的数据库文件（realtime_YYYY_MM.db），
+使用时 ATTACH 到当前连接，schema 名为 rt_YYYY_MM。
+范围查询只挂载与范围重叠的月份；过期月份直接 DETACH 并删除文件，
+不需要在主库上执行大范围 DELETE，主库大小也不会随时间增长。
+小时 / 天汇总仍保存在主库中，原始数据过期后长时间范围的图表仍可查询。
+
+注意:
+    - ATTACH / DETACH 不能在事务中执行，写入前要先挂载好所需分区
+    - 每个连接同时挂载的数据库数量有上限（SQLITE_LIMIT_ATTACHED，默认 10），
+      超出时先卸载本次用不到的分区
+    - 分区与主库分别提交，样本与汇总之间不是跨文件原子的；汇总可由样本重新计算
+"""
+import os
+import re
+import sqlite3
+from datetime import date
+
+MONTH_PATTERN = re.compile(r'^(\d{4})-(\d{2})$')
+FILE_PATTERN = re.compile(r'^realtime_(\d{4})_(\d{2})\.db$')
+SCHEMA_PREFIX = 'rt_'
+
+
+def month_of(record_date):
+    """'YYYY-MM-DD' -> 'YYYY-MM'，格式不正确时抛出 ValueError（分区名会拼进 SQL）"""
+    month = str(record_date)[:7]
+    match = MONTH_PATTERN.match(month)
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        raise ValueError(f'日期格式错误: {record_date}')
+    return month
+
+
+def schema_name(month):
+    return SCHEMA_PREFIX + month.replace('-', '_')
+
+
+def months_between(start_date, end_date):
+    """start_date 到 end_date（含）之间的所有月份，按时间正序"""
+    year, month = map(int, month_of(start_date).split('-'))
+    end_year, end_month = map(int, month_of(end_date).split('-'))
+    months = []
+    while (year, month) <= (end_year, end_month):
+        months.append(f'{year:04d}-{month:02d}')
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+    return months
+
+
+def _create_partition_tables(conn, schema):
+    """分区内的表结构与主库的 realtime_data / realtime_packed 相同"""
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.realtime_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            record_date TEXT NOT NULL,
+            time_stamp TEXT NOT NULL,
+            data_type TEXT NOT NULL,
+            value REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, record_date, time_stamp, data_type)
+        )
+    ''')
+    conn.execute(f'''
+        CREATE INDEX IF NOT EXISTS {schema}.idx_realtime_user_type_date_ts
+        ON realtime_data (user_id, data_type, record_date, time_stamp)
+    ''')
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.realtime_packed (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            record_date TEXT NOT NULL,
+            data_type TEXT NOT NULL,
+            slots BLOB NOT NULL,
+            present BLOB NOT NULL,
+            UNIQUE(user_id, record_date, data_type)
+        )
+    ''')
+
+
+class PartitionSet:
+    def __init__(self, directory, retention_months=0):
+        self.directory = directory
+        self.retention_months = retention_months
+        os.makedirs(directory, exist_ok=True)
+
+    def path_of(self, month):
+        return os.path.join(self.directory, f"realtime_{month.replace('-', '_')}.db")
+
+    def exists(self, month):
+        return os.path.exists(self.path_of(month))
+
+    def list_months(self):
+        """目录中已有的分区月份，按时间正序"""
+        months = []
+        for name in os.listdir(self.directory):
+            match = FILE_PATTERN.match(name)
+            if match:
+                months.append(f'{match.group(1)}-{match.group(2)}')
+        return sorted(months)
+
+    def cutoff_month(self, today=None):
+        """早于该月份的分区已过期；未设置保留期限时返回 None"""
+        if not self.retention_months:
+            return None
+        today = today or date.today()
+        index = today.year * 12 + today.month - 1 - (self.retention_months - 1)
+        return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+    def is_expired(self, record_date, today=None):
+        month = month_of(record_date)
+        cutoff = self.cutoff_month(today)
+        return cutoff is not None and month < cutoff
+
+    def is_future(self, record_date, today=None):
+        """晚于下个月的日期（设备时钟错误等），不为其创建分区文件"""
+        today = today or date.today()
+        index = today.year * 12 + today.month
+        return month_of(record_date) > f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+    def attached(self, conn):
+        """当前连接已挂载的分区 {schema 名: 文件路径}"""
+        return {
+            row[1]: row[2] for row in conn.execute('PRAGMA database_list').fetchall()
+            if row[1].startswith(SCHEMA_PREFIX)
+        }
+
+    def attach(self, conn, months, create=False):
+        """挂载给定月份的分区，返回 {月份: schema 名}
+
+        create=False 时跳过不存在的分区文件（查询时不创建空文件）
+        """
+        months = [m for m in dict.fromkeys(months) if create or self.exists(m)]
+        limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        if len(months) > limit:
+            raise ValueError(f'一次最多访问{limit}个月的分区')
+
+        attached = self.attached(conn)
+        wanted = {schema_name(m) for m in months}
+        missing = [m for m in months if schema_name(m) not in attached]
+
+        # 超出挂载上限时，先卸载本次用不到的分区
+        spare = [s for s in attached if s not in wanted]
+        while missing and len(attached) + len(missing) > limit and spare:
+            schema = spare.pop()
+            conn.execute(f'DETACH DATABASE {schema}')
+            del attached[schema]
+
+        for month in missing:
+            schema = schema_name(month)
+            conn.execute(f'ATTACH DATABASE ? AS {schema}', (self.path_of(month),))
+            conn.execute(f'PRAGMA {schema}.journal_mode = WAL')
+            conn.execute(f'PRAGMA {schema}.synchronous = NORMAL')
+            if create:
+                _create_partition_tables(conn, schema)
+        return {m: schema_name(m) for m in months}
+
+    def prune(self, conn, today=None):
+        """卸载并删除过期的分区文件，返回删除的月份"""
+        cutoff = self.cutoff_month(today)
+        if cutoff is None:
+            return []
+
+        attached = self.attached(conn)
+        dropped = []
+        for month in self.list_months():
+            if month >= cutoff:
+                break
+            schema = schema_name(month)
+            if schema in attached:
+                conn.execute(f'DETACH DATABASE {schema}')
+            path = self.path_of(month)
+            for suffix in ('', '-wal', '-shm'):
+                try:
+                    os.unlink(path + suffix)
+                except FileNotFoundError:
+                    pass
+            dropped.append(month)
+        return dropped
@@ -0,0 +1,508 @@
+"""实时数据（心率 / 血氧 / 情绪）的写入与查询
+
+写入原始样本的同时，在同一事务中增量维护按小时、按天的汇总表（最小 / 平均 / 最大 / 条数）。
+每次只重新计算受影响的那一小时（最多 60 条原始样本）和那一天（最多 24 条小时汇总），
+同一时间点的样本被覆盖时汇总结果也保持准确。
+长时间范围的查询直接读汇总表，30 天的图表只需要读几十到几百行。
+
+原始样本支持两种存储方式（REALTIME_STORAGE）:
+    rows    realtime_data 表，每个样本一行（默认）
+    packed  realtime_packed 表，每个 (用户, 日期, 类型) 一行：
+            1440 个 float32 槽位（每分钟一个）+ 180 字节的存在位图，
+            写入时用增量 BLOB I/O 原地修改对应槽位，读取时只解码需要的槽位
+
+设置 REALTIME_PARTITION_DIR 后，原始样本按月写入分区文件（见 realtime_partitions），
+汇总表仍在主库中。写入由 db_writer 的写线程执行：接口用 write_chunks 把样本按月份分组
+（每组最多 MAX_WRITE_MONTHS 个月），写线程每批事务开始前调用 prepare_months 挂载本批所有月份，
+并按 prune_interval_seconds 删除过期分区。
+
+命令行:
+    python realtime_store.py --pack [数据库路径]    把主库 realtime_data 转换到 realtime_packed（并删除原样本）
+    python realtime_store.py --split [数据库路径]   把主库中的原始样本移动到按月分区
+    python realtime_store.py --prune [数据库路径]   删除超出保留期限的分区
+"""
+import os
+import struct
+import sys
+import time
+
+from db_upsert import upsert_realtime_samples
+from log_utils import get_logger
+from realtime_partitions import PartitionSet, month_of, months_between
+
+# 查询分辨率：原始样本 / 小时汇总 / 天汇总
+RESOLUTIONS = ('raw', 'hour', 'day')
+
+# 自动选择分辨率时，单个数据类型最多返回的点数
+AUTO_MAX_POINTS = 500
+
+STORAGE_MODES = ('rows', 'packed')
+
+# 写线程一批最多挂载的分区数（SQLite 默认的 SQLITE_LIMIT_ATTACHED）
+MAX_WRITE_MONTHS = 10
+
+SLOTS_PER_DAY = 1440
+SLOT_SIZE = 4
+BITMAP_SIZE = SLOTS_PER_DAY // 8
+
+_storage_mode = 'rows'
+_partitions = None
+_prune_interval = 0
+_last_prune = None
+
+log = get_logger('realtime_store')
+
+# 查询语句（migrations --check 检查这些语句的执行计划）
+# {schema} 为原始样本所在的数据库（main 或分区），{type_clause} 为空或 TYPE_FILTER
+TYPE_FILTER = ' AND data_type = ?'
+
+PACKED_ROW_ID_SQL = '''
+    SELECT id FROM {schema}.realtime_packed WHERE user_id = ? AND record_date = ? AND data_type = ?
+'''
+
+HOUR_STATS_SQL = '''
+    SELECT MIN(value), AVG(value), MAX(value), SUM(value), COUNT(*)
+    FROM {schema}.realtime_data
+    WHERE user_id = ? AND data_type = ? AND record_date = ? AND time_stamp >= ? AND time_stamp <= ?
+'''
+
+PACKED_RANGE_SQL = '''
+    SELECT id, record_date, data_type FROM {schema}.realtime_packed
+    WHERE user_id = ? AND record_date BETWEEN ? AND ?{type_clause}
+    ORDER BY record_date DESC
+'''
+
+RAW_RANGE_SQL = '''
+    SELECT * FROM {schema}.realtime_data
+    WHERE user_id = ? AND record_date BETWEEN ? AND ?{type_clause}
+    ORDER BY record_date DESC, time_stamp DESC
+'''
+
+HOURLY_RANGE_SQL = '''
+    SELECT user_id, record_date, bucket AS time_stamp, data_type, avg_value AS value,
+           min_value, max_value, sample_count
+    FROM realtime_rollup_hourly
+    WHERE user_id = ? AND record_date BETWEEN ? AND ?{type_clause}
+    ORDER BY record_date DESC, bucket DESC
+'''
+
+DAILY_RANGE_SQL = '''
+    SELECT user_id, record_date, record_date AS time_stamp, data_type, avg_value AS value,
+           min_value, max_value, sample_count
+    FROM realtime_rollup_daily
+    WHERE user_id = ? AND record_date BETWEEN ? AND ?{type_clause}
+    ORDER BY record_date DESC
+'''
+
+
+def configure(storage_mode, partition_dir=None, retention_months=0, prune_interval_seconds=3600):
+    global _storage_mode, _partitions, _prune_interval, _last_prune
+    if storage_mode not in STORAGE_MODES:
+        raise ValueError(f'未知的实时数据存储方式: {storage_mode}')
+    _storage_mode = storage_mode
+    _partitions = PartitionSet(partition_dir, retention_months) if partition_dir else None
+    _prune_interval = prune_interval_seconds
+    _last_prune = None
+
+
+def storage_mode():
+    return _storage_mode
+
+
+def partitions():
+    return _partitions
+
+
+def check_record_date(record_date):
+    """按月分区时校验样本日期，返回错误信息，正常时返回 None"""
+    if _partitions is None:
+        return None
+    try:
+        if _partitions.is_expired(record_date):
+            return '超出数据保留期限'
+        if _partitions.is_future(record_date):
+            return '日期超出范围'
+    except ValueError:
+        return '日期格式错误'
+    return None
+
+
+def minute_of_day(time_stamp):
+    """'YYYY-MM-DD HH:MM' -> 当天第几分钟"""
+    return int(time_stamp[11:13]) * 60 + int(time_stamp[14:16])
+
+
+def write_chunks(rows):
+    """按月分区时把样本按月份分组，返回 [(月份列表, rows)]，每组最多 MAX_WRITE_MONTHS 个月，
+    每组作为一个写操作提交（月份列表即写操作的 keys）；未分区时只有一组，月份列表为空
+    """
+    if _partitions is None:
+        return [([], rows)]
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(month_of(row[1]), []).append(row)
+    months = sorted(by_month)
+    chunks = []
+    for start in range(0, len(months), MAX_WRITE_MONTHS):
+        chunk_months = months[start:start + MAX_WRITE_MONTHS]
+        chunks.append((chunk_months, [row for month in chunk_months for row in by_month[month]]))
+    return chunks
+
+
+def prepare_months(conn, months):
+    """写线程每批事务开始前调用（ATTACH / DETACH 不能在事务中执行）：
+    距上次清理超过 prune_interval_seconds 时先删除过期分区，再挂载（必要时创建）本批写入的月份
+    """
+    global _last_prune
+    if _partitions is None:
+        return
+    now = time.monotonic()
+    if _prune_interval and (_last_prune is None or now - _last_prune >= _prune_interval):
+        _last_prune = now
+        dropped = _partitions.prune(conn)
+        if dropped:
+            log.info('已删除过期的实时数据分区', months=','.join(dropped))
+    if months:
+        _partitions.attach(conn, sorted(months), create=True)
+
+
+def save_samples(cursor, rows):
+    """写入样本并刷新受影响的汇总，rows 为 (user_id, record_date, time_stamp, data_type, value)
+
+    按月分区时 rows 涉及的分区需已在事务开始前挂载（写线程通过 prepare_months 挂载）
+    """
+    if _partitions is None:
+        _save_raw(cursor, rows, 'main')
+        refresh_rollups(cursor, rows, 'main')
+        return
+
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(month_of(row[1]), []).append(row)
+    schemas = _partitions.attach(cursor.connection, by_month, create=True)
+    for month, month_rows in by_month.items():
+        _save_raw(cursor, month_rows, schemas[month])
+        refresh_rollups(cursor, month_rows, schemas[month])
+
+
+def _save_raw(cursor, rows, schema):
+    if _storage_mode == 'packed':
+        save_packed_samples(cursor, rows, schema)
+    else:
+        upsert_realtime_samples(cursor, rows, schema)
+
+
+def _packed_row_id(cursor, user_id, record_date, data_type, schema='main'):
+    cursor.execute(f'''
+        INSERT OR IGNORE INTO {schema}.realtime_packed (user_id, record_date, data_type, slots, present)
+        VALUES (?, ?, ?, zeroblob(?), zeroblob(?))
+    ''', (user_id, record_date, data_type, SLOTS_PER_DAY * SLOT_SIZE, BITMAP_SIZE))
+    return cursor.execute(PACKED_ROW_ID_SQL.format(schema=schema), (user_id, record_date, data_type)).fetchone()[0]
+
+
+def save_packed_samples(cursor, rows, schema='main'):
+    """按 (用户, 日期, 类型) 分组，每组只打开一次 BLOB，原地写入槽位并设置存在位"""
+    groups = {}
+    for user_id, record_date, time_stamp, data_type, value in rows:
+        groups.setdefault((user_id, record_date, data_type), []).append(
+            (minute_of_day(time_stamp), value)
+        )
+
+    conn = cursor.connection
+    for (user_id, record_date, data_type), slot_values in groups.items():
+        row_id = _packed_row_id(cursor, user_id, record_date, data_type, schema)
+
+        with conn.blobopen('realtime_packed', 'slots', row_id, name=schema) as blob:
+            for slot, value in slot_values:
+                blob.seek(slot * SLOT_SIZE)
+                blob.write(struct.pack('<f', value))
+
+        with conn.blobopen('realtime_packed', 'present', row_id, name=schema) as bitmap:
+            for slot, _ in slot_values:
+                bitmap.seek(slot // 8)
+                byte = bitmap.read(1)[0]
+                bitmap.seek(slot // 8)
+                bitmap.write(bytes([byte | (1 << (slot % 8))]))
+
+
+def _read_packed_slots(conn, row_id, first_slot=0, last_slot=SLOTS_PER_DAY - 1, schema='main'):
+    """读取 [first_slot, last_slot] 区间内存在的槽位，返回 [(槽位, 数值)]"""
+    with conn.blobopen('realtime_packed', 'present', row_id, readonly=True, name=schema) as bitmap:
+        bitmap.seek(first_slot // 8)
+        bits = bitmap.read(last_slot // 8 - first_slot // 8 + 1)
+
+    base = (first_slot // 8) * 8
+    slots = [
+        base + i * 8 + bit
+        for i, byte in enumerate(bits) if byte
+        for bit in range(8) if byte >> bit & 1
+    ]
+    slots = [slot for slot in slots if first_slot <= slot <= last_slot]
+    if not slots:
+        return []
+
+    with conn.blobopen('realtime_packed', 'slots', row_id, readonly=True, name=schema) as blob:
+        blob.seek(slots[0] * SLOT_SIZE)
+        data = blob.read((slots[-1] - slots[0] + 1) * SLOT_SIZE)
+    return [(slot, struct.unpack_from('<f', data, (slot - slots[0]) * SLOT_SIZE)[0]) for slot in slots]
+
+
+def _hour_stats(conn, cursor, user_id, data_type, record_date, hour, schema='main'):
+    """计算某一小时的 (最小, 平均, 最大, 总和, 条数)"""
+    if _storage_mode == 'packed':
+        row = cursor.execute(PACKED_ROW_ID_SQL.format(schema=schema), (user_id, record_date, data_type)).fetchone()
+        hour_of_day = int(hour[11:13])
+        values = [] if row is None else [
+            value for _, value in _read_packed_slots(conn, row[0], hour_of_day * 60, hour_of_day * 60 + 59, schema)
+        ]
+        if not values:
+            return None, None, None, None, 0
+        return min(values), sum(values) / len(values), max(values), sum(values), len(values)
+
+    return cursor.execute(
+        HOUR_STATS_SQL.format(schema=schema), (user_id, data_type, record_date, f'{hour}:00', f'{hour}:59')
+    ).fetchone()
+
+
+def refresh_rollups(cursor, rows, schema='main'):
+    """重新计算受影响的小时和天汇总，schema 为原始样本所在的数据库，汇总始终写入主库"""
+    hours = {(user_id, data_type, record_date, time_stamp[:13])
+             for user_id, record_date, time_stamp, data_type, _ in rows}
+    days = {(user_id, data_type, record_date) for user_id, data_type, record_date, _ in hours}
+
+    conn = cursor.connection
+    for user_id, data_type, record_date, hour in hours:
+        stats = _hour_stats(conn, cursor, user_id, data_type, record_date, hour, schema)
+        cursor.execute('''
+            INSERT INTO main.realtime_rollup_hourly
+                (user_id, data_type, record_date, bucket, min_value, avg_value, max_value, sum_value, sample_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, data_type, record_date, bucket) DO UPDATE SET
+                min_value = excluded.min_value, avg_value = excluded.avg_value, max_value = excluded.max_value,
+                sum_value = excluded.sum_value, sample_count = excluded.sample_count
+        ''', (user_id, data_type, record_date, f'{hour}:00', *stats))
+
+    for user_id, data_type, record_date in days:
+        refresh_daily_rollup(cursor, user_id, data_type, record_date)
+
+
+def refresh_daily_rollup(cursor, user_id, data_type, record_date):
+    """由当天的小时汇总重新计算天汇总"""
+    cursor.execute('''
+        INSERT INTO main.realtime_rollup_daily
+            (user_id, data_type, record_date, min_value, avg_value, max_value, sum_value, sample_count)
+        SELECT user_id, data_type, record_date, MIN(min_value), SUM(sum_value) / SUM(sample_count),
+               MAX(max_value), SUM(sum_value), SUM(sample_count)
+        FROM main.realtime_rollup_hourly
+        WHERE user_id = ? AND data_type = ? AND record_date = ?
+        GROUP BY user_id, data_type, record_date
+        ON CONFLICT(user_id, data_type, record_date) DO UPDATE SET
+            min_value = excluded.min_value, avg_value = excluded.avg_value, max_value = excluded.max_value,
+            sum_value = excluded.sum_value, sample_count = excluded.sample_count
+    ''', (user_id, data_type, record_date))
+
+
+def choose_resolution(days, requested=None):
+    """未指定或指定 auto 时，选择单个数据类型点数不超过 AUTO_MAX_POINTS 的最细分辨率"""
+    if requested in RESOLUTIONS:
+        return requested
+    if days <= 1:
+        return 'raw'
+    if days * 24 <= AUTO_MAX_POINTS:
+        return 'hour'
+    return 'day'
+
+
+def iter_packed_samples(conn, user_id, start_date, end_date, data_type=None, schema='main'):
+    """从 realtime_packed 按时间倒序解码原始样本，字段与 realtime_data 一致（不含 id / created_at）"""
+    params = [user_id, start_date, end_date]
+    type_clause = ''
+    if data_type:
+        type_clause = TYPE_FILTER
+        params.append(data_type)
+
+    packed_rows = conn.execute(PACKED_RANGE_SQL.format(schema=schema, type_clause=type_clause), params).fetchall()
+
+    # 同一天可能有多个类型，按天解码后合并排序
+    day_rows = []
+    for index, (row_id, record_date, row_type) in enumerate(packed_rows):
+        for slot, value in _read_packed_slots(conn, row_id, schema=schema):
+            day_rows.append({
+                'user_id': user_id,
+                'record_date': record_date,
+                'time_stamp': f'{record_date} {slot // 60:02d}:{slot % 60:02d}',
+                'data_type': row_type,
+                'value': value
+            })
+        if index + 1 == len(packed_rows) or packed_rows[index + 1][1] != record_date:
+            day_rows.sort(key=lambda item: item['time_stamp'], reverse=True)
+            yield from day_rows
+            day_rows = []
+
+
+def _iter_raw(conn, user_id, start_date, end_date, data_type, batch_size, schema):
+    if _storage_mode == 'packed':
+        yield from iter_packed_samples(conn, user_id, start_date, end_date, data_type, schema)
+        return
+
+    params = [user_id, start_date, end_date]
+    type_clause = ''
+    if data_type:
+        type_clause = TYPE_FILTER
+        params.append(data_type)
+    cursor = conn.execute(RAW_RANGE_SQL.format(schema=schema, type_clause=type_clause), params)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        for row in rows:
+            yield dict(row)
+
+
+def iter_samples(conn, user_id, start_date, end_date, data_type=None, resolution='raw', batch_size=500):
+    """按日期范围查询，按时间倒序逐条返回字典（fetchmany 分批读取）
+
+    汇总结果与原始样本字段保持一致：time_stamp 为时间段起点，value 为平均值，
+    另外附带 min_value / max_value / sample_count
+    """
+    if resolution == 'raw':
+        if _partitions is None:
+            yield from _iter_raw(conn, user_id, start_date, end_date, data_type, batch_size, 'main')
+            return
+        # 只查询与范围重叠、且未过期的分区，从最近的月份开始逐个挂载
+        cutoff = _partitions.cutoff_month()
+        for month in reversed(months_between(start_date, end_date)):
+            if cutoff is not None and month < cutoff:
+                break
+            schemas = _partitions.attach(conn, [month])
+            if month in schemas:
+                yield from _iter_raw(conn, user_id, start_date, end_date, data_type, batch_size, schemas[month])
+        return
+
+    params = [user_id, start_date, end_date]
+    type_clause = ''
+    if data_type:
+        type_clause = TYPE_FILTER
+        params.append(data_type)
+
+    sql = HOURLY_RANGE_SQL if resolution == 'hour' else DAILY_RANGE_SQL
+    cursor = conn.execute(sql.format(type_clause=type_clause), params)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        for row in rows:
+            yield dict(row)
+
+
+def query_samples(conn, user_id, start_date, end_date, data_type=None, resolution='raw'):
+    """iter_samples 的列表形式"""
+    return list(iter_samples(conn, user_id, start_date, end_date, data_type, resolution))
+
+
+def pack_existing_rows(conn, batch_size=10000, vacuum=True):
+    """把 realtime_data 中的样本转换到 realtime_packed（切换到 packed 存储前执行一次）
+
+    转换和删除 realtime_data 中的原样本在同一事务中完成；提交后执行 VACUUM 回收空间
+    （需要与数据库大小相当的临时磁盘空间，期间其他连接不能写入）
+    """
+    global _storage_mode
+    previous_mode, _storage_mode = _storage_mode, 'packed'
+    try:
+        cursor = conn.cursor()
+        # 先取得写锁，保证删除的正好是转换过的样本
+        cursor.execute('BEGIN IMMEDIATE')
+        source = conn.execute('''
+            SELECT user_id, record_date, time_stamp, data_type, value FROM realtime_data
+        ''')
+        total = 0
+        while True:
+            rows = source.fetchmany(batch_size)
+            if not rows:
+                break
+            save_packed_samples(cursor, [tuple(row) for row in rows])
+            total += len(rows)
+        cursor.execute('DELETE FROM realtime_data')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        _storage_mode = previous_mode
+    if vacuum and total:
+        conn.execute('VACUUM')
+    return total
+
+
+def split_existing_rows(conn):
+    """把主库中的原始样本（realtime_data / realtime_packed）按月移动到分区（启用分区前执行一次），
+    每个月单独提交。realtime_data 中的样本按当前存储方式写入；汇总表已在主库中，不需要重新计算；
+    过期月份的样本直接删除
+    """
+    if _partitions is None:
+        raise ValueError('未设置 REALTIME_PARTITION_DIR')
+
+    cursor = conn.cursor()
+    months = [row[0] for row in conn.execute('''
+        SELECT SUBSTR(record_date, 1, 7) FROM realtime_data
+        UNION
+        SELECT SUBSTR(record_date, 1, 7) FROM realtime_packed
+    ''').fetchall()]
+    cutoff = _partitions.cutoff_month()
+
+    moved = {}
+    for month in sorted(months):
+        try:
+            month_of(month)
+        except ValueError:
+            continue
+        pattern = month + '-%'
+        if cutoff is None or month >= cutoff:
+            schema = _partitions.attach(conn, [month], create=True)[month]
+            rows = [tuple(row) for row in conn.execute('''
+                SELECT user_id, record_date, time_stamp, data_type, value FROM realtime_data
+                WHERE record_date LIKE ?
+            ''', (pattern,)).fetchall()]
+            _save_raw(cursor, rows, schema)
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO {schema}.realtime_packed (user_id, record_date, data_type, slots, present)
+                SELECT user_id, record_date, data_type, slots, present FROM main.realtime_packed
+                WHERE record_date LIKE ?
+            ''', (pattern,))
+            moved[month] = len(rows) + cursor.rowcount
+        cursor.execute('DELETE FROM main.realtime_data WHERE record_date LIKE ?', (pattern,))
+        cursor.execute('DELETE FROM main.realtime_packed WHERE record_date LIKE ?', (pattern,))
+        conn.commit()
+    return moved
+
+
+def prune_partitions(conn):
+    """删除超出保留期限的分区，返回删除的月份"""
+    if _partitions is None:
+        return []
+    return _partitions.prune(conn)
+
+
+if __name__ == '__main__':
+    import sqlite3
+
+    commands = {'--pack', '--split', '--prune'}
+    command = next((a for a in sys.argv[1:] if a in commands), None)
+    if command is None:
+        raise SystemExit('用法: python realtime_store.py --pack|--split|--prune [数据库路径]')
+    args = [a for a in sys.argv[1:] if a not in commands]
+
+    configure(
+        os.environ.get('REALTIME_STORAGE', 'rows'),
+        partition_dir=os.environ.get('REALTIME_PARTITION_DIR'),
+        retention_months=int(os.environ.get('REALTIME_RETENTION_MONTHS', 0))
+    )
+    db = sqlite3.connect(args[0] if args else 'health_app.db')
+    if command == '--pack':
+        print(f'已转换 {pack_existing_rows(db)} 条样本到 realtime_packed，并从 realtime_data 删除')
+    elif command == '--split':
+        for month, count in split_existing_rows(db).items():
+            print(f'{month}: 已移动 {count} 条记录')
+    else:
+        print(f'已删除过期分区: {prune_partitions(db)}')
+    db.close()
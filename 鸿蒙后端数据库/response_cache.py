@@ -0,0 +1,101 @@
+"""按用户缓存的接口响应
+
+首页 / 健康页每次显示都会请求概览和每周数据，而这些数据大多数时候没有变化。
+这里按 (接口, 用户, 日期, 查询参数) 缓存序列化好的响应体和 ETag，
+写接口提交后调用 bump(user_id) 使该用户的所有缓存失效。
+客户端带 If-None-Match 时，命中缓存且 ETag 一致直接返回 304，不访问数据库。
+
+ETag 由响应内容计算，多进程部署时各进程对相同数据给出相同 ETag；
+版本号只在本进程内递增，其他进程的写入要等缓存过期（ttl_seconds）后才能看到。
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def compute_etag(body):
+    return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, ttl_seconds=30, max_entries=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # 版本号取自全局递增的计数器；只记录有缓存条目的用户（不超过 max_entries 个），
+        # 其他用户的版本号都是 _base，bump 没有缓存的用户时只需提高 _base
+        self._counter = 0
+        self._base = 0
+        self._versions = {}
+        self._counts = {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    @staticmethod
+    def _user_key(user_id):
+        try:
+            return int(user_id)
+        except (TypeError, ValueError):
+            return user_id
+
+    def version(self, user_id):
+        with self._lock:
+            return self._versions.get(self._user_key(user_id), self._base)
+
+    def bump(self, user_id):
+        """用户数据发生变化，之前缓存的响应全部失效"""
+        user_key = self._user_key(user_id)
+        with self._lock:
+            self._counter += 1
+            if user_key in self._versions:
+                self._versions[user_key] = self._counter
+            else:
+                self._base = self._counter
+
+    def _remove(self, key):
+        """删除一个条目；用户没有其他条目时不再单独记录版本号（_base 不小于它，版本号不会回退）"""
+        user_key = self._entries.pop(key)[4]
+        self._counts[user_key] -= 1
+        if not self._counts[user_key]:
+            del self._counts[user_key]
+            self._base = max(self._base, self._versions.pop(user_key))
+
+    def get(self, key, user_id):
+        """返回 (etag, body)，未命中、已过期或版本已变化时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            etag, body, version, expires_at, user_key = entry
+            if version != self._versions.get(user_key, self._base) or expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return etag, body
+
+    def put(self, key, user_id, body, version):
+        """version 为生成响应前读取的版本号，生成期间有写入时不缓存这次结果"""
+        etag = compute_etag(body)
+        user_key = self._user_key(user_id)
+        with self._lock:
+            if version != self._versions.get(user_key, self._base):
+                return etag
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (etag, body, version, time.monotonic() + self.ttl_seconds, user_key)
+            self._counts[user_key] = self._counts.get(user_key, 0) + 1
+            self._versions.setdefault(user_key, version)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return etag
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counts.clear()
+            self._versions.clear()
+            self._base = self._counter
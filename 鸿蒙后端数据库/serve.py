@@ -0,0 +1,113 @@
+"""生产环境启动入口
+
+在 gunicorn 下以多进程 + 多线程方式运行 Flask 应用：
+主进程预加载应用并在 fork 之前执行一次数据库迁移，工作进程处理一定数量的请求后自动重启，
+收到 SIGTERM 时等待进行中的请求完成后再退出。
+
+用法:
+    python serve.py --workers 4 --threads 8 --bind 0.0.0.0:5000
+
+所有参数也可以通过环境变量设置（SERVE_BIND / SERVE_WORKERS / SERVE_THREADS / ...）
+
+线程数与长连接:
+    gthread 工作进程的每个请求占用一个线程直到响应结束。SSE 推送（/api/live/...，最长
+    LIVE_STREAM_MAX_SECONDS 秒）和雷达长轮询（/api/radar-friends/wait，最长 RADAR_WAIT_MAX_SECONDS 秒）
+    在连接期间一直占用线程。应用按 --threads 计算这两类请求共用的名额（long_requests），
+    至少保留一半线程给普通请求：threads=2 时 1 个，8 时 4 个，16 时 8 个；
+    LIVE_MAX_SUBSCRIBERS / RADAR_MAX_WAITERS 只能在此基础上再调低。名额用完时返回 503 + Retry-After。
+    单个进程需要支持的同时在线 SSE 连接数为 N 时，--threads 至少设为 2N；
+    总连接数 ≈ workers × threads / 2。
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    raise SystemExit('缺少 gunicorn，请先执行: pip install gunicorn')
+
+
+def post_fork(server, worker):
+    """工作进程启动后重建进程内资源：丢弃继承的数据库连接，重启日志写线程"""
+    from app import db_pool
+    from log_utils import setup_logging
+
+    db_pool.discard_after_fork()
+    setup_logging()
+
+
+class HealthAppServer(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import app, init_database, get_points_leaderboard, get_availability_index
+
+        # preload_app 时在主进程中执行，所有工作进程 fork 之前只初始化一次数据库并预热进程内索引
+        init_database()
+        with app.app_context():
+            get_points_leaderboard()
+            get_availability_index()
+        return app
+
+
+def parse_args():
+    env = os.environ.get
+    default_workers = multiprocessing.cpu_count()
+
+    parser = argparse.ArgumentParser(description='家庭健康助手后端服务')
+    parser.add_argument('--bind', default=env('SERVE_BIND', '0.0.0.0:5000'),
+                        help='监听地址，默认 0.0.0.0:5000')
+    parser.add_argument('--workers', type=int, default=int(env('SERVE_WORKERS', default_workers)),
+                        help='工作进程数，默认 CPU 核数')
+    parser.add_argument('--threads', type=int, default=int(env('SERVE_THREADS', 8)),
+                        help='每个工作进程的线程数，默认 8')
+    parser.add_argument('--max-requests', type=int, default=int(env('SERVE_MAX_REQUESTS', 10000)),
+                        help='工作进程处理多少个请求后重启，0 表示不重启')
+    parser.add_argument('--max-requests-jitter', type=int, default=int(env('SERVE_MAX_REQUESTS_JITTER', 1000)),
+                        help='重启阈值的随机抖动，避免所有进程同时重启')
+    parser.add_argument('--timeout', type=int, default=int(env('SERVE_TIMEOUT', 60)),
+                        help='请求处理超时（秒）')
+    parser.add_argument('--graceful-timeout', type=int, default=int(env('SERVE_GRACEFUL_TIMEOUT', 30)),
+                        help='优雅退出时等待进行中请求的时间（秒）')
+    parser.add_argument('--keepalive', type=int, default=int(env('SERVE_KEEPALIVE', 5)),
+                        help='HTTP keep-alive 时间（秒）')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # 应用按线程数计算 SSE / 长轮询可以占用的线程（见 long_requests）
+    os.environ['SERVE_THREADS'] = str(args.threads)
+    # 进程内雷达配对只在单个进程内有效，多进程时默认改用数据库配对
+    if args.workers > 1:
+        os.environ.setdefault('RADAR_STORE', 'db')
+        # 实时推送和雷达配对的唤醒通过 Unix 数据报套接字在工作进程之间转发
+        if 'LIVE_BROKER_DIR' not in os.environ:
+            os.environ['LIVE_BROKER_DIR'] = tempfile.mkdtemp(prefix='health-live-')
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'worker_class': 'gthread',
+        'threads': args.threads,
+        'preload_app': True,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests_jitter,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'keepalive': args.keepalive,
+        'post_fork': post_fork,
+        'accesslog': '-' if os.environ.get('SERVE_ACCESS_LOG') == '1' else None,
+    }
+    HealthAppServer(options).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""健康数据周趋势：最近 7 天与之前 7 天的对比
+
+health_trends 表按 (用户, 指标) 保存两个窗口的合计和有效天数，以及窗口的截止日期。
+写入 health_data 的接口在同一事务中调用 refresh_for_write：只有写入日期落在最近 14 天内时，
+才重新聚合该用户这 14 天的数据（按 (user_id, record_date) 索引最多读 14 行）。
+读取时一次按 user_id 的索引查找；日期变化后读取时直接从 health_data 聚合返回（只读），
+由接口把 refresh 交给写线程更新汇总。
+
+0 和默认值视为没有数据，不计入平均值（情绪以 -1 表示未记录）。
+"""
+from datetime import date, timedelta
+
+WINDOW_DAYS = 7
+# 变化幅度达到该百分比时生成文字提示
+INSIGHT_PERCENT = 10
+
+# 指标 -> (名称, 单位, 有效值条件)
+TREND_METRICS = {
+    'steps': ('步数', '步', '> 0'),
+    'distance': ('距离', '', '> 0'),
+    'active_calories': ('活动消耗', '千卡', '> 0'),
+    'sleep_duration': ('睡眠时长', '分钟', '> 0'),
+    'deep_sleep_duration': ('深睡时长', '分钟', '> 0'),
+    'sleep_score': ('睡眠分数', '分', '> 0'),
+    'resting_heart_rate': ('静息心率', '次/分', '> 0'),
+    'avg_heart_rate': ('平均心率', '次/分', '> 0'),
+    'avg_blood_oxygen': ('平均血氧', '%', '> 0'),
+    'current_mood': ('心情', '', '>= 0'),
+}
+
+
+def _aggregate_sql():
+    columns = []
+    for metric, (_, _, condition) in TREND_METRICS.items():
+        value = f'CAST({metric} AS REAL)'
+        columns.append(f'SUM(CASE WHEN {value} {condition} THEN {value} END)')
+        columns.append(f'COUNT(CASE WHEN {value} {condition} THEN 1 END)')
+    return f'''
+        SELECT record_date >= ? AS is_current, {', '.join(columns)}
+        FROM health_data
+        WHERE user_id = ? AND record_date BETWEEN ? AND ?
+        GROUP BY is_current
+    '''
+
+
+AGGREGATE_SQL = _aggregate_sql()
+LOAD_SQL = 'SELECT * FROM health_trends WHERE user_id = ?'
+
+
+def window_bounds(today=None):
+    """返回 (之前窗口开始, 最近窗口开始, 截止日期)，均为 YYYY-MM-DD"""
+    today = today or date.today()
+    return (
+        (today - timedelta(days=2 * WINDOW_DAYS - 1)).isoformat(),
+        (today - timedelta(days=WINDOW_DAYS - 1)).isoformat(),
+        today.isoformat()
+    )
+
+
+def aggregate(conn, user_id, today=None):
+    """聚合该用户最近两个窗口的数据，返回与 health_trends 字段相同的行（字典列表），只读"""
+    previous_start, current_start, end = window_bounds(today)
+    totals = {True: [None, 0] * len(TREND_METRICS), False: [None, 0] * len(TREND_METRICS)}
+    for row in conn.execute(AGGREGATE_SQL, (current_start, user_id, previous_start, end)).fetchall():
+        totals[bool(row[0])] = list(row[1:])
+
+    rows = []
+    for i, metric in enumerate(TREND_METRICS):
+        rows.append({
+            'user_id': user_id,
+            'metric': metric,
+            'window_end': end,
+            'current_sum': totals[True][2 * i],
+            'current_days': totals[True][2 * i + 1],
+            'previous_sum': totals[False][2 * i],
+            'previous_days': totals[False][2 * i + 1]
+        })
+    return rows
+
+
+def refresh(cursor, user_id, today=None):
+    """重新聚合该用户最近两个窗口的数据并写入 health_trends"""
+    cursor.executemany('''
+        INSERT INTO health_trends
+            (user_id, metric, window_end, current_sum, current_days, previous_sum, previous_days, updated_at)
+        VALUES (:user_id, :metric, :window_end, :current_sum, :current_days, :previous_sum, :previous_days,
+                CURRENT_TIMESTAMP)
+        ON CONFLICT(user_id, metric) DO UPDATE SET
+            window_end = excluded.window_end,
+            current_sum = excluded.current_sum,
+            current_days = excluded.current_days,
+            previous_sum = excluded.previous_sum,
+            previous_days = excluded.previous_days,
+            updated_at = CURRENT_TIMESTAMP
+    ''', aggregate(cursor.connection, user_id, today))
+
+
+def refresh_for_write(cursor, user_id, record_date, today=None):
+    """health_data 写入后调用，写入日期不在最近两个窗口内时不需要更新"""
+    previous_start, _, end = window_bounds(today)
+    if previous_start <= str(record_date) <= end:
+        refresh(cursor, user_id, today)
+
+
+def load(conn, user_id, today=None):
+    """返回 ({指标: 行}, 汇总是否需要刷新)
+
+    汇总不存在或已过期（日期已变化）时直接聚合返回，不写数据库，由调用方提交 refresh
+    """
+    end = window_bounds(today)[2]
+    rows = conn.execute(LOAD_SQL, (user_id,)).fetchall()
+    stale = len(rows) < len(TREND_METRICS) or any(row['window_end'] != end for row in rows)
+    if stale:
+        rows = aggregate(conn, user_id, today)
+    return {row['metric']: row for row in rows if row['metric'] in TREND_METRICS}, stale
+
+
+def _average(total, days):
+    return round(total / days, 1) if days else None
+
+
+def describe(metric, row):
+    label, unit, _ = TREND_METRICS[metric]
+    current = _average(row['current_sum'], row['current_days'])
+    previous = _average(row['previous_sum'], row['previous_days'])
+    delta = percent = None
+    if current is not None and previous is not None:
+        delta = round(current - previous, 1)
+        percent = round(delta / previous * 100, 1) if previous else None
+    return {
+        'label': label,
+        'unit': unit,
+        'current_avg': current,
+        'previous_avg': previous,
+        'current_days': row['current_days'],
+        'previous_days': row['previous_days'],
+        'delta': delta,
+        'percent_change': percent
+    }
+
+
+def insight(trend):
+    """变化明显时返回一句提示，例如「步数比上周增加1200步（+15%）」"""
+    percent = trend['percent_change']
+    if percent is None or abs(percent) < INSIGHT_PERCENT:
+        return None
+    direction = '增加' if trend['delta'] > 0 else '减少'
+    return f"{trend['label']}比上周{direction}{abs(trend['delta']):g}{trend['unit']}（{percent:+g}%）"